@@ -0,0 +1 @@
+"""Offline benchmarks for the bot. Run them with ``python -m benchmarks``."""
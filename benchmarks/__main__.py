@@ -0,0 +1,105 @@
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+import discord
+
+from .runner import SCENARIOS, compare, run_scenario
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmarks the message -> command hot path offline.",
+    )
+    parser.add_argument(
+        "scenarios", nargs="*", choices=[[], *SCENARIOS], metavar="scenario",
+        help=f"Scenarios to run (default: all). Choices: {', '.join(SCENARIOS)}.",
+    )
+    parser.add_argument("-n", "--messages", type=int, default=5000, help="Measured messages per scenario.")
+    parser.add_argument("--warmup", type=int, default=200, help="Unmeasured messages sent first.")
+    parser.add_argument("--rate", type=float, default=None, help="Send at this many messages/s instead of back to back.")
+    parser.add_argument("-o", "--output", default=None, help="Where to write the results (default: cache/benchmarks/<commit>.json).")
+    parser.add_argument("--compare", default=None, metavar="BASELINE", help="A previous results file to compare against.")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent (default: 10).")
+    return parser.parse_args()
+
+
+async def _run(args: argparse.Namespace) -> dict:
+    results = {}
+    for name in args.scenarios or SCENARIOS:
+        result = await run_scenario(SCENARIOS[name], messages=args.messages, warmup=args.warmup, rate=args.rate)
+        latency = result.latency_ms
+        print(
+            f"{name:<14} {result.throughput:>10.0f} msg/s   p50 {latency['p50']:.3f} ms   "
+            f"p90 {latency['p90']:.3f} ms   p99 {latency['p99']:.3f} ms   max {latency['max']:.3f} ms"
+        )
+        results[name] = result.to_dict()
+    return results
+
+
+def main() -> int:
+    args = _parse_args()
+    logging.disable(logging.CRITICAL)
+    root = os.getcwd()
+    revision = _git_revision()
+    output = os.path.abspath(args.output or os.path.join("cache", "benchmarks", f"{revision}.json"))
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+
+    # the error handler writes to logs/error.log, so run somewhere that won't touch the real logs
+    with tempfile.TemporaryDirectory() as workdir:
+        os.makedirs(os.path.join(workdir, "logs"))
+        os.chdir(workdir)
+        try:
+            results = asyncio.run(_run(args))
+        finally:
+            os.chdir(root)
+
+    report = {
+        "meta": {
+            "revision": revision,
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "discord.py": discord.__version__,
+            "platform": platform.platform(),
+            "messages": args.messages,
+            "warmup": args.warmup,
+            "rate": args.rate,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if baseline_path is None:
+        return 0
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    lines, regressed = compare(baseline, report, threshold=args.threshold)
+    print(f"\nCompared with {baseline['meta']['revision']}:")
+    if baseline["meta"].get("rate") != args.rate:
+        print("Warning: the baseline was recorded with a different --rate, so latencies aren't comparable.")
+    print("\n".join(lines))
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,932 @@
+"""
+A self-contained fake Discord gateway and REST API for end-to-end load tests.
+
+It speaks enough of both protocols for the real bot to connect, identify, resume, receive a steady
+stream of messages and interactions, and send, edit and delete messages, including emulated
+rate-limit headers and 429 responses. Point the bot at it through the ``api`` section of
+``config.yml``::
+
+    api:
+      base-url: http://127.0.0.1:8765
+      gateway-url: ws://127.0.0.1:8765/
+
+and start it with::
+
+    python -m benchmarks.fake_discord --guilds 2500 --message-rate 200
+
+``GET /_fake/stats`` returns what the server has seen so far.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import secrets
+import time
+import zlib
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from aiohttp import WSMsgType, web
+
+try:
+    import zstandard
+except ImportError:  # zstd-stream is only offered when the client has it too
+    zstandard = None
+
+DISCORD_EPOCH = 1420070400000
+API_PREFIX = "/api/v{version}"
+ALL_PERMISSIONS = str((1 << 53) - 1)
+
+_log = logging.getLogger("fake-discord")
+
+
+@dataclass
+class FakeDiscordConfig:
+    host: str = "127.0.0.1"
+    port: int = 8765
+    token: Optional[str] = None  # any token is accepted when this is None
+    guilds: int = 100
+    channels_per_guild: int = 3
+    members_per_guild: int = 25
+    users: int = 10_000
+    shards: int = 1  # the shard count recommended by GET /gateway/bot
+    heartbeat_interval: float = 41.25
+    message_rate: float = 0.0  # MESSAGE_CREATEs per second, spread across all sessions
+    command_ratio: float = 0.1
+    prefix: str = "!"
+    commands: tuple[str, ...] = ("help", "ping")
+    interaction_rate: float = 0.0  # INTERACTION_CREATEs per second for registered global commands
+    reconnect_every: Optional[float] = None  # send a RECONNECT to a random session this often
+    route_limit: int = 5  # requests per bucket per window
+    route_window: float = 5.0
+    global_limit: int = 50  # requests per second across all routes
+    resume_buffer: int = 1000  # dispatches kept per session for RESUME
+    seed: int = 0
+
+
+@dataclass
+class Stats:
+    identifies: int = 0
+    resumes: int = 0
+    failed_resumes: int = 0
+    reconnects_requested: int = 0
+    dispatched: Counter = field(default_factory=Counter)
+    requests: Counter = field(default_factory=Counter)
+    rate_limited: Counter = field(default_factory=Counter)
+    unhandled: Counter = field(default_factory=Counter)
+
+    def to_dict(self) -> dict:
+        return {
+            "identifies": self.identifies,
+            "resumes": self.resumes,
+            "failed_resumes": self.failed_resumes,
+            "reconnects_requested": self.reconnects_requested,
+            "dispatched": dict(self.dispatched),
+            "requests": dict(self.requests),
+            "rate_limited": dict(self.rate_limited),
+            "unhandled": dict(self.unhandled),
+        }
+
+
+class Snowflakes:
+    def __init__(self):
+        self._increment = 0
+
+    def next(self) -> str:
+        self._increment = (self._increment + 1) & 0xFFF
+        return str((int(time.time() * 1000) - DISCORD_EPOCH) << 22 | self._increment)
+
+
+def json_response(data: Any, *, status: int = 200, headers: Optional[dict[str, str]] = None) -> web.Response:
+    # discord.py only decodes bodies whose content type is exactly application/json, without a charset
+    body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    return web.Response(body=body, status=status, headers=headers, content_type="application/json")
+
+
+def _now_iso() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime())
+
+
+class World:
+    """The guilds, channels, users and messages the fake API serves."""
+
+    def __init__(self, config: FakeDiscordConfig):
+        self.config = config
+        self.snowflakes = Snowflakes()
+        rng = random.Random(config.seed)
+        self.rng = rng
+        now = int(time.time() * 1000) - DISCORD_EPOCH
+
+        def old_snowflake() -> str:
+            # spread creation times over ~5 years so guilds land on every shard
+            return str((now - rng.randint(0, 5 * 365 * 86400 * 1000)) << 22 | rng.getrandbits(22))
+
+        self.application_id: str = old_snowflake()
+        self.bot_user: dict[str, Any] = self._user(self.application_id, "FakeBot", bot=True)
+        self.users: list[dict[str, Any]] = [
+            self._user(old_snowflake(), f"user{i}") for i in range(config.users)
+        ]
+        self.guilds: dict[str, dict[str, Any]] = {}
+        self.channels: dict[str, dict[str, Any]] = {}
+        self.messages: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self.commands: dict[Optional[str], list[dict[str, Any]]] = {}
+        for i in range(config.guilds):
+            self._add_guild(old_snowflake(), f"Guild {i}")
+
+    @staticmethod
+    def _user(user_id: str, name: str, *, bot: bool = False) -> dict[str, Any]:
+        return {
+            "id": user_id,
+            "username": name,
+            "discriminator": "0",
+            "global_name": None,
+            "avatar": None,
+            "bot": bot,
+        }
+
+    @staticmethod
+    def member(user: dict[str, Any]) -> dict[str, Any]:
+        return {
+            "user": user,
+            "roles": [],
+            "joined_at": "2023-09-14T00:00:00+00:00",
+            "deaf": False,
+            "mute": False,
+            "flags": 0,
+        }
+
+    def _add_guild(self, guild_id: str, name: str) -> None:
+        rng, config = self.rng, self.config
+        members = [self.bot_user] + rng.sample(self.users, min(config.members_per_guild, len(self.users)))
+        channels = []
+        for position in range(config.channels_per_guild):
+            channel = {
+                "id": str(int(guild_id) + position + 1),
+                "type": 0,
+                "name": f"channel-{position}",
+                "position": position,
+                "permission_overwrites": [],
+                "guild_id": guild_id,
+            }
+            channels.append(channel)
+            self.channels[channel["id"]] = channel
+        self.guilds[guild_id] = {
+            "id": guild_id,
+            "name": name,
+            "owner_id": members[-1]["id"],
+            "roles": [
+                {
+                    "id": guild_id,
+                    "name": "@everyone",
+                    "permissions": ALL_PERMISSIONS,
+                    "position": 0,
+                    "color": 0,
+                    "hoist": False,
+                    "managed": False,
+                    "mentionable": False,
+                }
+            ],
+            "channels": channels,
+            "members": [self.member(user) for user in members],
+            "member_count": len(members),
+            "emojis": [],
+            "stickers": [],
+            "features": [],
+            "verification_level": 0,
+            "default_message_notifications": 0,
+            "explicit_content_filter": 0,
+            "mfa_level": 0,
+            "premium_tier": 0,
+            "nsfw_level": 0,
+            "large": len(members) > 250,
+            "unavailable": False,
+            "joined_at": "2023-09-14T00:00:00+00:00",
+            "threads": [],
+            "stage_instances": [],
+            "guild_scheduled_events": [],
+            "voice_states": [],
+            "presences": [],
+        }
+
+    def guilds_for_shard(self, shard_id: int, shard_count: int) -> list[dict[str, Any]]:
+        return [g for g in self.guilds.values() if (int(g["id"]) >> 22) % shard_count == shard_id]
+
+    def store_message(self, message: dict[str, Any]) -> None:
+        self.messages[message["id"]] = message
+        while len(self.messages) > 10_000:
+            self.messages.popitem(last=False)
+
+    def message(
+        self,
+        channel_id: str,
+        author: dict[str, Any],
+        body: dict[str, Any],
+        *,
+        guild_id: Optional[str] = None,
+    ) -> dict[str, Any]:
+        message = {
+            "id": self.snowflakes.next(),
+            "channel_id": channel_id,
+            "author": author,
+            "content": body.get("content") or "",
+            "timestamp": _now_iso(),
+            "edited_timestamp": None,
+            "tts": bool(body.get("tts")),
+            "mention_everyone": False,
+            "mentions": [],
+            "mention_roles": [],
+            "attachments": [],
+            "embeds": body.get("embeds") or [],
+            "components": body.get("components") or [],
+            "pinned": False,
+            "type": 0,
+            "flags": body.get("flags") or 0,
+        }
+        if guild_id is not None:
+            message["guild_id"] = guild_id
+            message["member"] = {k: v for k, v in self.member(author).items() if k != "user"}
+        return message
+
+
+class Compressor:
+    """Compresses gateway messages the way the client asked for in the ``compress`` query parameter."""
+
+    def __init__(self, kind: Optional[str]):
+        self.kind: Optional[str] = None
+        if kind == "zlib-stream":
+            self.kind = kind
+            self._zlib = zlib.compressobj()
+        elif kind == "zstd-stream" and zstandard is not None:
+            self.kind = kind
+            self._zstd = zstandard.ZstdCompressor().compressobj()
+
+    def compress(self, text: str) -> Optional[bytes]:
+        data = text.encode("utf-8")
+        if self.kind == "zlib-stream":
+            return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+        if self.kind == "zstd-stream":
+            return self._zstd.compress(data) + self._zstd.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return None  # sent as plain text, which discord.py also accepts
+
+
+class Connection:
+    def __init__(self, ws: web.WebSocketResponse, compressor: Compressor):
+        self.ws = ws
+        self.compressor = compressor
+        self._lock = asyncio.Lock()
+
+    async def send(self, payload: dict[str, Any]) -> None:
+        text = json.dumps(payload, separators=(",", ":"))
+        async with self._lock:  # compressed streams must be sent in the order they were compressed
+            data = self.compressor.compress(text)
+            if self.ws.closed:
+                return
+            try:
+                if data is None:
+                    await self.ws.send_str(text)
+                else:
+                    await self.ws.send_bytes(data)
+            except ConnectionError:
+                pass  # the dispatch stays in the session's buffer, so a RESUME still delivers it
+
+
+class Session:
+    def __init__(self, session_id: str, token: str, shard: tuple[int, int], buffer_size: int):
+        self.id = session_id
+        self.token = token
+        self.shard_id, self.shard_count = shard
+        self.sequence = 0
+        self.connection: Optional[Connection] = None
+        self.buffer: deque[dict[str, Any]] = deque(maxlen=buffer_size)
+        self.guild_ids: list[str] = []
+
+    async def dispatch(self, event: str, data: dict[str, Any], stats: Stats) -> None:
+        self.sequence += 1
+        payload = {"op": 0, "t": event, "s": self.sequence, "d": data}
+        self.buffer.append(payload)
+        stats.dispatched[event] += 1
+        if self.connection is not None:
+            await self.connection.send(payload)
+
+
+class RateLimiter:
+    """Emulates Discord's per-route buckets and the global limit, including the response headers."""
+
+    def __init__(self, config: FakeDiscordConfig, stats: Stats):
+        self.config = config
+        self.stats = stats
+        self._buckets: dict[str, list[float]] = {}  # key -> [remaining, reset_at]
+        self._global_window: int = 0
+        self._global_count: int = 0
+
+    @staticmethod
+    def _bucket_key(request: web.Request) -> tuple[str, str]:
+        resource = request.match_info.route.resource
+        template = resource.canonical if resource is not None else request.path
+        major = ":".join(
+            request.match_info[k]
+            for k in ("channel_id", "guild_id", "webhook_id", "interaction_id", "token")
+            if k in request.match_info
+        )
+        route = f"{request.method} {template}"
+        return route, f"{route}:{major}"
+
+    def _too_many(self, retry_after: float, bucket: str, is_global: bool) -> web.Response:
+        headers = {
+            "Retry-After": str(max(1, int(retry_after + 0.999))),
+            "X-RateLimit-Scope": "global" if is_global else "user",
+            "Via": "1.1 google",
+        }
+        if is_global:
+            headers["X-RateLimit-Global"] = "true"
+        else:
+            headers.update(
+                {
+                    "X-RateLimit-Limit": str(self.config.route_limit),
+                    "X-RateLimit-Remaining": "0",
+                    "X-RateLimit-Reset-After": f"{retry_after:.3f}",
+                    "X-RateLimit-Reset": f"{time.time() + retry_after:.3f}",
+                    "X-RateLimit-Bucket": bucket,
+                }
+            )
+        body = {"message": "You are being rate limited.", "retry_after": round(retry_after, 3), "global": is_global}
+        return json_response(body, status=429, headers=headers)
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler) -> web.StreamResponse:
+        if not request.path.startswith("/api/"):
+            return await handler(request)
+
+        route, key = self._bucket_key(request)
+        self.stats.requests[route] += 1
+        now = time.monotonic()
+        bucket = f"{abs(hash(route)):x}"
+
+        # interaction callbacks aren't subject to the global limit
+        if not request.path.rstrip("/").endswith("/callback"):
+            window = int(now)
+            if window != self._global_window:
+                self._global_window, self._global_count = window, 0
+            self._global_count += 1
+            if self._global_count > self.config.global_limit:
+                self.stats.rate_limited["global"] += 1
+                return self._too_many(window + 1 - now, bucket, True)
+
+        state = self._buckets.get(key)
+        if state is None or now >= state[1]:
+            state = self._buckets[key] = [self.config.route_limit, now + self.config.route_window]
+        if state[0] <= 0:
+            self.stats.rate_limited[route] += 1
+            return self._too_many(state[1] - now, bucket, False)
+        state[0] -= 1
+
+        response = await handler(request)
+        response.headers.update(
+            {
+                "X-RateLimit-Limit": str(self.config.route_limit),
+                "X-RateLimit-Remaining": str(int(state[0])),
+                "X-RateLimit-Reset-After": f"{state[1] - now:.3f}",
+                "X-RateLimit-Reset": f"{time.time() + state[1] - now:.3f}",
+                "X-RateLimit-Bucket": bucket,
+                "Via": "1.1 google",
+            }
+        )
+        return response
+
+
+class FakeDiscord:
+    """
+    The fake Discord service: an aiohttp application serving the gateway on ``/`` and the REST API
+    under ``/api/v{version}``.
+    """
+
+    def __init__(self, config: FakeDiscordConfig):
+        self.config = config
+        self.world = World(config)
+        self.stats = Stats()
+        self.sessions: dict[str, Session] = {}
+        self.limiter = RateLimiter(config, self.stats)
+        self._interaction_tokens: dict[str, dict[str, Any]] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._runner: Optional[web.AppRunner] = None
+        self.app = self._build_app()
+
+    # ----- setup -----
+
+    def _build_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.limiter.middleware], client_max_size=25 * 1024 * 1024)
+        api = API_PREFIX
+        app.router.add_get("/", self.gateway)
+        app.router.add_get("/_fake/stats", self.get_stats)
+        app.router.add_get(f"{api}/gateway", self.get_gateway)
+        app.router.add_get(f"{api}/gateway/bot", self.get_gateway_bot)
+        app.router.add_get(f"{api}/users/@me", self.get_me)
+        app.router.add_get(f"{api}/oauth2/applications/@me", self.get_application)
+        app.router.add_get(f"{api}/applications/@me", self.get_application)
+        app.router.add_get(f"{api}/channels/{{channel_id}}", self.get_channel)
+        app.router.add_post(f"{api}/channels/{{channel_id}}/messages", self.create_message)
+        app.router.add_get(f"{api}/channels/{{channel_id}}/messages/{{message_id}}", self.get_message)
+        app.router.add_patch(f"{api}/channels/{{channel_id}}/messages/{{message_id}}", self.edit_message)
+        app.router.add_delete(f"{api}/channels/{{channel_id}}/messages/{{message_id}}", self.delete_message)
+        app.router.add_post(f"{api}/interactions/{{interaction_id}}/{{token}}/callback", self.interaction_callback)
+        app.router.add_post(f"{api}/webhooks/{{webhook_id}}/{{token}}", self.create_followup)
+        app.router.add_route(
+            "*", f"{api}/webhooks/{{webhook_id}}/{{token}}/messages/{{message_id}}", self.webhook_message
+        )
+        app.router.add_get(f"{api}/applications/{{application_id}}/commands", self.get_commands)
+        app.router.add_put(f"{api}/applications/{{application_id}}/commands", self.put_commands)
+        app.router.add_get(
+            f"{api}/applications/{{application_id}}/guilds/{{guild_id}}/commands", self.get_commands
+        )
+        app.router.add_put(
+            f"{api}/applications/{{application_id}}/guilds/{{guild_id}}/commands", self.put_commands
+        )
+        app.router.add_route("*", f"{api}/{{tail:.*}}", self.fallback)
+        return app
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.config.host, self.config.port).start()
+        if self.config.message_rate > 0:
+            self._tasks.append(asyncio.create_task(self._generate(self.config.message_rate, self._send_message)))
+        if self.config.interaction_rate > 0:
+            self._tasks.append(
+                asyncio.create_task(self._generate(self.config.interaction_rate, self._send_interaction))
+            )
+        if self.config.reconnect_every:
+            self._tasks.append(asyncio.create_task(self._request_reconnects(self.config.reconnect_every)))
+        _log.info(
+            f"Fake Discord listening on http://{self.config.host}:{self.config.port} "
+            f"with {len(self.world.guilds)} guilds."
+        )
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.config.host}:{self.config.port}"
+
+    @property
+    def gateway_url(self) -> str:
+        return f"ws://{self.config.host}:{self.config.port}/"
+
+    # ----- gateway -----
+
+    async def gateway(self, request: web.Request) -> web.StreamResponse:
+        ws = web.WebSocketResponse(max_msg_size=0, heartbeat=None)
+        await ws.prepare(request)
+        connection = Connection(ws, Compressor(request.query.get("compress")))
+        await connection.send({"op": 10, "d": {"heartbeat_interval": int(self.config.heartbeat_interval * 1000)}})
+
+        session: Optional[Session] = None
+        async for msg in ws:
+            if msg.type is not WSMsgType.TEXT:
+                continue
+            payload = json.loads(msg.data)
+            op, data = payload.get("op"), payload.get("d")
+            if op == 1:
+                await connection.send({"op": 11})
+            elif op == 2:
+                session = await self._identify(connection, data)
+                if session is None:
+                    break
+            elif op == 6:
+                session = await self._resume(connection, data)
+            elif op == 8 and session is not None:
+                await self._request_members(session, data)
+
+        if session is not None and session.connection is connection:
+            session.connection = None
+        return ws
+
+    def _valid_token(self, token: Optional[str]) -> bool:
+        return self.config.token is None or token == self.config.token
+
+    async def _identify(self, connection: Connection, data: dict[str, Any]) -> Optional[Session]:
+        if not self._valid_token(data.get("token")):
+            await connection.ws.close(code=4004, message=b"Authentication failed.")
+            return None
+        shard = tuple(data.get("shard") or (0, 1))
+        session = Session(secrets.token_hex(16), data["token"], shard, self.config.resume_buffer)
+        session.connection = connection
+        self.sessions[session.id] = session
+        self.stats.identifies += 1
+
+        guilds = self.world.guilds_for_shard(session.shard_id, session.shard_count)
+        ready = {
+            "v": 10,
+            "user": self.world.bot_user,
+            "guilds": [{"id": g["id"], "unavailable": True} for g in guilds],
+            "session_id": session.id,
+            "resume_gateway_url": self.gateway_url,
+            "shard": list(shard),
+            "application": {"id": self.world.application_id, "flags": 0},
+            "private_channels": [],
+            "relationships": [],
+        }
+        await session.dispatch("READY", ready, self.stats)
+        for i, guild in enumerate(guilds):
+            await session.dispatch("GUILD_CREATE", guild, self.stats)
+            session.guild_ids.append(guild["id"])  # only generate traffic in guilds the client has seen
+            if i % 100 == 99:
+                await asyncio.sleep(0)  # keep heartbeats and other sessions going during big READYs
+        return session
+
+    async def _resume(self, connection: Connection, data: dict[str, Any]) -> Optional[Session]:
+        session = self.sessions.get(data.get("session_id"))
+        seq = data.get("seq") or 0
+        if (
+            session is None
+            or session.token != data.get("token")
+            or (session.buffer and seq < session.buffer[0]["s"] - 1)
+        ):
+            self.stats.failed_resumes += 1
+            await connection.send({"op": 9, "d": False})
+            return None
+
+        self.stats.resumes += 1
+        # replay until caught up, then attach without yielding, so nothing is missed or reordered
+        while True:
+            missed = [payload for payload in session.buffer if payload["s"] > seq]
+            if not missed:
+                break
+            for payload in missed:
+                await connection.send(payload)
+                seq = payload["s"]
+        session.connection = connection
+        await session.dispatch("RESUMED", {}, self.stats)
+        return session
+
+    async def _request_members(self, session: Session, data: dict[str, Any]) -> None:
+        guild_ids = data.get("guild_id")
+        for guild_id in guild_ids if isinstance(guild_ids, list) else [guild_ids]:
+            guild = self.world.guilds.get(str(guild_id))
+            if guild is None:
+                continue
+            members = guild["members"]
+            query = (data.get("query") or "").lower()
+            if query:
+                members = [m for m in members if m["user"]["username"].lower().startswith(query)]
+            if data.get("limit"):
+                members = members[: data["limit"]]
+            chunk = {
+                "guild_id": guild["id"],
+                "members": members,
+                "chunk_index": 0,
+                "chunk_count": 1,
+                "nonce": data.get("nonce"),
+            }
+            await session.dispatch("GUILD_MEMBERS_CHUNK", chunk, self.stats)
+
+    async def dispatch_to_guild(self, guild_id: Optional[str], event: str, data: dict[str, Any]) -> None:
+        for session in list(self.sessions.values()):
+            if guild_id is None or (int(guild_id) >> 22) % session.shard_count == session.shard_id:
+                await session.dispatch(event, data, self.stats)
+
+    # ----- traffic -----
+
+    def _live_sessions(self) -> list[Session]:
+        return [s for s in self.sessions.values() if s.connection is not None and s.guild_ids]
+
+    async def _generate(self, rate: float, emit) -> None:
+        """Calls ``emit`` ``rate`` times per second, in 10ms batches."""
+        interval, owed = 0.01, 0.0
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            owed += (now - last) * rate
+            last = now
+            sessions = self._live_sessions()
+            if not sessions:
+                owed = 0.0
+                continue
+            while owed >= 1:
+                owed -= 1
+                await emit(self.world.rng.choice(sessions))
+
+    def _random_context(self, session: Session) -> tuple[dict, dict, dict]:
+        rng = self.world.rng
+        guild = self.world.guilds[rng.choice(session.guild_ids)]
+        channel = rng.choice(guild["channels"])
+        member = rng.choice(guild["members"][1:] or guild["members"])
+        return guild, channel, member
+
+    async def _send_message(self, session: Session) -> None:
+        rng = self.world.rng
+        guild, channel, member = self._random_context(session)
+        if rng.random() < self.config.command_ratio:
+            content = self.config.prefix + rng.choice(self.config.commands)
+        else:
+            content = " ".join(rng.choice(("hello", "how", "are", "you", "lol", "ok", "nice")) for _ in range(5))
+        message = self.world.message(channel["id"], member["user"], {"content": content}, guild_id=guild["id"])
+        self.world.store_message(message)
+        await session.dispatch("MESSAGE_CREATE", message, self.stats)
+
+    async def _send_interaction(self, session: Session) -> None:
+        commands = self.world.commands.get(None)
+        if not commands:
+            return
+        command = self.world.rng.choice(commands)
+        guild, channel, member = self._random_context(session)
+        token = secrets.token_urlsafe(24)
+        interaction = {
+            "id": self.world.snowflakes.next(),
+            "application_id": self.world.application_id,
+            "type": 2,
+            "data": {"id": command["id"], "name": command["name"], "type": command.get("type", 1), "options": []},
+            "guild_id": guild["id"],
+            "channel_id": channel["id"],
+            "channel": {"id": channel["id"], "type": 0, "guild_id": guild["id"], "name": channel["name"]},
+            "member": {**member, "permissions": ALL_PERMISSIONS},
+            "token": token,
+            "version": 1,
+            "app_permissions": ALL_PERMISSIONS,
+            "locale": "en-US",
+            "guild_locale": "en-US",
+            "entitlements": [],
+            "attachment_size_limit": 10 * 1024 * 1024,
+            "authorizing_integration_owners": {"0": guild["id"]},
+            "context": 0,
+        }
+        self._interaction_tokens[token] = {"interaction": interaction, "original": None}
+        if len(self._interaction_tokens) > 10_000:
+            self._interaction_tokens.pop(next(iter(self._interaction_tokens)))
+        await session.dispatch("INTERACTION_CREATE", interaction, self.stats)
+
+    async def _request_reconnects(self, every: float) -> None:
+        while True:
+            await asyncio.sleep(every)
+            sessions = self._live_sessions()
+            if sessions:
+                session = self.world.rng.choice(sessions)
+                self.stats.reconnects_requested += 1
+                await session.connection.send({"op": 7, "d": None})
+
+    # ----- REST -----
+
+    @staticmethod
+    async def _body(request: web.Request) -> dict[str, Any]:
+        if request.content_type.startswith("multipart/"):
+            reader = await request.multipart()
+            async for part in reader:
+                if part.name == "payload_json":
+                    return json.loads(await part.text())
+            return {}
+        if not request.can_read_body:
+            return {}
+        return await request.json()
+
+    def _authorized(self, request: web.Request) -> bool:
+        header = request.headers.get("Authorization", "")
+        return self._valid_token(header.removeprefix("Bot ") or None)
+
+    def _unauthorized(self) -> web.Response:
+        return json_response({"message": "401: Unauthorized", "code": 0}, status=401)
+
+    @staticmethod
+    def _not_found(what: str, code: int) -> web.Response:
+        return json_response({"message": f"Unknown {what}", "code": code}, status=404)
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return json_response(
+            {
+                **self.stats.to_dict(),
+                "sessions": len(self.sessions),
+                "connected": len([s for s in self.sessions.values() if s.connection is not None]),
+                "messages": len(self.world.messages),
+            }
+        )
+
+    async def get_gateway(self, request: web.Request) -> web.Response:
+        return json_response({"url": self.gateway_url})
+
+    async def get_gateway_bot(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return self._unauthorized()
+        return json_response(
+            {
+                "url": self.gateway_url,
+                "shards": self.config.shards,
+                "session_start_limit": {
+                    "total": 1000,
+                    "remaining": 1000 - self.stats.identifies,
+                    "reset_after": 86_400_000,
+                    "max_concurrency": 1,
+                },
+            }
+        )
+
+    async def get_me(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return self._unauthorized()
+        return json_response(self.world.bot_user)
+
+    async def get_application(self, request: web.Request) -> web.Response:
+        return json_response(
+            {
+                "id": self.world.application_id,
+                "name": "FakeBot",
+                "icon": None,
+                "description": "",
+                "bot_public": True,
+                "bot_require_code_grant": False,
+                "verify_key": "0" * 64,
+                "flags": 0,
+                "owner": self.world.users[0] if self.world.users else self.world.bot_user,
+                "team": None,
+                "summary": "",
+                "rpc_origins": [],
+                "interactions_endpoint_url": None,
+            }
+        )
+
+    async def get_channel(self, request: web.Request) -> web.Response:
+        channel = self.world.channels.get(request.match_info["channel_id"])
+        return json_response(channel) if channel else self._not_found("Channel", 10003)
+
+    async def create_message(self, request: web.Request) -> web.Response:
+        channel = self.world.channels.get(request.match_info["channel_id"])
+        if channel is None:
+            return self._not_found("Channel", 10003)
+        body = await self._body(request)
+        message = self.world.message(channel["id"], self.world.bot_user, body, guild_id=channel["guild_id"])
+        self.world.store_message(message)
+        await self.dispatch_to_guild(channel["guild_id"], "MESSAGE_CREATE", message)
+        return json_response(message)
+
+    async def get_message(self, request: web.Request) -> web.Response:
+        message = self.world.messages.get(request.match_info["message_id"])
+        return json_response(message) if message else self._not_found("Message", 10008)
+
+    async def edit_message(self, request: web.Request) -> web.Response:
+        message = self.world.messages.get(request.match_info["message_id"])
+        if message is None:
+            return self._not_found("Message", 10008)
+        body = await self._body(request)
+        for key in ("content", "embeds", "components", "flags"):
+            if key in body:
+                message[key] = body[key] if body[key] is not None else message[key]
+        message["edited_timestamp"] = _now_iso()
+        await self.dispatch_to_guild(message.get("guild_id"), "MESSAGE_UPDATE", message)
+        return json_response(message)
+
+    async def delete_message(self, request: web.Request) -> web.Response:
+        message = self.world.messages.pop(request.match_info["message_id"], None)
+        if message is None:
+            return self._not_found("Message", 10008)
+        await self.dispatch_to_guild(
+            message.get("guild_id"),
+            "MESSAGE_DELETE",
+            {"id": message["id"], "channel_id": message["channel_id"], "guild_id": message.get("guild_id")},
+        )
+        return web.Response(status=204)
+
+    async def interaction_callback(self, request: web.Request) -> web.Response:
+        entry = self._interaction_tokens.get(request.match_info["token"])
+        if entry is None:
+            return self._not_found("interaction", 10062)
+        body = await self._body(request)
+        interaction = entry["interaction"]
+        callback_type = body.get("type")
+        data = body.get("data") or {}
+        resource: dict[str, Any] = {"type": callback_type}
+        if callback_type in (4, 5):  # channel message, or deferred channel message
+            message = self.world.message(
+                interaction["channel_id"], self.world.bot_user, data, guild_id=interaction.get("guild_id")
+            )
+            message["interaction_metadata"] = {"id": interaction["id"], "type": 2, "user": interaction["member"]["user"]}
+            if callback_type == 5:
+                message["flags"] = message["flags"] | 128  # loading
+            entry["original"] = message
+            self.world.store_message(message)
+            resource["message"] = message
+        response = {
+            "interaction": {
+                "id": interaction["id"],
+                "type": interaction["type"],
+                "response_message_id": entry["original"]["id"] if entry["original"] else None,
+                "response_message_loading": callback_type == 5,
+                "response_message_ephemeral": bool(data.get("flags", 0) & 64),
+            },
+            "resource": resource,
+        }
+        if request.query.get("with_response", "").lower() in ("1", "true"):
+            return json_response(response)
+        return web.Response(status=204)
+
+    async def create_followup(self, request: web.Request) -> web.Response:
+        entry = self._interaction_tokens.get(request.match_info["token"])
+        if entry is None:
+            return self._not_found("Webhook", 10015)
+        interaction = entry["interaction"]
+        body = await self._body(request)
+        message = self.world.message(
+            interaction["channel_id"], self.world.bot_user, body, guild_id=interaction.get("guild_id")
+        )
+        message["webhook_id"] = self.world.application_id
+        self.world.store_message(message)
+        return json_response(message)
+
+    async def webhook_message(self, request: web.Request) -> web.Response:
+        entry = self._interaction_tokens.get(request.match_info["token"])
+        if entry is None:
+            return self._not_found("Webhook", 10015)
+        message_id = request.match_info["message_id"]
+        message = entry["original"] if message_id == "@original" else self.world.messages.get(message_id)
+        if message is None:
+            return self._not_found("Message", 10008)
+        if request.method == "DELETE":
+            self.world.messages.pop(message["id"], None)
+            return web.Response(status=204)
+        if request.method == "PATCH":
+            body = await self._body(request)
+            for key in ("content", "embeds", "components"):
+                if key in body and body[key] is not None:
+                    message[key] = body[key]
+            message["flags"] = message["flags"] & ~128
+            message["edited_timestamp"] = _now_iso()
+        return json_response(message)
+
+    async def get_commands(self, request: web.Request) -> web.Response:
+        return json_response(self.world.commands.get(request.match_info.get("guild_id"), []))
+
+    async def put_commands(self, request: web.Request) -> web.Response:
+        body = await self._body(request)
+        guild_id = request.match_info.get("guild_id")
+        commands = [
+            {
+                **command,
+                "id": self.world.snowflakes.next(),
+                "application_id": self.world.application_id,
+                "version": self.world.snowflakes.next(),
+                "default_member_permissions": command.get("default_member_permissions"),
+                "guild_id": guild_id,
+            }
+            for command in body
+        ]
+        self.world.commands[guild_id] = commands
+        return json_response(commands)
+
+    async def fallback(self, request: web.Request) -> web.Response:
+        self.stats.unhandled[f"{request.method} {request.match_info['tail']}"] += 1
+        if request.method == "GET":
+            return json_response({})
+        return web.Response(status=204)
+
+
+def _parse_args() -> FakeDiscordConfig:
+    defaults = FakeDiscordConfig()
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.fake_discord", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default=defaults.host)
+    parser.add_argument("--port", type=int, default=defaults.port)
+    parser.add_argument("--token", default=None, help="Only accept this token (default: accept any).")
+    parser.add_argument("--guilds", type=int, default=defaults.guilds)
+    parser.add_argument("--channels-per-guild", type=int, default=defaults.channels_per_guild)
+    parser.add_argument("--members-per-guild", type=int, default=defaults.members_per_guild)
+    parser.add_argument("--users", type=int, default=defaults.users)
+    parser.add_argument("--shards", type=int, default=defaults.shards, help="Recommended shard count.")
+    parser.add_argument("--message-rate", type=float, default=defaults.message_rate, help="Messages per second.")
+    parser.add_argument("--command-ratio", type=float, default=defaults.command_ratio)
+    parser.add_argument("--prefix", default=defaults.prefix)
+    parser.add_argument("--commands", nargs="+", default=list(defaults.commands), help="Prefix commands to send.")
+    parser.add_argument("--interaction-rate", type=float, default=defaults.interaction_rate)
+    parser.add_argument("--reconnect-every", type=float, default=None, help="Send a RECONNECT every N seconds.")
+    parser.add_argument("--route-limit", type=int, default=defaults.route_limit)
+    parser.add_argument("--route-window", type=float, default=defaults.route_window)
+    parser.add_argument("--global-limit", type=int, default=defaults.global_limit)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    args = vars(parser.parse_args())
+    args["commands"] = tuple(args["commands"])
+    return FakeDiscordConfig(**args)
+
+
+async def _serve(config: FakeDiscordConfig) -> None:
+    server = FakeDiscord(config)
+    await server.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="[{asctime}] [{levelname:<8}] {name}: {message}", style="{")
+    try:
+        asyncio.run(_serve(_parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
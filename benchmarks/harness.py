@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import datetime
+import itertools
+import logging
+from typing import Any, Optional
+
+import discord
+from discord.ext import commands
+from discord.http import HTTPClient, Route
+
+from src.core.client import MyClient
+from src.core.config import ConfigManager
+
+# Tasks that are only scheduled for later (e.g. ``delete_after``) and aren't part of handling a message.
+DEFERRED_TASKS = ("PartialMessage.delete.<locals>.delete", "Message.delete.<locals>.delete")
+
+BOT_ID = 1000
+GUILD_ID = 2000
+CHANNEL_ID = 3000
+FIRST_USER_ID = 10_000
+
+_snowflakes = itertools.count(1 << 40)
+_tracked: contextvars.ContextVar[Optional[set[asyncio.Task]]] = contextvars.ContextVar(
+    "benchmark_tracked_tasks", default=None
+)
+
+
+def _user_payload(user_id: int, *, bot: bool = False) -> dict[str, Any]:
+    return {
+        "id": str(user_id),
+        "username": f"user{user_id}",
+        "discriminator": "0",
+        "global_name": None,
+        "avatar": None,
+        "bot": bot,
+    }
+
+
+def _member_payload(user_id: Optional[int] = None, *, bot: bool = False) -> dict[str, Any]:
+    payload = {
+        "roles": [],
+        "joined_at": "2023-09-14T00:00:00+00:00",
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+    if user_id is not None:
+        payload["user"] = _user_payload(user_id, bot=bot)
+    return payload
+
+
+class StubHTTPClient(HTTPClient):
+    """
+    An ``HTTPClient`` that never touches the network.
+
+    Every request is answered from memory: creating a message echoes back a message payload, and any
+    other route returns an empty object. The number of requests per route is kept in ``calls``.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        super().__init__(loop)
+        self.calls: dict[str, int] = {}
+
+    async def request(self, route: Route, *, files=None, form=None, **kwargs: Any) -> Any:
+        key = f"{route.method} {route.path}"
+        self.calls[key] = self.calls.get(key, 0) + 1
+        if route.method == "POST" and route.path.endswith("/messages"):
+            payload = kwargs.get("json") or {}
+            if form:  # multipart requests carry the JSON payload in the first form field
+                payload = discord.utils._from_json(form[0]["value"])
+            return {
+                **message_payload(BOT_ID, payload.get("content") or "", author_bot=True),
+                "channel_id": str(route.channel_id),
+                "embeds": payload.get("embeds") or [],
+            }
+        return {}
+
+    async def static_login(self, token: str) -> dict[str, Any]:
+        return _user_payload(BOT_ID, bot=True)
+
+    async def close(self) -> None:
+        pass
+
+
+def message_payload(author_id: int, content: str, *, author_bot: bool = False) -> dict[str, Any]:
+    """Builds a ``MESSAGE_CREATE`` payload like the one the gateway sends for a guild message."""
+    return {
+        "id": str(next(_snowflakes)),
+        "channel_id": str(CHANNEL_ID),
+        "guild_id": str(GUILD_ID),
+        "author": _user_payload(author_id, bot=author_bot),
+        "member": _member_payload(),
+        "content": content,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+        "flags": 0,
+    }
+
+
+def _guild_payload() -> dict[str, Any]:
+    return {
+        "id": str(GUILD_ID),
+        "name": "Benchmark Guild",
+        "owner_id": str(FIRST_USER_ID),
+        "roles": [
+            {
+                "id": str(GUILD_ID),
+                "name": "@everyone",
+                "permissions": str(discord.Permissions.all().value),
+                "position": 0,
+                "color": 0,
+                "hoist": False,
+                "managed": False,
+                "mentionable": False,
+            }
+        ],
+        "channels": [
+            {
+                "id": str(CHANNEL_ID),
+                "type": 0,
+                "name": "general",
+                "position": 0,
+                "permission_overwrites": [],
+            }
+        ],
+        "members": [_member_payload(BOT_ID, bot=True)],
+        "member_count": 1,
+        "emojis": [],
+        "stickers": [],
+        "features": [],
+        "verification_level": 0,
+        "default_message_notifications": 0,
+        "explicit_content_filter": 0,
+        "mfa_level": 0,
+        "premium_tier": 0,
+        "nsfw_level": 0,
+        "large": False,
+    }
+
+
+class BenchmarkCommands(commands.Cog):
+    """The commands the scenarios invoke. They do as little as possible so the bot's own overhead dominates."""
+
+    @commands.command(name="ping")
+    async def ping(self, ctx: commands.Context) -> None:
+        await ctx.send("pong")
+
+    @commands.command(name="add")
+    async def add(self, ctx: commands.Context, a: int, b: int) -> None:
+        await ctx.send(str(a + b))
+
+    @commands.command(name="slow")
+    @commands.cooldown(1, 3600, commands.BucketType.user)
+    async def slow(self, ctx: commands.Context) -> None:
+        await ctx.send("done")
+
+    @commands.command(name="fail")
+    async def fail(self, ctx: commands.Context) -> None:
+        raise RuntimeError("benchmark failure")
+
+
+class BenchmarkClient:
+    """
+    A ``MyClient`` wired to a ``StubHTTPClient`` and a synthetic guild, so messages can be pushed
+    through the real event pipeline without a token or a network.
+
+    Use it as an async context manager::
+
+        async with BenchmarkClient() as bench:
+            await bench.handle(bench.message("!ping"))
+    """
+
+    def __init__(self, prefix: str = "!"):
+        self.prefix: str = prefix
+        self.client: Optional[MyClient] = None
+        self.http: Optional[StubHTTPClient] = None
+        self._channel: Optional[discord.TextChannel] = None
+        self._previous_factory = None
+
+    async def __aenter__(self) -> BenchmarkClient:
+        loop = asyncio.get_running_loop()
+        logging.getLogger("bot").setLevel(logging.CRITICAL)
+
+        config = ConfigManager()
+        config.load({"token": "benchmark", "prefix": self.prefix})
+        client = MyClient(self.prefix, discord.Intents.all())
+        client.load_config(config)
+
+        self.http = StubHTTPClient(loop)
+        client.http = self.http
+        client._connection.http = self.http
+        client.loop = loop
+        # noinspection PyProtectedMember
+        state = client._connection
+        state.user = discord.ClientUser(state=state, data=_user_payload(BOT_ID, bot=True))
+        state._add_guild_from_data(_guild_payload())
+        self._channel = client.get_channel(CHANNEL_ID)
+
+        await client.add_cog(BenchmarkCommands())
+        await client.load_extension("src.handlers.error")
+
+        self._previous_factory = loop.get_task_factory()
+        loop.set_task_factory(self._task_factory)
+        self.client = client
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        loop = asyncio.get_running_loop()
+        loop.set_task_factory(self._previous_factory)
+        pending = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    @staticmethod
+    def _task_factory(loop: asyncio.AbstractEventLoop, coro, **kwargs) -> asyncio.Task:
+        task = asyncio.Task(coro, loop=loop, **kwargs)
+        tracked = _tracked.get()
+        if tracked is not None and getattr(coro, "__qualname__", "") not in DEFERRED_TASKS:
+            tracked.add(task)
+        return task
+
+    def message(self, content: str, *, author_id: int = FIRST_USER_ID) -> discord.Message:
+        """Builds a guild message, the same way the gateway's ``MESSAGE_CREATE`` handler does."""
+        # noinspection PyProtectedMember
+        return discord.Message(
+            state=self.client._connection,
+            channel=self._channel,
+            data=message_payload(author_id, content),
+        )
+
+    async def handle(self, message: discord.Message) -> None:
+        """
+        Dispatches ``message`` like the gateway would and waits for every task it spawned to finish,
+        which includes the command callback and any ``on_command_error`` listeners.
+        """
+        tracked: set[asyncio.Task] = set()
+        token = _tracked.set(tracked)
+        try:
+            self.client.dispatch("message", message)
+        finally:
+            _tracked.reset(token)
+
+        done: set[asyncio.Task] = set()
+        while tracked - done:
+            pending = tracked - done
+            await asyncio.wait(pending)
+            done |= pending
@@ -0,0 +1,115 @@
+"""
+Replays a gateway recording (see ``recorder`` in ``config.yml``) into an offline client and reports
+how fast it was parsed and what it left in the cache::
+
+    python -m benchmarks.replay cache/gateway/recording.jsonl.gz --speed 10
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from typing import Optional
+
+from src.core.diagnostics import MemoryDiagnostics
+from src.core.recorder import GatewayReplayer, read_recording
+from src.utils.memory import format_bytes
+
+from .harness import BenchmarkClient
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.replay", description="Replays a gateway recording offline."
+    )
+    parser.add_argument("path", help="The recording file.")
+    speed = parser.add_mutually_exclusive_group()
+    speed.add_argument("--speed", type=float, default=1.0, help="Replay N times faster than recorded (default: 1).")
+    speed.add_argument("--fast", action="store_true", help="Replay as fast as possible.")
+    parser.add_argument("--session", type=int, default=None, help="Only replay the N-th session (0-based).")
+    parser.add_argument("-o", "--output", default=None, help="Also write the report to this JSON file.")
+    return parser.parse_args()
+
+
+async def _replay(path: str, speed: Optional[float], session: Optional[int]) -> dict:
+    async with BenchmarkClient() as bench:
+        rss_before = MemoryDiagnostics.process_rss()
+        # noinspection PyProtectedMember
+        replayer = GatewayReplayer(bench.client._connection, speed=speed)
+        sessions = []
+        # the sessions are streamed from the file, so only the event being parsed is in memory
+        for index, recording in enumerate(read_recording(path)):
+            if session is not None and index != session:
+                continue
+            stats = await replayer.replay(recording)
+            sessions.append(
+                {
+                    "started_at": recording.header["started_at"],
+                    "anonymized": recording.header["anonymized"],
+                    "recorded_duration": round(recording.duration, 3),
+                    "events": stats.events,
+                    "duration": round(stats.duration, 3),
+                    "events_per_second": round(stats.events / stats.duration, 1) if stats.duration else 0.0,
+                    "parse_ms": {
+                        event: round(seconds * 1000, 3) for event, seconds in stats.parse_time.most_common()
+                    },
+                    "per_event": dict(stats.per_event.most_common()),
+                    "skipped": dict(stats.skipped),
+                    "errors": dict(stats.errors),
+                }
+            )
+        if session is not None and not sessions:
+            raise IndexError(f"the recording has no session {session}")
+
+        client = bench.client
+        rss_after = MemoryDiagnostics.process_rss()
+        cache = {
+            "guilds": len(client.guilds),
+            "users": len(client.users),
+            "members": sum(len(guild.members) for guild in client.guilds),
+            "channels": sum(len(guild.channels) for guild in client.guilds),
+            "messages": len(client.cached_messages),
+            "rss_growth": (rss_after - rss_before) if rss_before and rss_after else None,
+        }
+    return {"path": path, "speed": speed, "sessions": sessions, "cache": cache}
+
+
+def main() -> int:
+    args = _parse_args()
+    logging.disable(logging.CRITICAL)
+    try:
+        report = asyncio.run(_replay(args.path, None if args.fast else args.speed, args.session))
+    except (OSError, ValueError, IndexError) as e:
+        print(f"Can't replay {args.path}: {e}", file=sys.stderr)
+        return 1
+
+    for i, session in enumerate(report["sessions"]):
+        print(
+            f"Session {i}: {session['events']} events in {session['duration']:.2f}s "
+            f"({session['events_per_second']:.0f}/s, recorded over {session['recorded_duration']:.2f}s)"
+        )
+        for event, ms in list(session["parse_ms"].items())[:10]:
+            print(f"    {event:<32} {session['per_event'][event]:>8}  {ms:>10.2f} ms")
+        if session["skipped"]:
+            print(f"    skipped (no parser): {session['skipped']}")
+        if session["errors"]:
+            print(f"    parser errors: {session['errors']}")
+
+    cache = report["cache"]
+    rss = format_bytes(cache["rss_growth"]) if cache["rss_growth"] is not None else "n/a"
+    print(
+        f"Cache: {cache['guilds']} guilds, {cache['users']} users, {cache['members']} members, "
+        f"{cache['channels']} channels, {cache['messages']} messages. RSS growth: {rss}"
+    )
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+Sends the same REST load from several bot processes to the fake Discord twice, once directly and once
+through the REST proxy, and reports the 429s the fake Discord handed out and how long each took::
+
+    python -m benchmarks.rest_proxy --workers 4 --messages 25 --channels 4
+
+Each worker is its own discord.py ``HTTPClient`` with its own rate-limit state, like a separate bot
+process (or shard cluster) sharing the token.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+from discord import HTTPException
+from discord.http import INTERNAL_API_VERSION, HTTPClient, Route
+
+from src.core.config import RestProxyConfig
+from src.core.rest_proxy import RestProxy
+
+from .fake_discord import FakeDiscord, FakeDiscordConfig
+
+TOKEN = "benchmark-token"
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.rest_proxy", description="Compares REST rate limiting with and without the proxy."
+    )
+    parser.add_argument("--workers", type=int, default=4, help="Bot processes sharing the token (default: 4).")
+    parser.add_argument("--messages", type=int, default=25, help="Messages each worker sends (default: 25).")
+    parser.add_argument("--channels", type=int, default=4, help="Channels the messages go to (default: 4).")
+    parser.add_argument("--route-limit", type=int, default=5, help="Requests per bucket per window (default: 5).")
+    parser.add_argument("--route-window", type=float, default=1.0, help="Bucket window in seconds (default: 1).")
+    parser.add_argument("--port", type=int, default=8765, help="The fake Discord's port, the proxy uses the next.")
+    parser.add_argument("-o", "--output", default=None, help="Also write the report to this JSON file.")
+    return parser.parse_args()
+
+
+async def _worker(base: str, channels: list[str], messages: int) -> int:
+    """Sends the messages and returns how many discord.py gave up on after retrying its 429s."""
+    Route.BASE = base
+    http = HTTPClient(asyncio.get_running_loop())
+    await http.static_login(TOKEN)
+    failed = 0
+    try:
+        for i in range(messages):
+            channel_id = channels[i % len(channels)]
+            route = Route("POST", "/channels/{channel_id}/messages", channel_id=channel_id)
+            try:
+                await http.request(route, json={"content": f"message {i}"})
+            except HTTPException:
+                failed += 1
+    finally:
+        await http.close()
+    return failed
+
+
+async def _phase(fake: FakeDiscord, base: str, args: argparse.Namespace, channels: list[str]) -> dict:
+    rate_limited = sum(fake.stats.rate_limited.values())
+    requests = sum(fake.stats.requests.values())
+    started = time.perf_counter()
+    failed = await asyncio.gather(*(_worker(base, channels, args.messages) for _ in range(args.workers)))
+    return {
+        "messages": args.workers * args.messages,
+        "failed": sum(failed),
+        "duration": round(time.perf_counter() - started, 3),
+        "upstream_requests": sum(fake.stats.requests.values()) - requests,
+        "upstream_429s": sum(fake.stats.rate_limited.values()) - rate_limited,
+    }
+
+
+async def _run(args: argparse.Namespace) -> dict:
+    fake = FakeDiscord(
+        FakeDiscordConfig(port=args.port, route_limit=args.route_limit, route_window=args.route_window, seed=0)
+    )
+    proxy = RestProxy(RestProxyConfig(enabled=True, port=args.port + 1, max_wait=120.0), fake.base_url)
+    await fake.start()
+    await proxy.start()
+    try:
+        channels = list(fake.world.channels)[: args.channels]
+        direct = await _phase(fake, f"{fake.base_url}/api/v{INTERNAL_API_VERSION}", args, channels)
+        await asyncio.sleep(max(args.route_window, 1.0))  # so the direct run's windows don't count against the proxy
+        proxied_base = f"http://{proxy.config.host}:{proxy.config.port}/api/v{INTERNAL_API_VERSION}"
+        proxied = await _phase(fake, proxied_base, args, channels)
+        return {"direct": direct, "proxied": proxied, "proxy": proxy.snapshot()}
+    finally:
+        await proxy.close()
+        await fake.close()
+
+
+def main() -> int:
+    args = _parse_args()
+    logging.disable(logging.CRITICAL)
+    try:
+        report = asyncio.run(_run(args))
+    except OSError as e:
+        print(f"Can't run the benchmark: {e}", file=sys.stderr)
+        return 1
+
+    print(f"{args.workers} workers x {args.messages} messages over {args.channels} channel(s):")
+    for name in ("direct", "proxied"):
+        phase = report[name]
+        print(
+            f"    {name:<8} {phase['duration']:>7.2f}s  {phase['upstream_requests']:>5} upstream requests  "
+            f"{phase['upstream_429s']:>4} 429s  {phase['failed']:>4} failed"
+        )
+    for route, metrics in report["proxy"]["routes"].items():
+        print(
+            f"    {route:<40} max queued {metrics['max_queued']:>3}  avg wait {metrics['avg_wait_ms']:>8.1f} ms  "
+            f"max wait {metrics['max_wait_ms']:>8.1f} ms  retried {metrics['rate_limited']}"
+        )
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import gc
+import math
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Optional
+
+import discord
+
+from .harness import FIRST_USER_ID, BenchmarkClient
+
+
+@dataclass
+class Scenario:
+    """
+    A stream of messages to push through the bot.
+
+    Parameters:
+        name: The name the results are stored under.
+        description: What the scenario exercises.
+        content: Builds the content of the i-th message.
+        users: The number of distinct authors the messages rotate through.
+    """
+
+    name: str
+    description: str
+    content: Callable[[int], str]
+    users: int = 100
+
+
+SCENARIOS: dict[str, Scenario] = {
+    scenario.name: scenario
+    for scenario in (
+        Scenario("chatter", "Messages that aren't commands.", lambda i: f"just chatting, message {i}"),
+        Scenario("command", "A command with no arguments.", lambda i: "!ping"),
+        Scenario("converters", "A command with two converted arguments.", lambda i: f"!add {i} {i * 2}"),
+        Scenario(
+            "cooldown",
+            "A command that is on cooldown, handled by PrefixCommandErrorHandler.",
+            lambda i: "!slow",
+            users=1,
+        ),
+        Scenario(
+            "error",
+            "A command that raises, handled by PrefixCommandErrorHandler.",
+            lambda i: "!fail",
+        ),
+        Scenario("bad-argument", "A command with an invalid argument.", lambda i: "!add one two"),
+    )
+}
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    messages: int
+    duration: float
+    throughput: float  # messages per second
+    latency_ms: dict[str, float] = field(default_factory=dict)
+    requests: dict[str, int] = field(default_factory=dict)
+    rate: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of already sorted ``values``."""
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(values)))
+    return values[rank - 1]
+
+
+def summarize(latencies: list[float]) -> dict[str, float]:
+    latencies = sorted(latencies)
+    return {
+        "mean": round(sum(latencies) / len(latencies) * 1000, 4) if latencies else 0.0,
+        "p50": round(percentile(latencies, 50) * 1000, 4),
+        "p90": round(percentile(latencies, 90) * 1000, 4),
+        "p99": round(percentile(latencies, 99) * 1000, 4),
+        "max": round(latencies[-1] * 1000, 4) if latencies else 0.0,
+    }
+
+
+async def _timed(bench: BenchmarkClient, message: discord.Message, started: float, out: list[float]) -> None:
+    await bench.handle(message)
+    out.append(time.perf_counter() - started)
+
+
+async def run_scenario(
+    scenario: Scenario,
+    *,
+    messages: int = 5000,
+    warmup: int = 200,
+    rate: Optional[float] = None,
+) -> ScenarioResult:
+    """
+    Runs a scenario against a fresh ``BenchmarkClient``.
+
+    Without a ``rate`` every message is handled before the next one is sent, which measures the
+    latency of the hot path on its own. With a ``rate`` (messages per second) messages are sent on a
+    fixed schedule whether or not earlier ones finished, and latency is measured from the time each
+    message was *due*, so a backlog shows up in the percentiles instead of being hidden.
+
+    Parameters:
+        scenario: The scenario to run.
+        messages: The number of measured messages.
+        warmup: The number of messages sent before measuring starts.
+        rate: The target send rate, or ``None`` to send back to back.
+    """
+    async with BenchmarkClient() as bench:
+        batch = [
+            bench.message(scenario.content(i), author_id=FIRST_USER_ID + i % scenario.users)
+            for i in range(warmup + messages)
+        ]
+        for message in batch[:warmup]:
+            await bench.handle(message)
+        bench.http.calls.clear()
+
+        latencies: list[float] = []
+        gc.collect()
+        started = time.perf_counter()
+        if rate is None:
+            for message in batch[warmup:]:
+                sent = time.perf_counter()
+                await bench.handle(message)
+                latencies.append(time.perf_counter() - sent)
+        else:
+            tasks = []
+            for i, message in enumerate(batch[warmup:]):
+                due = started + i / rate
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(_timed(bench, message, due, latencies)))
+            await asyncio.gather(*tasks)
+        duration = time.perf_counter() - started
+
+        return ScenarioResult(
+            name=scenario.name,
+            messages=messages,
+            duration=round(duration, 6),
+            throughput=round(messages / duration, 2),
+            latency_ms=summarize(latencies),
+            requests=dict(sorted(bench.http.calls.items())),
+            rate=rate,
+        )
+
+
+def compare(baseline: dict, current: dict, *, threshold: float = 10.0) -> tuple[list[str], bool]:
+    """
+    Compares two result files.
+
+    Parameters:
+        baseline: The results to compare against.
+        current: The new results.
+        threshold: How many percent worse throughput or p50/p99 latency may get before it counts as a
+            regression.
+
+    Returns:
+        tuple[list[str], bool]: One line per compared metric, and whether anything regressed.
+    """
+    lines, regressed = [], False
+    for name, new in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            lines.append(f"{name}: not in the baseline")
+            continue
+        metrics = [
+            ("throughput", old["throughput"], new["throughput"], True),
+            ("p50 ms", old["latency_ms"]["p50"], new["latency_ms"]["p50"], False),
+            ("p99 ms", old["latency_ms"]["p99"], new["latency_ms"]["p99"], False),
+        ]
+        for label, before, after, higher_is_better in metrics:
+            change = (after - before) / before * 100 if before else 0.0
+            worse = -change if higher_is_better else change
+            flag = ""
+            if worse > threshold:
+                flag, regressed = "  << REGRESSION", True
+            lines.append(f"{name:<14} {label:<11} {before:>12.3f} -> {after:>12.3f} ({change:+.1f}%){flag}")
+    return lines, regressed
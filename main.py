@@ -7,8 +7,10 @@ from aiohttp import ClientConnectorError
 from discord import Intents
 from discord.errors import LoginFailure
 
-from src.core.client import MiasmaClient
+from src.core.client import MyClient
+from src.core.config import ConfigError, ConfigManager
 from src.utils.startup import (
+    configure_api,
     ensure_environment,
     exit_bot,
     load_config,
@@ -17,7 +19,7 @@ from src.utils.startup import (
 )
 
 
-async def load_extensions(client: MiasmaClient, extensions: list[str]) -> None:
+async def load_extensions(client: MyClient, extensions: list[str]) -> None:
     for extension in extensions:
         await client.load_extension(extension)
 
@@ -32,8 +34,15 @@ def ensure_logs() -> None:
 
 async def main():
     _logger = logging.getLogger("main")
-    config = load_config(_logger)
-    if config and config.get("debug") is True:
+    config_manager = ConfigManager()
+    try:
+        config = config_manager.load(load_config(_logger))
+    except ConfigError as e:
+        setup_logging(level=logging.INFO)
+        _logger.critical(f"- config.yml is invalid: {e}")
+        return exit_bot()
+
+    if config.debug is True:
         setup_logging(level=logging.DEBUG)
     else:
         setup_logging(level=logging.INFO)
@@ -46,16 +55,18 @@ async def main():
         ["discord.client", "discord.gateway", "discord.http", "discord.state"]
     )
 
-    intents = Intents(Intents.default().value, **config["privileged-intents"])
-    client = MiasmaClient(config["prefix"], intents)
-    client.load_config(config)
+    configure_api(config.api, _logger, config.rest_proxy)
+
+    intents = Intents(Intents.default().value, **config.privileged_intents)
+    client = MyClient(config.prefix, intents)
+    client.load_config(config_manager)
 
     await ensure_environment(client, _logger)
 
     async with client:
-        await load_extensions(client, config["extensions"])
+        await load_extensions(client, config.extensions)
         try:
-            await client.start(config["token"])
+            await client.start(config.token)
         except LoginFailure as e:
             _logger.critical(f"{e}")
             _logger.critical(
@@ -74,10 +85,7 @@ async def main():
 if __name__ == "__main__":
     try:
         if os.name == "nt" and sys.version_info >= (3, 8):
-            import tracemalloc
-
             asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-            tracemalloc.start()
 
         asyncio.run(main())
     except KeyboardInterrupt:
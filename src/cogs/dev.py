@@ -1,26 +1,39 @@
 from __future__ import annotations
 
 import inspect
-from functools import partial
 from typing import TYPE_CHECKING, Literal, Optional
 
 if TYPE_CHECKING:
     from ..core.client import MiasmaClient
 
 import asyncio
+import copy
+import dataclasses
+import hashlib
 import io
 import os
-import subprocess
+import re
 import sys
 import textwrap
+import time
 import traceback as tb
 from contextlib import redirect_stdout
 
+import aiohttp
 import discord
 from discord.ext import commands
 
+from ..core.bus import BusReply
+from ..core.config import RESTART_KEYS, ConfigError
 from ..core.objects import TextPageSource
-from ..ui.views import PaginatorView
+from ..ui.views import PaginatorView, ProcessView
+from ..utils import logs
+from ..utils.assets import EMOJI_MAX_SIZE, AssetCache, fit_image
+from ..utils.memory import deep_getsizeof, format_bytes
+from ..utils.profiling import CommandProfiler
+from ..utils.reloader import ReloadPlan, execute_reload, plan_reload
+from ..utils.shell import ShellProcess, run_exec
+from ..utils.spreadsheets import build_xlsx, parse_xlsx
 
 
 class Restricted(commands.Cog):
@@ -28,6 +41,7 @@ class Restricted(commands.Cog):
         self.client: MiasmaClient = client
         self.bot: MiasmaClient = self.client
         self._last_result = None
+        self.asset_cache = AssetCache(executor=client.executors.io)
 
     @staticmethod
     def _partial_emoji_url(_id, *, animated: bool = False):
@@ -37,24 +51,63 @@ class Restricted(commands.Cog):
     async def cog_load(self):
         self.client.logger.info("Loaded Restricted Cog...")
 
-    async def grab_emoji(self, url: str):
-        async with self.client.session.get(url) as r:
-            result = await r.read()
+    async def cog_unload(self):
+        await self.asset_cache.flush()
+
+    async def grab_emoji(self, url: str) -> bytes:
+        result = await self.asset_cache.get(url)
+        if result is None:
+            async with self.client.session.get(url) as r:
+                r.raise_for_status()
+                result = await r.read()
+            await self.asset_cache.put(url, result)
         return result
 
-    async def run_process(self, command):
-        try:
-            process = await asyncio.create_subprocess_shell(
-                command, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-            )
-            result = await process.communicate()
-        except NotImplementedError:
-            process = subprocess.Popen(
-                command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    async def fit_emoji(self, data: bytes) -> bytes:
+        """Downscales an image that's too large to be an emoji, reusing a cached result if there is one."""
+        digest = hashlib.sha256(data).hexdigest()
+        variant = f"fit{EMOJI_MAX_SIZE}"
+        result = await self.asset_cache.get_variant(digest, variant)
+        if result is None:
+            result = await self.client.executors.cpu.run(fit_image, data, EMOJI_MAX_SIZE)
+            await self.asset_cache.put_variant(digest, variant, result)
+        return result
+
+    async def clone_emoji(
+        self,
+        guild: discord.Guild,
+        emoji: discord.PartialEmoji,
+        semaphore: asyncio.Semaphore,
+    ) -> discord.Emoji:
+        async with semaphore:
+            url = self._partial_emoji_url(_id=emoji.id, animated=emoji.animated)
+            image = await self.grab_emoji(url)
+            if len(image) > EMOJI_MAX_SIZE:
+                image = await self.fit_emoji(image)
+            return await guild.create_custom_emoji(name=f"{emoji.name}", image=image)
+
+    @staticmethod
+    def _render_shell_status(process: ShellProcess) -> str:
+        output = process.output
+        if process.timed_out:
+            status = f"⏱️ Timed out after {process.elapsed:.0f}s."
+        elif process.returncode is None:
+            status = f"⏳ Running for {process.elapsed:.0f}s..."
+        elif process.killed:
+            status = f"🛑 Killed after {process.elapsed:.1f}s."
+        else:
+            status = f"Exited with code {process.returncode} in {process.elapsed:.1f}s."
+        if output.dropped_bytes:
+            status += (
+                f" Showing the last {format_bytes(len(output))} "
+                f"of {format_bytes(output.total_bytes)}."
             )
-            result = await self.client.loop.run_in_executor(None, process.communicate)
+        return status
 
-        return [output.decode() for output in result]
+    def _render_shell(self, process: ShellProcess) -> str:
+        status = self._render_shell_status(process)
+        tail = process.output.tail(1900 - len(status)).replace("```", "`\u200b`\u200b`")
+        return f"{status}\n```\n{tail}\n```"
 
     @staticmethod
     async def restart_bot(message_url: str = None):
@@ -107,6 +160,15 @@ class Restricted(commands.Cog):
                 color=discord.Color.dark_theme(),
             )
         )
+        # the restart replaces the process without closing the client, so drain it first
+        report = await self.client.drainer.drain()
+        description = f"⚠️ `Restarting the bot. {report.summary()}`"
+        await msg.edit(
+            embed=discord.Embed(
+                description=description[:4000],
+                color=discord.Color.dark_theme() if report.clean else discord.Color.orange(),
+            )
+        )
         await self.restart_bot(msg.jump_url)
 
     @developer.command()
@@ -116,87 +178,145 @@ class Restricted(commands.Cog):
         self,
         ctx: commands.Context,
         guilds: commands.Greedy[discord.Object],
-        spec: Optional[Literal["~", "*", "^", "^^"]] = None,
+        spec: Optional[Literal["~", "*", "^", "^^", "!"]] = None,
     ) -> None:
         """
         Summary:
             Syncs the tree to the current guild or all guilds.
+            Scopes whose commands haven't changed since their last sync are skipped.
 
         Args:
             ctx: commands.Context - The context of the command.
             guilds: commands.Greedy[discord.Object] - The guilds to sync to.
-            spec: Optional[Literal["~", "*", "^"]] - The specification of the sync.
+            spec: Optional[Literal["~", "*", "^", "^^", "!"]] - The specification of the sync.
                 "~" - Sync to the current guild.
                 "*" - Copy the global tree to the current guild.
                 "^" - Clear the commands in the current guild.
                 "^^" - Clear the commands in all guilds.
+                "!" - Sync even if nothing changed (globally, or to the given guilds).
                 "None" - Sync to all guilds.
 
         Returns:
             None
         """
+        syncer = self.client.command_syncer
+        force = spec == "!"
         if not guilds:
             if spec == "~":
-                synced = await ctx.bot.tree.sync(guild=ctx.guild)
+                scope = ctx.guild
             elif spec == "*":
                 ctx.bot.tree.copy_global_to(guild=ctx.guild)
-                synced = await ctx.bot.tree.sync(guild=ctx.guild)
+                scope = ctx.guild
             elif spec == "^":
                 ctx.bot.tree.clear_commands(guild=ctx.guild)
-                await ctx.bot.tree.sync(guild=ctx.guild)
-                synced = []
+                scope = ctx.guild
             elif spec == "^^":
                 ctx.bot.tree.clear_commands(guild=None)
-                await ctx.bot.tree.sync()
-                synced = []
+                scope = None
             else:
-                synced = await ctx.bot.tree.sync()
-
-            await ctx.send(
-                f"Synced {len(synced)} commands {'globally' if spec is None else 'to the current guild.'}"
-            )
+                scope = None
+
+            (result,) = await syncer.sync([scope], force=force)
+            if result.error is not None:
+                raise result.error
+            where = "globally" if scope is None else "to the current guild"
+            if not result.synced:
+                await ctx.send(f"{result.command_count} commands are already up to date {where}.")
+            else:
+                await ctx.send(f"Synced {result.command_count} commands {where}.")
             return
 
-        ret = 0
-        for guild in guilds:
-            try:
-                await ctx.bot.tree.sync(guild=guild)
-            except discord.HTTPException:
-                pass
-            else:
-                ret += 1
+        results = await syncer.sync(guilds, force=force)
+        synced = sum(1 for r in results if r.synced)
+        unchanged = sum(1 for r in results if not r.synced and r.error is None)
+        await ctx.send(
+            f"Synced the tree to {synced}/{len(guilds)}. {unchanged} were already up to date."
+        )
+
+    async def _git(self, *args: str) -> str:
+        returncode, stdout, stderr = await run_exec("git", *args, executor=self.client.executors.io)
+        if returncode != 0:
+            raise commands.CommandError(f"git {' '.join(args)} failed:\n{stderr or stdout}")
+        return stdout
 
-        await ctx.send(f"Synced the tree to {ret}/{len(guilds)}.")
+    @staticmethod
+    def _format_reload_plan(plan: ReloadPlan) -> str:
+        lines = []
+        if plan.changed_modules:
+            lines.append("Changed modules:\n- " + "\n- ".join(plan.changed_modules))
+        if plan.modules:
+            lines.append("Modules to reload:\n+ " + "\n+ ".join(plan.modules))
+        if plan.extensions:
+            lines.append("Extensions to reload:\n+ " + "\n+ ".join(plan.extensions))
+        if plan.restart_required:
+            lines.append("Restart required for:\n! " + "\n! ".join(plan.restart_required))
+        if plan.ignored_files:
+            lines.append("Not reloadable:\n  " + "\n  ".join(plan.ignored_files))
+        return "\n\n".join(lines) or "Nothing to reload."
 
     @developer.command(
         name="pull",
-        help="Pull from GitHub and reload cogs.",
+        help="Pull from GitHub and reload the extensions affected by the changes.\n"
+        "Use `dev pull dry` to preview what would be reloaded without pulling.",
         brief="Pull from GitHub and reload cogs.",
     )
     @commands.is_owner()
-    async def dev_pull(self, ctx: commands.Context):
-        out = subprocess.check_output("git pull", shell=True)
+    async def dev_pull(
+        self, ctx: commands.Context, mode: Optional[Literal["dry", "preview"]] = None
+    ):
+        old_head = (await self._git("rev-parse", "HEAD")).strip()
+
+        if mode is not None:
+            await self._git("fetch")
+            new_head = "@{u}"
+            out = await self._git("log", "--oneline", f"{old_head}..{new_head}")
+        else:
+            out = await self._git("pull")
+            new_head = (await self._git("rev-parse", "HEAD")).strip()
+
         embed = discord.Embed(
-            title="git pull",
-            description=f"```py\n{out.decode('utf8')}\n```",
+            title="git fetch (dry run)" if mode is not None else "git pull",
+            description=f"```py\n{out.strip()[-1900:] or 'Already up to date.'}\n```",
             color=0x00FF00,
         )
         await ctx.send(embed=embed)
 
-        if out.decode("utf8").strip() == "Already up to date.":
+        changed = (await self._git("diff", "--name-only", old_head, new_head)).split()
+        if not changed:
             return
 
-        for ext_name, ext in dict(self.client.extensions).copy().items():
-            try:
-                await self.client.reload_extension(ext_name)
-            except (
-                commands.ExtensionNotLoaded,
-                commands.ExtensionAlreadyLoaded,
-                commands.ExtensionNotFound,
-            ):
-                pass
+        # parses every loaded project module
+        plan = await self.client.executors.io.run(plan_reload, changed, list(self.client.extensions))
+        if mode is not None or plan.is_empty:
+            pages = TextPageSource(
+                self._format_reload_plan(plan), code_block=True, block_prefix="diff"
+            ).getPages()
+            view = PaginatorView(pages, ctx)
+            view.message = await ctx.send(pages[0], view=view)
+            return
 
-        self.client.logger.info("Synced local code with GitHub repo.")
+        results = await execute_reload(self.client, plan)
+        lines = []
+        for result in results:
+            kind = "extension" if result.is_extension else "module"
+            if result.ok:
+                lines.append(f"+ {result.name} ({kind}): {result.duration * 1000:.1f} ms")
+            else:
+                lines.append(
+                    f"- {result.name} ({kind}) rolled back: "
+                    f"{type(result.error).__name__}: {result.error}"
+                )
+        if plan.restart_required:
+            lines.append("\n! Restart required for: " + ", ".join(plan.restart_required))
+
+        pages = TextPageSource(
+            "\n".join(lines), code_block=True, block_prefix="diff"
+        ).getPages()
+        view = PaginatorView(pages, ctx)
+        view.message = await ctx.send(pages[0], view=view)
+        self.client.logger.info(
+            f"Synced local code with GitHub repo ({len(plan.extensions)} extension(s) reloaded)."
+        )
 
     @developer.command(
         name="loaded_cogs",
@@ -213,6 +333,451 @@ class Restricted(commands.Cog):
         )
         await ctx.send(embed=embed)
 
+    @developer.command(
+        name="views",
+        help="List live views and their estimated memory usage.",
+        brief="List live views.",
+    )
+    @commands.is_owner()
+    async def developer_views(self, ctx: commands.Context):
+        manager = self.client.view_manager
+        if not len(manager):
+            return await ctx.send("```diff\n-<[ No live views. ]>-```")
+
+        lines = []
+        total_size = 0
+        for view in manager:
+            # the bot, context and message are shared with the rest of the bot, so don't count them
+            not_owned = [self.client, manager] + [
+                getattr(view, attr, None)
+                for attr in ("message", "interaction", "interaction_or_ctx")
+            ]
+            size = deep_getsizeof(view, exclude=not_owned)
+            total_size += size
+            remaining = manager.remaining(view)
+            lines.append(
+                f"{view.__class__.__name__:<16} owner={view.owner_id} "
+                f"age={manager.age(view):.0f}s "
+                f"expires={'never' if remaining is None else f'{remaining:.0f}s'} "
+                f"size={format_bytes(size)}"
+            )
+
+        header = (
+            f"{len(manager)}/{manager.max_views} live views "
+            f"(max {manager.max_views_per_user} per user), "
+            f"{manager.evictions} evicted, ~{format_bytes(total_size)} total\n\n"
+        )
+        pages = TextPageSource(header + "\n".join(lines), code_block=True).getPages()
+        view = PaginatorView(pages, ctx)
+        view.message = await ctx.send(pages[0], view=view)
+
+    @developer.command(
+        name="jobs",
+        help="List scheduled background jobs with their run counts, durations and start lag.",
+        brief="List scheduled jobs.",
+    )
+    @commands.is_owner()
+    async def developer_jobs(self, ctx: commands.Context):
+        scheduler = self.client.scheduler
+        if not scheduler.jobs:
+            return await ctx.send("```diff\n-<[ No scheduled jobs. ]>-```")
+
+        now = time.time()
+        blocks = []
+        for job in sorted(scheduler.jobs.values(), key=lambda j: j.next_run or float("inf")):
+            m = job.metrics
+            next_run = "never" if job.next_run is None else f"in {max(0.0, job.next_run - now):.1f}s"
+            owner = type(job.owner).__name__ if job.owner is not None else "-"
+            lines = [
+                f"{job.name} ({job.trigger}, owner {owner}) next {next_run}",
+                f"  runs {m.runs}  failed {m.failures}  skipped {m.skipped}  missed {m.missed}  "
+                f"running {job.running}/{job.max_concurrency}  queued {job.queued}",
+                f"  duration avg {m.avg_duration * 1000:.1f} ms  max {m.max_duration * 1000:.1f} ms  "
+                f"lag avg {m.avg_lag * 1000:.1f} ms  max {m.max_lag * 1000:.1f} ms",
+            ]
+            if m.last_error:
+                lines.append(f"  last error: {m.last_error}")
+            blocks.append("\n".join(lines))
+
+        pages = TextPageSource("\n\n".join(blocks), code_block=True).getPages()
+        view = PaginatorView(pages, ctx)
+        view.message = await ctx.send(pages[0], view=view)
+
+    @developer.command(
+        name="executors",
+        help="Show the load and queue metrics of the io and cpu executors.",
+        brief="Show executor metrics.",
+    )
+    @commands.is_owner()
+    async def developer_executors(self, ctx: commands.Context):
+        lines = []
+        for executor in self.client.executors:
+            s = executor.stats
+            lines.append(
+                f"{executor.name} ({executor.kind} pool, {executor.max_workers} workers, queue {executor.max_queue})\n"
+                f"  running {executor.running}  queued {executor.queued} (max {s.max_queued})\n"
+                f"  submitted {s.submitted}  completed {s.completed}  failed {s.failed}  "
+                f"cancelled {s.cancelled}  rejected {s.rejected}\n"
+                f"  wait avg {s.avg_wait * 1000:.1f} ms  max {s.max_wait * 1000:.1f} ms  "
+                f"run avg {s.avg_run * 1000:.1f} ms  max {s.max_run * 1000:.1f} ms"
+            )
+        await ctx.send("```\n" + "\n\n".join(lines) + "\n```")
+
+    @developer.command(
+        name="db",
+        help="Show the database primary and replicas, with their lag, queries in flight and circuit breakers.",
+        brief="Show database nodes.",
+    )
+    @commands.is_owner()
+    async def developer_db(self, ctx: commands.Context):
+        db = self.client.db
+        if db is None or db.primary is None:
+            return await ctx.send("```diff\n-<[ The database isn't connected. ]>-```")
+        lines = []
+        for node in [db.primary, *db.replicas]:
+            if node is db.primary:
+                state = "primary"
+            elif not node.healthy or node.pool is None:
+                state = "down"
+            elif node.lag > db.max_replica_lag:
+                state = f"lagging {node.lag:.1f}s"
+            else:
+                state = f"lag {node.lag:.1f}s"
+            breaker = node.breaker
+            lines.append(
+                f"{node.name:<32} {state:<16} {node.outstanding:>4} in flight  {node.served:>10,} served  "
+                f"breaker {breaker.state} ({breaker.trips} trips, {breaker.rejected:,} rejected)"
+            )
+        await ctx.send("```\n" + "\n".join(lines) + "\n```")
+
+    @developer.command(
+        name="interactions",
+        help="Show how often each interaction handler was deferred by the deadline guard.",
+        brief="Show interaction deadline stats.",
+    )
+    @commands.is_owner()
+    async def developer_interactions(self, ctx: commands.Context):
+        guard = self.client.interactions
+        if not guard.stats:
+            return await ctx.send("```diff\n-<[ No interactions handled yet. ]>-```")
+        lines = [
+            f"{name}\n"
+            f"  calls {s.calls}  deferred {s.deferred} ({s.fallback_rate:.0%})  rerouted {s.rerouted}  "
+            f"exposed {s.exposed}  unanswered {s.unanswered}\n"
+            f"  ack avg {s.avg_ack * 1000:.0f} ms  max {s.max_ack * 1000:.0f} ms"
+            for name, s in guard.worst(limit=len(guard.stats))
+        ]
+        header = f"Deferring after {guard.defer_after:.1f}s ({'enabled' if guard.enabled else 'disabled'})\n\n"
+        pages = TextPageSource(header + "\n\n".join(lines), code_block=True).getPages()
+        view = PaginatorView(pages, ctx)
+        view.message = await ctx.send(pages[0], view=view)
+
+    @developer.command(
+        name="analytics",
+        help="Show the commands that took the most time in total since startup, with their call and error "
+        "counts, latency percentiles and estimated unique users and guilds.",
+        brief="Show the hottest commands.",
+    )
+    @commands.is_owner()
+    async def developer_analytics(self, ctx: commands.Context):
+        analytics = self.client.analytics
+        if not analytics.totals:
+            return await ctx.send("```diff\n-<[ No commands recorded yet. ]>-```")
+        lines = []
+        for name, s in analytics.hottest(limit=len(analytics.totals)):
+            p50, p95, p99 = (s.latency.quantile(q) for q in (0.5, 0.95, 0.99))
+            lines.append(
+                f"{name}\n"
+                f"  calls {s.calls:,}  errors {s.errors:,} ({s.errors / s.calls:.0%})  "
+                f"total {s.total_ms / 1000:,.1f}s\n"
+                f"  p50 {p50:.0f} ms  p95 {p95:.0f} ms  p99 {p99:.0f} ms  max {s.latency.max:.0f} ms\n"
+                f"  ~{s.users.count():,} users  ~{s.guilds.count():,} guilds"
+            )
+        uptime = (time.time() - analytics.started_at) / 3600
+        header = (
+            f"Since startup ({uptime:.1f}h), {format_bytes(analytics.nbytes)} in memory, "
+            f"{analytics.flushed_rows:,} rows flushed to {analytics.table}\n\n"
+        )
+        pages = TextPageSource(header + "\n\n".join(lines), code_block=True).getPages()
+        view = PaginatorView(pages, ctx)
+        view.message = await ctx.send(pages[0], view=view)
+
+    @developer.command(
+        name="proxy",
+        help="Show the REST proxy's queue depth, waits and 429s per route. The proxy is shared by every "
+        "process using the token, so this includes their requests too.",
+        brief="Show the REST proxy's queues.",
+    )
+    @commands.is_owner()
+    async def developer_proxy(self, ctx: commands.Context):
+        config = self.client.config.rest_proxy
+        if not config.enabled:
+            return await ctx.send("```diff\n-<[ The REST proxy isn't enabled. ]>-```")
+        try:
+            async with self.client.session.get(f"http://{config.host}:{config.port}/_proxy/metrics") as r:
+                r.raise_for_status()
+                metrics = await r.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return await ctx.send(f"```diff\n-<[ Couldn't reach the REST proxy: {e} ]>-```")
+        lines = [
+            f"{route}\n"
+            f"  requests {m['requests']:,}  queued {m['queued']} (max {m['max_queued']})  "
+            f"wait avg {m['avg_wait_ms']:.0f} ms, max {m['max_wait_ms']:.0f} ms\n"
+            f"  429s retried {m['rate_limited']}  rejected {m['rejected']}  upstream errors {m['errors']}"
+            for route, m in metrics["routes"].items()
+        ]
+        header = (
+            f"Forwarding to {metrics['upstream']} for {metrics['uptime'] / 3600:.1f}h, "
+            f"{metrics['buckets']} bucket(s), {metrics['global_queued']} waiting on the global limit\n\n"
+        )
+        pages = TextPageSource(header + ("\n\n".join(lines) or "No requests yet."), code_block=True).getPages()
+        view = PaginatorView(pages, ctx)
+        view.message = await ctx.send(pages[0], view=view)
+
+    @developer.group(
+        name="mem",
+        help="Memory diagnostics.",
+        brief="Memory diagnostics.",
+        invoke_without_command=True,
+    )
+    @commands.is_owner()
+    async def developer_mem(self, ctx: commands.Context):
+        memory = self.client.memory
+        rss = memory.process_rss()
+        tracing = "on" if memory.is_tracing else "off"
+        await ctx.send(
+            f"```diff\n-<[ RSS: {format_bytes(rss) if rss else 'unknown'}, "
+            f"tracemalloc: {tracing}, {len(memory.snapshots)} snapshot(s) ]>-```"
+        )
+
+    @developer_mem.command(
+        name="snapshot",
+        help="Take a tracemalloc snapshot. Starts tracing if it is off.",
+        brief="Take a tracemalloc snapshot.",
+    )
+    @commands.is_owner()
+    async def developer_mem_snapshot(
+        self, ctx: commands.Context, *, label: Optional[str] = None
+    ):
+        was_tracing = self.client.memory.is_tracing
+        entry = await asyncio.to_thread(self.client.memory.snapshot, label)
+        note = "" if was_tracing else " Tracing was off, so it was started now."
+        await ctx.send(
+            f"```diff\n-<[ Snapshot {entry.label} taken: "
+            f"{format_bytes(entry.traced_memory)} traced. ]>-```{note}"
+        )
+
+    @developer_mem.command(
+        name="diff",
+        help="Show the top growing allocation sites between two snapshots (default: the last two).",
+        brief="Diff two snapshots.",
+    )
+    @commands.is_owner()
+    async def developer_mem_diff(
+        self, ctx: commands.Context, older: int = -2, newer: int = -1
+    ):
+        memory = self.client.memory
+        try:
+            stats = await asyncio.to_thread(memory.diff, older, newer)
+        except IndexError:
+            raise commands.BadArgument(
+                "Not enough snapshots. Take at least two with `dev mem snapshot`."
+            )
+        before, after = memory.snapshots[older], memory.snapshots[newer]
+        lines = [
+            f"{before.label} -> {after.label}: "
+            f"{format_bytes(after.traced_memory - before.traced_memory)} "
+            f"over {after.taken_at - before.taken_at:.0f}s\n"
+        ]
+        for stat in stats:
+            frame = stat.traceback[0]
+            lines.append(
+                f"+{format_bytes(stat.size_diff):>10} ({stat.count_diff:+} blocks) "
+                f"{frame.filename}:{frame.lineno}"
+            )
+        pages = TextPageSource("\n".join(lines), code_block=True).getPages()
+        view = PaginatorView(pages, ctx)
+        view.message = await ctx.send(pages[0], view=view)
+
+    @developer_mem.command(
+        name="caches",
+        help="Show object counts and estimated sizes of in-process caches.",
+        brief="Show cache sizes.",
+    )
+    @commands.is_owner()
+    async def developer_mem_caches(self, ctx: commands.Context):
+        reports = self.client.memory.caches()
+        lines = [
+            f"{report.name:<24} {report.count:>10,} objects  ~{format_bytes(report.size)}"
+            for report in reports
+        ]
+        pages = TextPageSource("\n".join(lines), code_block=True).getPages()
+        view = PaginatorView(pages, ctx)
+        view.message = await ctx.send(pages[0], view=view)
+
+    @developer_mem.command(
+        name="members",
+        help="Show the compact member caches, or how many members of this server have a role.",
+        brief="Show the compact member caches.",
+    )
+    @commands.is_owner()
+    async def developer_mem_members(self, ctx: commands.Context, role: Optional[discord.Role] = None):
+        store = self.client.member_store
+        if role is not None:
+            start = time.perf_counter()
+            count = len(store.with_role(role))
+            took = (time.perf_counter() - start) * 1000
+            return await ctx.send(f"```diff\n-<[ {count:,} member(s) have {role.name} ({took:.1f} ms) ]>-```")
+
+        compact = store.compact_guilds()
+        if not compact:
+            state = "enabled" if store.enabled else "disabled"
+            return await ctx.send(f"```diff\n-<[ No compact member caches (member store {state}). ]>-```")
+        lines = [
+            f"{guild.name[:24]:<24} {len(members):>10,} members  {members.hot:>6,} hot  "
+            f"~{format_bytes(members.nbytes)}  {members.materialized:,} built  {members.evicted:,} evicted"
+            for guild, members in compact.items()
+        ]
+        pages = TextPageSource("\n".join(lines), code_block=True).getPages()
+        view = PaginatorView(pages, ctx)
+        view.message = await ctx.send(pages[0], view=view)
+
+    @staticmethod
+    def _format_replies(replies: list[BusReply]) -> str:
+        lines = []
+        for reply in sorted(replies, key=lambda r: r.node):
+            if not reply.ok:
+                lines.append(f"- {reply.node}: {reply.error}")
+            elif isinstance(reply.value, list):
+                lines.append(f"+ {reply.node}: {', '.join(map(str, reply.value)) or 'nothing'}")
+            else:
+                lines.append(f"+ {reply.node}: {reply.value}")
+        return "\n".join(lines) or "- No process answered."
+
+    @developer.group(
+        name="all",
+        help="Show every bot process on the bus with its guilds, users and latency.\n"
+        "The subcommands run a dev command in every process at once.",
+        brief="Show every bot process.",
+        invoke_without_command=True,
+    )
+    @commands.is_owner()
+    async def developer_all(self, ctx: commands.Context):
+        bus = self.client.bus
+        replies = await bus.request("stats")
+        lines, guilds, users = [], 0, 0
+        for reply in sorted(replies, key=lambda r: r.node):
+            if not reply.ok:
+                lines.append(f"- {reply.node:<32} {reply.error}")
+                continue
+            stats = reply.value
+            guilds += stats["guilds"]
+            users += stats["users"]
+            latency = f"{stats['latency'] * 1000:.0f} ms" if stats["latency"] is not None else "not ready"
+            marker = "*" if reply.node == bus.node else " "
+            lines.append(
+                f"{marker} {reply.node:<32} {stats['guilds']:>7,} guilds {stats['users']:>9,} users  {latency}"
+            )
+        if bus.transport is None:
+            transport = "local only"
+        else:
+            transport = type(bus.transport).__name__ + ("" if bus.connected else " (disconnected)")
+        header = f"{len(replies)} process(es) via {transport}\nTotal: {guilds:,} guilds, {users:,} users\n\n"
+        pages = TextPageSource(header + "\n".join(lines), code_block=True).getPages()
+        view = PaginatorView(pages, ctx)
+        view.message = await ctx.send(pages[0], view=view)
+
+    async def _extension_everywhere(self, ctx: commands.Context, action: str, name: str) -> None:
+        name = name.lower().removesuffix(".py")
+        replies = await self.client.bus.request("extensions", {"action": action, "name": name})
+        await ctx.send(f"```diff\n{self._format_replies(replies)[:1900]}\n```")
+
+    @developer_all.command(
+        name="load",
+        help="Load an extension in every bot process.",
+        brief="Load an extension everywhere.",
+    )
+    @commands.is_owner()
+    async def developer_all_load(self, ctx: commands.Context, *, extension: str):
+        await self._extension_everywhere(ctx, "load", extension)
+
+    @developer_all.command(
+        name="unload",
+        help="Unload an extension in every bot process.",
+        brief="Unload an extension everywhere.",
+    )
+    @commands.is_owner()
+    async def developer_all_unload(self, ctx: commands.Context, *, extension: str):
+        await self._extension_everywhere(ctx, "unload", extension)
+
+    @developer_all.command(
+        name="reload",
+        help="Reload an extension in every bot process.",
+        brief="Reload an extension everywhere.",
+    )
+    @commands.is_owner()
+    async def developer_all_reload(self, ctx: commands.Context, *, extension: str):
+        await self._extension_everywhere(ctx, "reload", extension)
+
+    @developer_all.command(
+        name="config",
+        help="Reload config.yml in every bot process and show the keys each one changed.",
+        brief="Reload the config everywhere.",
+    )
+    @commands.is_owner()
+    async def developer_all_config(self, ctx: commands.Context):
+        replies = await self.client.bus.request("config.reload")
+        await ctx.send(f"```diff\n{self._format_replies(replies)[:1900]}\n```")
+
+    @developer_all.command(
+        name="invalidate",
+        help="Clear a registered cache in every bot process, or only the given keys of it.",
+        brief="Clear a cache everywhere.",
+    )
+    @commands.is_owner()
+    async def developer_all_invalidate(self, ctx: commands.Context, cache: str, *keys: int):
+        data = {"name": cache, "keys": list(keys) if keys else None}
+        replies = await self.client.bus.request("cache.invalidate", data)
+        await ctx.send(f"```diff\n{self._format_replies(replies)[:1900]}\n```")
+
+    @developer.group(
+        name="config",
+        help="Show the current config (without secrets).",
+        brief="Show the current config.",
+        invoke_without_command=True,
+    )
+    @commands.is_owner()
+    async def developer_config(self, ctx: commands.Context):
+        config = self.client.config
+        text = "\n".join(
+            f"{f.name}: {getattr(config, f.name)!r}"
+            for f in dataclasses.fields(config)
+            if f.name not in ("token", "database")
+        )
+        pages = TextPageSource(text, code_block=True).getPages()
+        view = PaginatorView(pages, ctx)
+        view.message = await ctx.send(pages[0], view=view)
+
+    @developer_config.command(
+        name="reload",
+        help="Reload config.yml without restarting the bot.",
+        brief="Reload config.yml.",
+    )
+    @commands.is_owner()
+    async def developer_config_reload(self, ctx: commands.Context):
+        try:
+            changed = await self.client.config_manager.reload()
+        except ConfigError as e:
+            return await ctx.send(f"```diff\n- Config not reloaded: {e}\n```")
+        if not changed:
+            return await ctx.send("```diff\n-<[ Config unchanged. ]>-```")
+
+        restart = [k for k in changed if k.split(".")[0] in RESTART_KEYS]
+        text = "+ " + "\n+ ".join(changed)
+        if restart:
+            text += "\n\n! Restart required for: " + ", ".join(restart)
+        await ctx.send(f"```diff\n{text[:1900]}\n```")
+
     @developer.command(
         name="shell",
         help="Run something in shell.",
@@ -221,19 +786,44 @@ class Restricted(commands.Cog):
     )
     @commands.is_owner()
     async def developer_shell(self, ctx, *, command):
-        async with ctx.typing():
-            stdout, stderr = await self.run_process(command)
-
-        if stderr:
-            await ctx.message.add_reaction("❌")
-            text = f"stdout:\n{stdout}\nstderr:\n{stderr}"
-        else:
-            await ctx.message.add_reaction("✅")
-            text = stdout
+        settings = self.client.config.shell
+        process = ShellProcess(
+            command,
+            max_output=settings.output_buffer_kb * 1024,
+            timeout=settings.timeout,
+            executor=self.client.executors.io,
+        )
+        view = ProcessView(self.client, ctx, process)
+        view.message = message = await ctx.send(self._render_shell(process), view=view)
 
+        run_task = asyncio.create_task(process.run())
+        last_version = process.output.version
+        try:
+            while not run_task.done():
+                await asyncio.wait({run_task}, timeout=settings.edit_interval)
+                if run_task.done() or process.output.version == last_version:
+                    continue
+                last_version = process.output.version
+                try:
+                    await message.edit(content=self._render_shell(process))
+                except discord.HTTPException:
+                    pass
+        finally:
+            # the command can be cancelled (e.g. on shutdown) while the process is still running
+            if not run_task.done():
+                run_task.cancel()
+                process.kill()
+            view.stop()
+
+        returncode = run_task.result()
+        await ctx.message.add_reaction("✅" if returncode == 0 else "❌")
+
+        text = f"{self._render_shell_status(process)}\n{process.output.text()}"
         pages = TextPageSource(text).getPages()
-        view = PaginatorView(pages, ctx)
-        view.message = await ctx.send(pages[0], view=view)
+        if len(pages) == 1:
+            return await message.edit(content=pages[0], view=None)
+        paginator = PaginatorView(pages, ctx)
+        paginator.message = await message.edit(content=pages[0], view=paginator)
 
     @developer.command(
         name="get_emoji",
@@ -244,28 +834,100 @@ class Restricted(commands.Cog):
     @commands.is_owner()
     @commands.guild_only()
     async def gib(self, ctx, *emojis: discord.PartialEmoji):
-        new_emojis = []
+        valid = []
         for emoji in emojis:
             if not isinstance(emoji, discord.PartialEmoji):
                 self.bot.logger.warning(f"Emoji {emoji} is not a partial emoji.")
                 continue
-            url = self._partial_emoji_url(_id=emoji.id, animated=emoji.animated)
-            result = await self.grab_emoji(url)
-            try:
-                new_emoji = await ctx.guild.create_custom_emoji(
-                    name=f"{emoji.name}", image=bytes(result)
-                )
-            except Exception as e:
-                await ctx.send(
-                    "".join(tb.format_exception(type(e), e, e.__traceback__))[-2000:]
-                )
-                continue
-            new_emojis.append(new_emoji)
+            valid.append(emoji)
+
+        semaphore = asyncio.Semaphore(8)
+        async with ctx.typing():
+            results = await asyncio.gather(
+                *(self.clone_emoji(ctx.guild, emoji, semaphore) for emoji in valid),
+                return_exceptions=True,
+            )
+
+        new_emojis = [r for r in results if isinstance(r, discord.Emoji)]
+        errors = [
+            f"{emoji.name}: {type(r).__name__}: {r}"
+            for emoji, r in zip(valid, results)
+            if isinstance(r, BaseException)
+        ]
+        if errors:
+            await ctx.send(f"```diff\n- " + "\n- ".join(errors)[:1900] + "\n```")
         if new_emojis:
             await ctx.send(f"{' | '.join([str(emoji) for emoji in new_emojis])}")
         else:
             await ctx.send("No emojis were created.")
 
+    @developer.command(
+        name="profile",
+        help="Run a command under a profiler and show where the time went.",
+        brief="Profile a command.",
+    )
+    @commands.is_owner()
+    async def developer_profile(self, ctx: commands.Context, *, command_string: str):
+        message = copy.copy(ctx.message)
+        message.content = f"{ctx.prefix}{command_string}"
+        alt_ctx = await self.client.get_context(message)
+        if not alt_ctx.valid:
+            raise commands.BadArgument(f"`{command_string}` is not a valid command.")
+
+        # the command runs inside this task, so the profiler can follow its await chain
+        with CommandProfiler() as profiler:
+            await self.client.process_commands(message)
+
+        report = f"Profile of `{command_string}`\n\n{profiler.report()}"
+        pages = TextPageSource(report, code_block=True, block_prefix="").getPages()
+        stacks = discord.File(
+            io.BytesIO(profiler.collapsed_stacks().encode("utf-8")),
+            filename="profile.folded",
+        )
+        view = PaginatorView(pages, ctx)
+        view.message = await ctx.send(pages[0], view=view, file=stacks)
+
+    @developer.command(
+        name="trace",
+        help="Show the slowest recent traces of a command, stage by stage. "
+        "Without a command, lists the commands that have traces.",
+        brief="Show the slowest traces of a command.",
+    )
+    @commands.is_owner()
+    async def developer_trace(self, ctx: commands.Context, *, command: Optional[str] = None):
+        tracer = self.client.tracer
+        if command is None:
+            if not tracer.recent:
+                rate = self.client.config.tracing.sample_rate
+                return await ctx.send(f"```diff\n-<[ No traces yet (sample rate: {rate}). ]>-```")
+            lines = [
+                f"{name:<32} {len(traces):>4} traces   slowest {max(t.duration_ms for t in traces):>9.2f} ms"
+                for name, traces in sorted(tracer.recent.items())
+            ]
+            report = f"Traced commands ({tracer.exported} exported to {tracer.path})\n\n" + "\n".join(lines)
+        else:
+            obj = self.client.get_command(command)
+            name = obj.qualified_name if obj is not None else command
+            traces = tracer.slowest(name)
+            if not traces:
+                return await ctx.send(f"```diff\n- No recent traces of {name!r}.```")
+            blocks = []
+            for trace in traces:
+                start = trace.root.start_ns
+                lines = [f"{trace.duration_ms:.2f} ms  trace {trace.trace_id}"]
+                for depth, span in trace.waterfall():
+                    label = f"{'  ' * depth}{span.name}"
+                    error = f"  ! {span.error}" if span.error else ""
+                    lines.append(
+                        f"  {label:<44} +{(span.start_ns - start) / 1e6:>8.2f} {span.duration_ms:>9.2f} ms{error}"
+                    )
+                blocks.append("\n".join(lines))
+            report = f"Slowest recent traces of {name}\n\n" + "\n\n".join(blocks)
+
+        pages = TextPageSource(report, code_block=True, block_prefix="").getPages()
+        view = PaginatorView(pages, ctx)
+        view.message = await ctx.send(pages[0], view=view)
+
     @developer.command(
         name="source",
         help="Get the source code of a command.",
@@ -478,12 +1140,17 @@ class Restricted(commands.Cog):
 
     @developer.command(
         name="logs",
-        help="View/Clear the error.log file.",
-        brief="View/Clear the error.log file.",
+        help="View/Search/Clear the error.log file.\n"
+        "Usage: `dev logs [view|tail <n>|since <30m|2h|ISO time>|grep <pattern>|clear]`",
+        brief="View/Search/Clear the error.log file.",
     )
     @commands.is_owner()
     async def logs_clear(
-        self, ctx: commands.Context, *, action: Literal["clear", "view"] = "view"
+        self,
+        ctx: commands.Context,
+        action: Literal["clear", "view", "tail", "since", "grep"] = "view",
+        *,
+        argument: Optional[str] = None,
     ) -> Optional[discord.Message]:
         action = action.lower()
         log_file = "logs/error.log"
@@ -495,14 +1162,34 @@ class Restricted(commands.Cog):
                 f.write("")
             return await ctx.send("```diff\n-<[ Logs cleared. ]>-```")
 
-        with open(log_file, "r") as f:
-            lines = f.readlines()
+        if action in ("view", "tail"):
+            try:
+                count = int(argument) if argument else 300
+            except ValueError:
+                raise commands.BadArgument("The number of lines must be a number.")
+            lines = await self.client.executors.io.run(logs.tail, log_file, count)
+        elif action == "since":
+            if not argument:
+                raise commands.BadArgument("Please provide a time such as `30m` or `2h`.")
+            try:
+                when = logs.parse_since(argument)
+            except ValueError:
+                raise commands.BadArgument(f"Invalid time: `{argument}`.")
+            lines = await self.client.executors.io.run(logs.since, log_file, when)
+        else:
+            if not argument:
+                raise commands.BadArgument("Please provide a pattern to search for.")
+            try:
+                lines = await self.client.executors.io.run(logs.grep, log_file, argument)
+            except re.error as e:
+                raise commands.BadArgument(f"Invalid pattern: {e}.")
 
         if not lines:
             return await ctx.send("```diff\n-<[ No logs. ]>-```")
 
+        token = self.client.config.token
         pages = TextPageSource(
-            "".join(lines).replace(self.client.config["token"], "[TOKEN]"),
+            (line.replace(token, "[TOKEN]") + "\n" for line in lines),
             code_block=True,
         ).getPages()
 
@@ -511,32 +1198,67 @@ class Restricted(commands.Cog):
 
     @developer.command(
         name="export_db",
-        help="Export the database to an Excel file.",
+        help="Export the database to an Excel file, one sheet per table.",
         brief="Export the database to an Excel file.",
     )
-    async def _export_db(self, ctx: commands.Context, raw: bool = False) -> None:
+    async def _export_db(self, ctx: commands.Context) -> None:
         await ctx.send("```diff\n-<[ Exporting database. ]>-```")
-        export_func = partial(self.client.db.export, raw=raw)
-        io_buffer: io.BytesIO = await self.client.loop.run_in_executor(
-            None, export_func
-        )
-        filename = "manga_db_raw.db" if raw else "manga_db.xlsx"
-        await ctx.send(file=discord.File(io_buffer, filename=filename))
+        tables = {}
+        for name in await self.client.db.fetch(
+            "SELECT table_name FROM information_schema.tables "
+            "WHERE table_schema = 'public' AND table_type = 'BASE TABLE' ORDER BY table_name"
+        ):
+            name = name["table_name"]
+            columns = [
+                row["column_name"]
+                for row in await self.client.db.fetch(
+                    "SELECT column_name FROM information_schema.columns "
+                    "WHERE table_schema = 'public' AND table_name = $1 ORDER BY ordinal_position",
+                    name,
+                )
+            ]
+            quoted = ", ".join(f'"{column}"' for column in columns)
+            rows = await self.client.db.fetch(f'SELECT {quoted} FROM "{name}"')
+            # Records can't be pickled, plain tuples can
+            tables[name] = (columns, [tuple(row) for row in rows])
+        io_buffer: io.BytesIO = await self.client.executors.cpu.run(build_xlsx, tables)
+        await ctx.send(file=discord.File(io_buffer, filename="manga_db.xlsx"))
 
     @developer.command(
         name="import_db",
-        help="Import the database from an Excel file.",
+        help="Import the rows of an Excel file made by export_db. Rows that already exist are skipped.",
         brief="Import the database from an Excel file.",
     )
     async def _import_db(self, ctx: commands.Context) -> None:
+        if not ctx.message.attachments:
+            raise commands.BadArgument("Attach the Excel file to import.")
         await ctx.send("```diff\n-<[ Importing database. ]>-```")
         file_content = await ctx.message.attachments[0].read()
-        buffer_file = io.BytesIO(file_content)
-        buffer_file.seek(0)
-        await self.client.loop.run_in_executor(
-            None, self.client.db.import_data, buffer_file
-        )
-        await ctx.send("```diff\n-<[ Database imported. ]>-```")
+        try:
+            tables: dict[str, str] = await self.client.executors.cpu.run(parse_xlsx, file_content)
+        except ValueError as e:
+            raise commands.BadArgument(str(e))
+
+        existing = {
+            row["table_name"]
+            for row in await self.client.db.fetch(
+                "SELECT table_name FROM information_schema.tables "
+                "WHERE table_schema = 'public' AND table_type = 'BASE TABLE'"
+            )
+        }
+        results = []
+        for name, records in tables.items():
+            if name not in existing:
+                results.append(f"- {name}: no such table, skipped")
+                continue
+            # json_populate_recordset casts every value to its column's type
+            status = await self.client.db.execute(
+                f'INSERT INTO "{name}" SELECT * FROM json_populate_recordset(NULL::"{name}", $1::json) '
+                "ON CONFLICT DO NOTHING",
+                records,
+            )
+            results.append(f"+ {name}: {status.split()[-1]} rows imported")
+        await ctx.send("```diff\n-<[ Database imported. ]>-\n" + "\n".join(results) + "```")
 
     @developer.command(
         name="sql",
@@ -0,0 +1,351 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ..core.client import MyClient
+    from ..core.config import AnalyticsConfig
+
+import logging
+import math
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional
+
+from discord.ext import commands
+
+from .bus import pack
+from .database import DatabaseUnavailable
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS {table} (
+    resolution CHAR(1) NOT NULL,
+    bucket TIMESTAMPTZ NOT NULL,
+    node TEXT NOT NULL,
+    command TEXT NOT NULL,
+    calls INTEGER NOT NULL,
+    errors INTEGER NOT NULL,
+    total_ms DOUBLE PRECISION NOT NULL,
+    p50_ms REAL,
+    p95_ms REAL,
+    p99_ms REAL,
+    max_ms REAL,
+    users INTEGER NOT NULL,
+    guilds INTEGER NOT NULL,
+    latency BYTEA NOT NULL,
+    PRIMARY KEY (resolution, bucket, node, command)
+)
+"""
+
+# A process that flushes a bucket twice (its final flush on shutdown, then again after a quick
+# restart under a fixed node name) adds its counts to the first row. Sketches can't be merged in
+# SQL, so the row keeps the percentiles of whichever part saw more calls.
+UPSERT = """
+INSERT INTO {table} VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14)
+ON CONFLICT (resolution, bucket, node, command) DO UPDATE SET
+    calls = {table}.calls + EXCLUDED.calls,
+    errors = {table}.errors + EXCLUDED.errors,
+    total_ms = {table}.total_ms + EXCLUDED.total_ms,
+    p50_ms = CASE WHEN EXCLUDED.calls > {table}.calls THEN EXCLUDED.p50_ms ELSE {table}.p50_ms END,
+    p95_ms = CASE WHEN EXCLUDED.calls > {table}.calls THEN EXCLUDED.p95_ms ELSE {table}.p95_ms END,
+    p99_ms = CASE WHEN EXCLUDED.calls > {table}.calls THEN EXCLUDED.p99_ms ELSE {table}.p99_ms END,
+    max_ms = GREATEST({table}.max_ms, EXCLUDED.max_ms),
+    users = GREATEST({table}.users, EXCLUDED.users),
+    guilds = GREATEST({table}.guilds, EXCLUDED.guilds),
+    latency = CASE WHEN EXCLUDED.calls > {table}.calls THEN EXCLUDED.latency ELSE {table}.latency END
+"""
+
+MINUTE, HOUR = 60, 3600
+
+
+class DDSketch:
+    """
+    A latency sketch with bounded relative error (DDSketch).
+
+    Values are counted in logarithmically sized bins, so every quantile is within ``relative_accuracy``
+    of the true value, whatever the distribution. Past ``max_bins`` the lowest bins are merged,
+    which only costs accuracy at the fast end, where nobody is looking.
+    """
+
+    __slots__ = ("gamma", "_log_gamma", "max_bins", "bins", "zero_count", "count", "max")
+
+    MIN_VALUE = 1e-3  # anything faster is counted as 0
+
+    def __init__(self, relative_accuracy: float = 0.02, max_bins: int = 256):
+        self.gamma: float = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma: float = math.log(self.gamma)
+        self.max_bins: int = max_bins
+        self.bins: dict[int, int] = {}
+        self.zero_count: int = 0
+        self.count: int = 0
+        self.max: float = 0.0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        if value > self.max:
+            self.max = value
+        if value <= self.MIN_VALUE:
+            self.zero_count += 1
+            return
+        key = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[key] = self.bins.get(key, 0) + 1
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def _collapse(self) -> None:
+        keys = sorted(self.bins)
+        excess = len(keys) - self.max_bins
+        target = keys[excess]
+        for key in keys[:excess]:
+            self.bins[target] += self.bins.pop(key)
+
+    def merge(self, other: DDSketch) -> None:
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.max = max(self.max, other.max)
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return min(2 * self.gamma**key / (self.gamma + 1), self.max)
+        return self.max
+
+    def to_bytes(self) -> bytes:
+        """The bins as ``[gamma, zero count, lowest key, counts of every key from there up]``."""
+        if not self.bins:
+            return pack([self.gamma, self.zero_count, 0, []])
+        low, high = min(self.bins), max(self.bins)
+        return pack([self.gamma, self.zero_count, low, [self.bins.get(k, 0) for k in range(low, high + 1)]])
+
+
+class HyperLogLog:
+    """Estimates the number of distinct IDs added to it in ``2 ** precision`` bytes (~3% error at 10)."""
+
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision: int = 10):
+        self.precision: int = precision
+        self.registers = bytearray(1 << precision)
+
+    @staticmethod
+    def _hash(value: int) -> int:
+        # splitmix64: snowflakes share most of their bits, this spreads them over all 64
+        value = (value + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+        value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+        return value ^ (value >> 31)
+
+    def add(self, value: int) -> None:
+        hashed = self._hash(value)
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: HyperLogLog) -> None:
+        registers = self.registers
+        for i, rank in enumerate(other.registers):
+            if rank > registers[i]:
+                registers[i] = rank
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0**-r for r in self.registers)
+        if estimate <= 2.5 * m:
+            zeros = self.registers.count(0)
+            if zeros:
+                estimate = m * math.log(m / zeros)  # linear counting is better for small sets
+        return round(estimate)
+
+
+class CommandStats:
+    """Everything kept about one command in one bucket. Its size doesn't grow with the number of calls."""
+
+    __slots__ = ("calls", "errors", "total_ms", "latency", "users", "guilds")
+
+    def __init__(self, relative_accuracy: float = 0.02, precision: int = 10):
+        self.calls: int = 0
+        self.errors: int = 0
+        self.total_ms: float = 0.0
+        self.latency: DDSketch = DDSketch(relative_accuracy)
+        self.users: HyperLogLog = HyperLogLog(precision)
+        self.guilds: HyperLogLog = HyperLogLog(precision)
+
+    @property
+    def nbytes(self) -> int:
+        return 64 + len(self.latency.bins) * 72 + len(self.users.registers) + len(self.guilds.registers)
+
+    def merge(self, other: CommandStats) -> None:
+        self.calls += other.calls
+        self.errors += other.errors
+        self.total_ms += other.total_ms
+        self.latency.merge(other.latency)
+        self.users.merge(other.users)
+        self.guilds.merge(other.guilds)
+
+
+class CommandAnalytics:
+    """
+    Per-command usage statistics in fixed memory.
+
+    Every invocation updates counters, a latency sketch and unique user and guild estimates in the
+    current minute's bucket, instead of being logged. Finished minutes are merged into their hour,
+    and both are flushed as one row per command and bucket to the ``table`` through ``Database``
+    every ``flush_interval`` seconds. Buckets that can't be written are retried on the next flush,
+    keeping at most ``max_pending`` of them. ``totals`` covers everything since startup and is what
+    ``dev analytics`` shows.
+    """
+
+    def __init__(self, bot: MyClient):
+        self.bot: MyClient = bot
+        self.enabled: bool = True
+        self.table: str = "command_stats"
+        self.flush_interval: float = 60.0
+        self.relative_accuracy: float = 0.02
+        self.precision: int = 10
+        self.totals: dict[str, CommandStats] = {}
+        self.started_at: float = time.time()
+        self.flushed_rows: int = 0
+        self._minute: Optional[int] = None
+        self._minute_stats: dict[str, CommandStats] = {}
+        self._hours: dict[int, dict[str, CommandStats]] = {}
+        self._pending: deque[tuple[str, int, dict[str, CommandStats]]] = deque(maxlen=120)
+        self._created_table: bool = False
+        self._logger = logging.getLogger("analytics")
+
+    def load_config(self, config: AnalyticsConfig) -> None:
+        self.enabled = config.enabled
+        self.table = config.table
+        self.flush_interval = config.flush_interval
+        self.relative_accuracy = config.relative_accuracy
+        self.precision = config.hll_precision
+        if self._pending.maxlen != config.max_pending:
+            self._pending = deque(self._pending, maxlen=config.max_pending)
+
+    def start(self) -> None:
+        self.bot.scheduler.every("analytics.flush", self.flush, self.flush_interval)
+
+    def __len__(self) -> int:
+        return len(self.totals)
+
+    @property
+    def nbytes(self) -> int:
+        buckets = [self.totals, self._minute_stats, *self._hours.values(), *(s for _, _, s in self._pending)]
+        return sum(stats.nbytes for bucket in buckets for stats in bucket.values())
+
+    def _new_stats(self) -> CommandStats:
+        return CommandStats(self.relative_accuracy, self.precision)
+
+    # recording
+
+    def command_finished(self, ctx: commands.Context, took: float, *, failed: bool = False) -> None:
+        """Records an invocation that took ``took`` milliseconds. Called by ``MyClient.invoke``."""
+        if not self.enabled or ctx.command is None:
+            return
+        name = ctx.command.qualified_name
+        now = int(time.time())
+        self._roll(now - now % MINUTE)
+        for bucket in (self._minute_stats, self.totals):
+            stats = bucket.get(name)
+            if stats is None:
+                stats = bucket[name] = self._new_stats()
+            stats.calls += 1
+            stats.errors += failed
+            stats.total_ms += took
+            stats.latency.add(took)
+            stats.users.add(ctx.author.id)
+            if ctx.guild is not None:
+                stats.guilds.add(ctx.guild.id)
+
+    def _roll(self, minute: int) -> None:
+        """Closes the current minute if ``minute`` is a later one, and any hour that ended with it."""
+        if self._minute == minute:
+            return
+        if self._minute is not None and self._minute_stats:
+            self._pending.append(("m", self._minute, self._minute_stats))
+            hour = self._hours.setdefault(self._minute - self._minute % HOUR, {})
+            for name, stats in self._minute_stats.items():
+                if name not in hour:
+                    hour[name] = self._new_stats()
+                hour[name].merge(stats)
+        self._minute, self._minute_stats = minute, {}
+        for start in [h for h in self._hours if h + HOUR <= minute]:
+            self._pending.append(("h", start, self._hours.pop(start)))
+
+    # flushing
+
+    def _rows(self, resolution: str, start: int, bucket: dict[str, CommandStats]) -> list[tuple]:
+        timestamp = datetime.fromtimestamp(start, tz=timezone.utc)
+        node = self.bot.bus.node
+        return [
+            (
+                resolution,
+                timestamp,
+                node,
+                name,
+                stats.calls,
+                stats.errors,
+                stats.total_ms,
+                stats.latency.quantile(0.5),
+                stats.latency.quantile(0.95),
+                stats.latency.quantile(0.99),
+                stats.latency.max,
+                stats.users.count(),
+                stats.guilds.count(),
+                stats.latency.to_bytes(),
+            )
+            for name, stats in bucket.items()
+        ]
+
+    async def flush(self, *, final: bool = False) -> int:
+        """
+        Writes the finished buckets to the database.
+
+        Parameters:
+            final: Also writes the current minute and hours, for when the bot is shutting down.
+
+        Returns:
+            The number of buckets that are still waiting to be written.
+        """
+        now = int(time.time())
+        self._roll(now - now % MINUTE)
+        if final:
+            self._roll(now - now % MINUTE + HOUR)  # closes the current minute and every hour
+            self._minute = None
+        db = self.bot.db
+        if not self._pending or db is None or db.pool is None:
+            return len(self._pending)
+        try:
+            if not self._created_table:
+                await db.execute(CREATE_TABLE.format(table=self.table))
+                self._created_table = True
+            query = UPSERT.format(table=self.table)
+            while self._pending:
+                resolution, start, bucket = self._pending[0]
+                rows = self._rows(resolution, start, bucket)
+                await db.executemany(query, rows)
+                self._pending.popleft()
+                self.flushed_rows += len(rows)
+        except DatabaseUnavailable as e:
+            self._logger.warning(f"Couldn't flush {len(self._pending)} analytics bucket(s), retrying later: {e}")
+        except Exception as e:
+            self._logger.error(f"Flushing analytics failed: {type(e).__name__}: {e}")
+        return len(self._pending)
+
+    def hottest(self, limit: int = 20) -> list[tuple[str, CommandStats]]:
+        """The commands that took the most time in total since startup."""
+        return sorted(self.totals.items(), key=lambda kv: kv[1].total_ms, reverse=True)[:limit]
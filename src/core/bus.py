@@ -0,0 +1,765 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ..core.client import MyClient
+    from ..core.config import BusConfig
+
+import asyncio
+import base64
+import inspect
+import itertools
+import logging
+import os
+import socket
+import struct
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional, Union
+
+from discord.ext import commands
+
+# message encoding
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: memoryview, position: int) -> tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+def _pack_into(out: bytearray, value: Any) -> None:
+    if value is None:
+        out += b"N"
+    elif value is True:
+        out += b"T"
+    elif value is False:
+        out += b"F"
+    elif isinstance(value, int):
+        out += b"i"
+        _write_varint(out, (value << 1) if value >= 0 else ((-value << 1) - 1))  # zigzag
+    elif isinstance(value, float):
+        out += b"d" + struct.pack("<d", value)
+    elif isinstance(value, str):
+        raw = value.encode("utf-8")
+        out += b"s"
+        _write_varint(out, len(raw))
+        out += raw
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        out += b"b"
+        _write_varint(out, len(value))
+        out += value
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        out += b"l"
+        _write_varint(out, len(value))
+        for item in value:
+            _pack_into(out, item)
+    elif isinstance(value, dict):
+        out += b"m"
+        _write_varint(out, len(value))
+        for key, item in value.items():
+            _pack_into(out, key)
+            _pack_into(out, item)
+    else:
+        raise TypeError(f"Can't send {type(value).__name__} over the bus.")
+
+
+def pack(value: Any) -> bytes:
+    """
+    Encodes ``None``, booleans, ints, floats, strings, bytes, lists (and tuples and sets) and dicts
+    of those as a compact tagged binary value.
+
+    Raises:
+        TypeError: If the value contains anything else.
+    """
+    out = bytearray()
+    _pack_into(out, value)
+    return bytes(out)
+
+
+def _unpack_from(data: memoryview, position: int) -> tuple[Any, int]:
+    tag = data[position]
+    position += 1
+    if tag == 0x4E:  # N
+        return None, position
+    if tag == 0x54:  # T
+        return True, position
+    if tag == 0x46:  # F
+        return False, position
+    if tag == 0x69:  # i
+        raw, position = _read_varint(data, position)
+        return (raw >> 1) if not raw & 1 else -((raw + 1) >> 1), position
+    if tag == 0x64:  # d
+        return struct.unpack_from("<d", data, position)[0], position + 8
+    if tag in (0x73, 0x62):  # s, b
+        length, position = _read_varint(data, position)
+        raw = bytes(data[position : position + length])
+        return (raw.decode("utf-8") if tag == 0x73 else raw), position + length
+    if tag == 0x6C:  # l
+        count, position = _read_varint(data, position)
+        items = []
+        for _ in range(count):
+            item, position = _unpack_from(data, position)
+            items.append(item)
+        return items, position
+    if tag == 0x6D:  # m
+        count, position = _read_varint(data, position)
+        mapping = {}
+        for _ in range(count):
+            key, position = _unpack_from(data, position)
+            mapping[key] = None
+            mapping[key], position = _unpack_from(data, position)
+        return mapping, position
+    raise ValueError(f"Unknown tag {tag:#x} at byte {position - 1}.")
+
+
+def unpack(data: Union[bytes, memoryview]) -> Any:
+    """Decodes a value encoded by ``pack``."""
+    value, _ = _unpack_from(memoryview(data), 0)
+    return value
+
+
+# frames
+
+PUBLISH, REQUEST, RESPONSE, ACK, HELLO, SUBSCRIBE, UNSUBSCRIBE = range(1, 8)
+MAX_FRAME = 16 * 1024 * 1024
+# kind, flags, request ID, sender length, topic length. The payload is the rest of the frame.
+_FRAME_HEADER = struct.Struct("<BBIBH")
+_LENGTH = struct.Struct("<I")
+
+
+@dataclass
+class Frame:
+    kind: int
+    sender: str
+    topic: str = ""  # the target node for responses
+    id: int = 0
+    flags: int = 0
+    payload: bytes = b""
+
+    def encode(self) -> bytes:
+        sender, topic = self.sender.encode("utf-8"), self.topic.encode("utf-8")
+        body = _FRAME_HEADER.pack(self.kind, self.flags, self.id, len(sender), len(topic)) + sender + topic
+        return _LENGTH.pack(len(body) + len(self.payload)) + body + self.payload
+
+    @classmethod
+    def decode(cls, body: bytes) -> Frame:
+        kind, flags, request_id, sender_length, topic_length = _FRAME_HEADER.unpack_from(body, 0)
+        position = _FRAME_HEADER.size
+        sender = body[position : position + sender_length].decode("utf-8")
+        position += sender_length
+        topic = body[position : position + topic_length].decode("utf-8")
+        position += topic_length
+        return cls(kind, sender, topic, request_id, flags, body[position:])
+
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple[Frame, bytes]:
+    """Reads one frame, and returns it along with its raw bytes for forwarding."""
+    header = await reader.readexactly(_LENGTH.size)
+    (length,) = _LENGTH.unpack(header)
+    if length > MAX_FRAME:
+        raise ValueError(f"Frame of {length} bytes is too large.")
+    body = await reader.readexactly(length)
+    return Frame.decode(body), header + body
+
+
+# broker
+
+
+class BusBroker:
+    """
+    Routes frames between the processes connected to a Unix domain socket.
+
+    Published frames and requests go to every other process subscribed to their topic, and the
+    requester is told how many that was (``ACK``) so it knows how many responses to wait for. Each
+    process answers a request with one response, holding the replies of all its handlers.
+    Responses go to the process named in their topic. Processes that stop reading are disconnected
+    instead of buffering for them forever.
+    """
+
+    def __init__(self, path: str, *, max_buffer: int = 8 * 1024 * 1024):
+        self.path: str = path
+        self.max_buffer: int = max_buffer
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._nodes: dict[str, asyncio.StreamWriter] = {}
+        self._topics: dict[str, set[str]] = {}
+        self._handlers: set[asyncio.Task] = set()
+        self._logger = logging.getLogger("bus.broker")
+
+    @property
+    def nodes(self) -> list[str]:
+        return list(self._nodes)
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_unix_server(self._handle, self.path)
+        # The socket is created under the umask. Nobody else can connect before the chmod, since
+        # UnixTransport keeps it in a directory only this user can enter.
+        os.chmod(self.path, 0o600)
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for writer in self._nodes.values():
+                writer.close()
+            if self._handlers:
+                await asyncio.wait(self._handlers, timeout=1)
+            await self._server.wait_closed()
+            self._server = None
+
+    def _send(self, node: str, raw: bytes) -> None:
+        writer = self._nodes.get(node)
+        if writer is None:
+            return
+        if writer.transport.get_write_buffer_size() > self.max_buffer:
+            self._logger.warning(f"Disconnecting {node}, it isn't reading its messages.")
+            writer.close()
+            return
+        writer.write(raw)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        node = None
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            while True:
+                frame, raw = await read_frame(reader)
+                if frame.kind == HELLO:
+                    node = frame.sender
+                    self._nodes[node] = writer
+                elif frame.kind == SUBSCRIBE:
+                    self._topics.setdefault(frame.topic, set()).add(frame.sender)
+                elif frame.kind == UNSUBSCRIBE:
+                    self._topics.get(frame.topic, set()).discard(frame.sender)
+                elif frame.kind in (PUBLISH, REQUEST):
+                    targets = [n for n in self._topics.get(frame.topic, ()) if n != frame.sender]
+                    for target in targets:
+                        self._send(target, raw)
+                    if frame.kind == REQUEST:
+                        ack = Frame(ACK, "broker", frame.sender, frame.id, payload=pack(len(targets)))
+                        self._send(frame.sender, ack.encode())
+                elif frame.kind == RESPONSE:
+                    self._send(frame.topic, raw)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            if node is not None and self._nodes.get(node) is writer:
+                del self._nodes[node]
+                for subscribers in self._topics.values():
+                    subscribers.discard(node)
+            writer.close()
+            self._handlers.discard(task)
+
+
+# transports
+
+
+class UnixTransport:
+    """
+    Connects to the broker's Unix domain socket. If nothing is listening, the process that gets the
+    lock file next to the socket starts the broker itself, so there's no separate process to run.
+    When the broker's process exits, the others reconnect and one of them takes over.
+
+    Anyone who can connect to the socket can load and unload extensions and reload the config of
+    every process, so the socket's directory must only be accessible by the user running the bot.
+    It's created with mode 0700, and the bus refuses to start if it's accessible by anyone else.
+    """
+
+    def __init__(self, bus: Bus, path: str):
+        self.bus: Bus = bus
+        self.path: str = path
+        self.broker: Optional[BusBroker] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock_fd: Optional[int] = None
+        self._connected = asyncio.Event()
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    def _make_directory(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        info = os.stat(directory)
+        if info.st_uid != os.getuid() or info.st_mode & 0o077:
+            raise RuntimeError(
+                f"{directory} must only be accessible by the user running the bot (chmod 700), "
+                "anyone who can connect to the bus controls the bot."
+            )
+
+    async def start(self) -> None:
+        self._make_directory()
+        self._task = asyncio.create_task(self._run(), name="bus-unix")
+        try:
+            await asyncio.wait_for(self._connected.wait(), 5)
+        except asyncio.TimeoutError:
+            self.bus.logger.warning(f"Couldn't connect to the bus at {self.path} yet, retrying in the background.")
+
+    def _try_become_broker(self) -> bool:
+        import fcntl  # the Unix transport only exists on Unix
+
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def _connect(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        try:
+            return await asyncio.open_unix_connection(self.path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            if self.broker is None and self._try_become_broker():
+                if os.path.exists(self.path):
+                    os.unlink(self.path)  # left behind by a broker that died
+                self.broker = BusBroker(self.path)
+                await self.broker.start()
+                self.bus.logger.info(f"Started the bus broker at {self.path}.")
+                return await asyncio.open_unix_connection(self.path)
+            raise
+
+    async def _run(self) -> None:
+        delay = 0.1
+        while True:
+            try:
+                reader, writer = await self._connect()
+            except OSError:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+                continue
+            delay = 0.1
+            self._writer = writer
+            writer.write(Frame(HELLO, self.bus.node).encode())
+            for topic in self.bus.topics:
+                writer.write(Frame(SUBSCRIBE, self.bus.node, topic).encode())
+            self._connected.set()
+            try:
+                while True:
+                    frame, _ = await read_frame(reader)
+                    self.bus.dispatch(frame)
+            except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+                self.bus.logger.warning("Lost the connection to the bus broker, reconnecting.")
+            finally:
+                self._connected.clear()
+                self._writer = None
+                writer.close()
+
+    def send(self, frame: Frame) -> bool:
+        """
+        Raises:
+            ValueError: If the frame is larger than the broker accepts.
+        """
+        if self._writer is None:
+            return False
+        data = frame.encode()
+        if len(data) - _LENGTH.size > MAX_FRAME:
+            raise ValueError(f"Bus messages are limited to {MAX_FRAME // (1024 * 1024)} MB (topic {frame.topic!r}).")
+        self._writer.write(data)
+        return True
+
+    def subscribe(self, topic: str) -> None:
+        self.send(Frame(SUBSCRIBE, self.bus.node, topic))
+
+    def unsubscribe(self, topic: str) -> None:
+        self.send(Frame(UNSUBSCRIBE, self.bus.node, topic))
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.broker is not None:
+            await self.broker.close()
+            self.broker = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+
+class PostgresTransport:
+    """
+    Sends frames with ``NOTIFY`` on one channel, which every process ``LISTEN``s to. It needs no
+    broker, but NOTIFY payloads are limited to 8000 bytes and there's no ``ACK``, so requests always
+    wait for their timeout unless the caller says how many processes to expect. Every process
+    answers every request, with no replies if it has no handlers for the topic.
+
+    Frames aren't authenticated: any role that can ``NOTIFY`` on the channel, which by default is
+    any role that can connect to the database, can load and unload extensions and reload the
+    config of every process. Only use this transport on a database no one else can connect to.
+    """
+
+    MAX_PAYLOAD = 7999
+    PING_INTERVAL = 30.0  # how often an idle connection is checked, since LISTEN alone never notices a dead one
+
+    def __init__(self, bus: Bus, channel: str):
+        self.bus: Bus = bus
+        self.channel: str = channel
+        self._connection = None
+        self._task: Optional[asyncio.Task] = None
+        self._sends: set[asyncio.Task] = set()
+        self._lock = asyncio.Lock()  # a connection runs one query at a time
+        self._connected = asyncio.Event()
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set() and self._connection is not None and not self._connection.is_closed()
+
+    async def start(self) -> None:
+        if self.bus.bot.config.database is None:
+            raise RuntimeError("The postgres bus transport needs the 'database' section of config.yml.")
+        self._task = asyncio.create_task(self._run(), name="bus-postgres")
+        try:
+            await asyncio.wait_for(self._connected.wait(), 5)
+        except asyncio.TimeoutError:
+            self.bus.logger.warning("Couldn't connect to the bus through postgres yet, retrying in the background.")
+
+    async def _connect(self):
+        import asyncpg
+
+        config = self.bus.bot.config.database
+        connection = await asyncpg.connect(
+            host=config.ip, port=config.port, user=config.username, password=config.password, timeout=10
+        )
+        await connection.add_listener(self.channel, self._on_notify)
+        return connection
+
+    async def _run(self) -> None:
+        import asyncpg
+
+        errors = (OSError, asyncpg.PostgresError, asyncpg.InterfaceError, asyncio.TimeoutError)
+        delay = 0.1
+        while True:
+            try:
+                connection = await self._connect()
+            except errors as e:
+                self.bus.logger.debug(f"Couldn't connect to the bus through postgres: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+                continue
+            delay = 0.1
+            lost = asyncio.Event()
+            connection.add_termination_listener(lambda _: lost.set())
+            self._connection = connection
+            self._connected.set()
+            try:
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), self.PING_INTERVAL)
+                    except asyncio.TimeoutError:
+                        async with self._lock:
+                            await connection.execute("SELECT 1", timeout=10)
+            except errors:
+                pass
+            finally:
+                self._connected.clear()
+                self._connection = None
+                connection.terminate()
+            self.bus.logger.warning("Lost the bus's postgres connection, reconnecting.")
+
+    def _on_notify(self, _connection, _pid, _channel, payload: str) -> None:
+        try:
+            frame = Frame.decode(base64.b64decode(payload)[_LENGTH.size :])
+        except (ValueError, struct.error, UnicodeDecodeError):
+            return
+        if frame.sender != self.bus.node:
+            self.bus.dispatch(frame)
+
+    async def _notify(self, connection, payload: str, topic: str) -> None:
+        try:
+            async with self._lock:
+                await connection.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+        except Exception as e:
+            self.bus.logger.error(f"Couldn't send {topic!r} through the postgres bus: {type(e).__name__}: {e}")
+
+    def send(self, frame: Frame) -> bool:
+        """
+        Raises:
+            ValueError: If the frame is too large for a ``NOTIFY``.
+        """
+        if not self.connected:
+            return False
+        payload = base64.b64encode(frame.encode()).decode("ascii")
+        if len(payload) > self.MAX_PAYLOAD:
+            raise ValueError(f"Bus messages sent through postgres are limited to ~6 KB (topic {frame.topic!r}).")
+        task = asyncio.create_task(self._notify(self._connection, payload, frame.topic), name="bus-notify")
+        self._sends.add(task)
+        task.add_done_callback(self._sends.discard)
+        return True
+
+    def subscribe(self, topic: str) -> None:
+        pass
+
+    def unsubscribe(self, topic: str) -> None:
+        pass
+
+    async def close(self) -> None:
+        if self._sends:
+            await asyncio.wait(self._sends, timeout=5)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+# the bus
+
+Handler = Callable[[Any, str], Union[Any, Awaitable[Any]]]
+
+
+@dataclass
+class BusReply:
+    node: str
+    value: Any = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class _Subscription:
+    handler: Handler
+    owner: Any
+
+
+class _PendingRequest:
+    def __init__(self, expected: Optional[int]):
+        self.replies: list[BusReply] = []
+        self.responses: int = 0  # one per process, however many handlers it has
+        self.expected: Optional[int] = expected
+        self.done = asyncio.Event()
+
+    def add(self, node: str, results: list) -> None:
+        self.responses += 1
+        for value, error in results:
+            self.replies.append(BusReply(node, error=error) if error is not None else BusReply(node, unpack(value)))
+        self._check()
+
+    def set_expected(self, count: int) -> None:
+        if self.expected is None:
+            self.expected = count
+        self._check()
+
+    def _check(self) -> None:
+        if self.expected is not None and self.responses >= self.expected:
+            self.done.set()
+
+
+class Bus:
+    """
+    A publish/subscribe bus between the bot's processes.
+
+    ``publish`` delivers a message to the handlers subscribed to its topic in every process, this
+    one included. ``request`` does the same and collects each handler's return value, for aggregate
+    queries like the total guild count. Without a transport (the default), both only reach this
+    process, so code using the bus works the same with one process or many.
+
+    Handlers are called with the decoded data and the sender's node name. Handlers that are methods
+    of a cog are removed when the cog is.
+    """
+
+    def __init__(self, bot: MyClient):
+        self.bot: MyClient = bot
+        self.node: str = f"{socket.gethostname()}:{os.getpid()}"
+        self.request_timeout: float = 2.0
+        self.transport: Optional[Union[UnixTransport, PostgresTransport]] = None
+        self.logger = logging.getLogger("bus")
+        self._subscriptions: dict[str, list[_Subscription]] = {}
+        self._pending: dict[int, _PendingRequest] = {}
+        self._ids = itertools.count(1)
+        self._config: Optional[BusConfig] = None
+
+    def load_config(self, config: BusConfig) -> None:
+        self._config = config
+        self.request_timeout = config.request_timeout
+        if config.node:
+            self.node = config.node
+
+    @property
+    def topics(self) -> list[str]:
+        return [topic for topic, subscriptions in self._subscriptions.items() if subscriptions]
+
+    @property
+    def connected(self) -> bool:
+        return self.transport is not None and self.transport.connected
+
+    async def start(self) -> None:
+        config = self._config
+        if config is None or config.transport == "none":
+            return
+        if config.transport == "unix":
+            if not hasattr(socket, "AF_UNIX") or os.name == "nt":
+                self.logger.error("The unix bus transport isn't available on this platform.")
+                return
+            self.transport = UnixTransport(self, config.socket)
+        elif config.transport == "postgres":
+            self.transport = PostgresTransport(self, config.channel)
+        else:
+            self.logger.error(f"Unknown bus transport {config.transport!r}, the bus only reaches this process.")
+            return
+        try:
+            await self.transport.start()
+        except Exception as e:
+            self.logger.error(f"Couldn't start the {config.transport} bus transport: {e}")
+            self.transport = None
+            return
+        self.logger.info(f"Joined the bus as {self.node} ({config.transport}).")
+
+    async def close(self) -> None:
+        if self.transport is not None:
+            await self.transport.close()
+            self.transport = None
+        for pending in self._pending.values():
+            pending.done.set()
+
+    def subscribe(self, topic: str, handler: Handler, *, owner: Any = None) -> None:
+        if owner is None and isinstance(getattr(handler, "__self__", None), commands.Cog):
+            owner = handler.__self__
+        subscriptions = self._subscriptions.setdefault(topic, [])
+        if not subscriptions and self.transport is not None:
+            self.transport.subscribe(topic)
+        subscriptions.append(_Subscription(handler, owner))
+
+    def unsubscribe(self, topic: str, handler: Handler) -> None:
+        subscriptions = self._subscriptions.get(topic, [])
+        subscriptions[:] = [s for s in subscriptions if s.handler != handler]
+        if not subscriptions and self.transport is not None:
+            self.transport.unsubscribe(topic)
+
+    def unsubscribe_owner(self, owner: Any) -> int:
+        """Removes every handler that belongs to ``owner``. Returns how many were removed."""
+        removed = 0
+        for topic, subscriptions in self._subscriptions.items():
+            kept = [s for s in subscriptions if s.owner is not owner]
+            removed += len(subscriptions) - len(kept)
+            if subscriptions and not kept and self.transport is not None:
+                self.transport.unsubscribe(topic)
+            subscriptions[:] = kept
+        return removed
+
+    async def publish(self, topic: str, data: Any = None, *, local: bool = True) -> None:
+        """
+        Sends ``data`` to every process subscribed to ``topic``.
+
+        Raises:
+            TypeError: If ``data`` can't be encoded.
+            ValueError: If the message is too large for the transport.
+        """
+        payload = pack(data)
+        if self.transport is not None and not self.transport.send(Frame(PUBLISH, self.node, topic, payload=payload)):
+            self.logger.warning(f"Not connected to the bus, {topic!r} only reached this process.")
+        if local:
+            for subscription in list(self._subscriptions.get(topic, ())):
+                await self._call(subscription.handler, unpack(payload), self.node, topic)
+
+    async def request(
+        self,
+        topic: str,
+        data: Any = None,
+        *,
+        timeout: Optional[float] = None,
+        expected: Optional[int] = None,
+        local: bool = True,
+    ) -> list[BusReply]:
+        """
+        Sends ``data`` to the handlers of ``topic`` in every process and collects their results.
+
+        Parameters:
+            topic: The topic to send to.
+            data: The request's data.
+            timeout: How long to wait for responses, ``request-timeout`` from the config by default.
+            expected: How many other processes to wait for. The broker reports this itself,
+                otherwise the request waits for the full timeout.
+            local: Whether this process's handlers answer too.
+
+        Returns:
+            A reply per handler that answered in time, including errors raised by handlers.
+        """
+        payload = pack(data)
+        request_id = next(self._ids)
+        pending = _PendingRequest(expected)
+        replies = []
+        if self.transport is not None:
+            self._pending[request_id] = pending
+            if not self.transport.send(Frame(REQUEST, self.node, topic, request_id, payload=payload)):
+                pending.set_expected(0)
+        else:
+            pending.set_expected(0)
+        try:
+            if local:
+                for subscription in list(self._subscriptions.get(topic, ())):
+                    replies.append(await self._answer(subscription.handler, unpack(payload), self.node, topic))
+            try:
+                await asyncio.wait_for(pending.done.wait(), timeout or self.request_timeout)
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            self._pending.pop(request_id, None)
+        return replies + pending.replies
+
+    # incoming
+
+    def dispatch(self, frame: Frame) -> None:
+        if frame.kind == PUBLISH:
+            for subscription in list(self._subscriptions.get(frame.topic, ())):
+                asyncio.create_task(self._call(subscription.handler, unpack(frame.payload), frame.sender, frame.topic))
+        elif frame.kind == REQUEST:
+            asyncio.create_task(self._respond(frame))
+        elif frame.kind in (RESPONSE, ACK):
+            pending = self._pending.get(frame.id)
+            if pending is None or frame.topic != self.node:
+                return
+            if frame.kind == ACK:
+                pending.set_expected(unpack(frame.payload))
+            else:
+                pending.add(frame.sender, unpack(frame.payload))
+
+    async def _respond(self, frame: Frame) -> None:
+        # A single response, even with no handlers left, since the broker's ACK counts processes.
+        # Each result is [packed value, None] or [None, error].
+        results = []
+        for subscription in list(self._subscriptions.get(frame.topic, ())):
+            reply = await self._answer(subscription.handler, unpack(frame.payload), frame.sender, frame.topic)
+            if reply.ok:
+                try:
+                    results.append([pack(reply.value), None])
+                    continue
+                except TypeError as e:
+                    reply = BusReply(self.node, error=str(e))
+            results.append([None, reply.error])
+        if self.transport is None:
+            return
+        try:
+            self.transport.send(Frame(RESPONSE, self.node, frame.sender, frame.id, payload=pack(results)))
+        except ValueError as e:  # too large for the transport
+            errors = [[None, f"The response is too large to send: {e}"]] * len(results)
+            self.transport.send(Frame(RESPONSE, self.node, frame.sender, frame.id, payload=pack(errors)))
+
+    async def _answer(self, handler: Handler, data: Any, sender: str, topic: str) -> BusReply:
+        try:
+            result = handler(data, sender)
+            if inspect.isawaitable(result):
+                result = await result
+        except Exception as e:
+            self.logger.error(f"Bus handler for {topic!r} failed: {type(e).__name__}: {e}")
+            return BusReply(self.node, error=f"{type(e).__name__}: {e}")
+        return BusReply(self.node, result)
+
+    async def _call(self, handler: Handler, data: Any, sender: str, topic: str) -> None:
+        await self._answer(handler, data, sender, topic)
@@ -1,6 +1,8 @@
+import contextlib
 import io
 import logging
 import os
+import time
 from typing import Optional, Union
 
 import aiohttp
@@ -9,7 +11,21 @@ from discord import Intents
 from discord.ext import commands
 
 from ..utils.static import Emotes
+from .analytics import CommandAnalytics
+from .bus import Bus
+from .command_sync import CommandSyncer
+from .config import BotConfig, ConfigManager
 from .database import Database
+from .diagnostics import MemoryDiagnostics
+from .executors import Executors
+from .interactions import GuardedCommandTree, InteractionGuard
+from .member_store import MemberStore
+from .recorder import GatewayRecorder
+from .scheduler import JobScheduler
+from .shutdown import Drainer
+from .tracing import Tracer
+from .warm_cache import WarmCache
+from .view_manager import ViewManager
 
 
 class MyClient(commands.Bot):
@@ -17,6 +33,9 @@ class MyClient(commands.Bot):
     def __init__(
         self, prefix: str = "!", intents: Intents = Intents.default(), *args, **kwargs
     ):
+        # Bot.__init__ already adds the help command, which add_command() instruments
+        self.tracer: Tracer = Tracer(self)
+        kwargs.setdefault("tree_cls", GuardedCommandTree)
         # noinspection PyTypeChecker
         super().__init__(
             command_prefix=commands.when_mentioned_or(prefix or "!"),
@@ -24,10 +43,28 @@ class MyClient(commands.Bot):
             *args,
             **kwargs,
         )
-        self._config = None
+        self._config: Optional[ConfigManager] = None
         self.test_guild_ids = None
         self.db: Database = None
         self._logger: logging.Logger = logging.getLogger("bot")
+        self.view_manager: ViewManager = ViewManager(self)
+        self.interactions: InteractionGuard = InteractionGuard(self)
+        self.memory: MemoryDiagnostics = MemoryDiagnostics(self)
+        self.command_syncer: CommandSyncer = CommandSyncer(self)
+        self.scheduler: JobScheduler = JobScheduler(self)
+        self.executors: Executors = Executors()
+        self.recorder: GatewayRecorder = GatewayRecorder(self)
+        self.member_store: MemberStore = MemberStore(self)
+        self.memory.register_cache("compact members", self.member_store)
+        self.warm_cache: WarmCache = WarmCache(self)
+        self.bus: Bus = Bus(self)
+        self.analytics: CommandAnalytics = CommandAnalytics(self)
+        self.memory.register_cache("command analytics", self.analytics)
+        self.drainer: Drainer = Drainer(self)
+        self.bus.subscribe("stats", self._bus_stats)
+        self.bus.subscribe("extensions", self._bus_extensions)
+        self.bus.subscribe("config.reload", self._bus_config_reload)
+        self.bus.subscribe("cache.invalidate", self._bus_cache_invalidate)
 
         # Placeholder values. These are set in .setup_hook() below
         self._session: aiohttp.ClientSession = None
@@ -36,8 +73,37 @@ class MyClient(commands.Bot):
         self._debug_mode: bool = False
 
     async def setup_hook(self):
-        self.db = Database(self)  # must be initialized after config is initialized
-        self.loop.create_task(self.update_restart_message())
+        self._session = aiohttp.ClientSession()
+        if self.db is None:  # the database extension sets this when it's loaded
+            self.db = Database(self)
+        self.scheduler.start()
+        self.warm_cache.load()
+        self.bus.load_config(self.config.bus)
+        await self.bus.start()
+        self.analytics.start()
+        self.view_manager.start()
+        self.recorder.load_config(self.config.recorder)
+        self.member_store.load_config(self.config.member_store)
+        self.tracer.instrument_http(self.http)
+        self.tracer.start()
+        self.scheduler.once("update-restart-message", self.update_restart_message)
+        if self.config.command_sync.auto:
+            self.scheduler.once("auto-sync-commands", self.auto_sync_commands)
+        if self.config.hot_reload.watch:
+            self._config.start_watching(self.config.hot_reload.interval)
+
+    async def auto_sync_commands(self):
+        """Syncs the command tree on startup, skipping every scope whose commands didn't change."""
+        scopes = [None]
+        if self.debug and self.test_guild_ids:
+            scopes.extend(discord.Object(id=x) for x in self.test_guild_ids)
+        results = await self.command_syncer.sync(scopes)
+        synced = [r.scope_name for r in results if r.synced]
+        failed = [r.scope_name for r in results if r.error is not None]
+        self._logger.info(
+            f"Command sync: {len(synced)} scope(s) synced, "
+            f"{len(results) - len(synced) - len(failed)} unchanged, {len(failed)} failed."
+        )
 
     async def update_restart_message(self):
         await self.wait_until_ready()
@@ -64,19 +130,88 @@ class MyClient(commands.Bot):
             em.description = f"{Emotes.success} `Bot is now online.`"
             return await msg.edit(embed=em)
 
-    def load_config(self, config: dict):
-        self.owner_ids = config["constants"].get("owner-ids", [self.owner_id])
-        self.test_guild_ids = config["constants"].get("test-guild-ids")
-        self.log_channel_id: int = config["constants"].get("log-channel-id")
-        self._debug_mode: bool = config.get("debug", False)
+    def load_config(self, config: ConfigManager):
+        self._config = config
+        self._apply_config(None, config.current)
+        config.subscribe(
+            (
+                "constants",
+                "debug",
+                "prefix",
+                "views",
+                "interactions",
+                "diagnostics",
+                "command-sync",
+                "hot-reload",
+                "recorder",
+                "member-store",
+                "warm-cache",
+                "tracing",
+                "analytics",
+                "shutdown",
+            ),
+            self._apply_config,
+        )
+
+    def _apply_config(self, old: Optional[BotConfig], new: BotConfig) -> None:
+        self.owner_ids = set(new.constants.owner_ids) or None
+        self.test_guild_ids = new.constants.test_guild_ids
+        self.log_channel_id: Optional[int] = new.constants.log_channel_id
+        self._debug_mode: bool = new.debug
+        self.command_prefix = commands.when_mentioned_or(new.prefix or "!")
+        if old is None:  # the pools can only be resized by restarting
+            self.executors.load_config(new.executors)
+        self.view_manager.load_config(new.views)
+        self.interactions.load_config(new.interactions)
+        self.memory.load_config(new.diagnostics)
+        self.command_syncer.load_config(new.command_sync)
+        self.tracer.load_config(new.tracing)
+        self.warm_cache.load_config(new.warm_cache)
+        self.analytics.load_config(new.analytics)
+        self.drainer.load_config(new.shutdown)
+        if old is not None and old.analytics.flush_interval != new.analytics.flush_interval:
+            self.analytics.start()
+        if old is not None and old.recorder != new.recorder:
+            self.recorder.load_config(new.recorder)
+        if old is not None and old.member_store != new.member_store:
+            self.member_store.load_config(new.member_store)
+        if old is not None and old.hot_reload != new.hot_reload:
+            if new.hot_reload.watch:
+                self._config.start_watching(new.hot_reload.interval)
+            else:
+                self._config.stop_watching()
+
+    # bus handlers, so dev commands can reach every process
 
-        self._config: dict = config
+    def _bus_stats(self, _data, _sender) -> dict:
+        return {
+            "guilds": len(self.guilds),
+            "users": len(self.users),
+            "latency": self.latency if self.is_ready() else None,
+            "shard": self.shard_id,
+            "extensions": len(self.extensions),
+        }
+
+    async def _bus_extensions(self, data: dict, _sender) -> str:
+        action, name = data["action"], data["name"]
+        method = {"load": self.load_extension, "unload": self.unload_extension, "reload": self.reload_extension}
+        try:
+            await method[action](name)
+        except commands.ExtensionError as e:
+            return f"- {e}"
+        return f"+ {action}ed {name}"
+
+    async def _bus_config_reload(self, _data, _sender) -> list[str]:
+        return await self._config.reload()
+
+    def _bus_cache_invalidate(self, data: dict, _sender) -> int:
+        return self.warm_cache.invalidate(data["name"], data.get("keys"))
 
     async def on_ready(self):
         self._logger.info(f"{self.user.name}#{self.user.discriminator} is ready!")
 
     async def close(self):
-        await self._session.close() if self._session else None
+        await self.drainer.drain()
         await super().close()
 
     async def log_to_discord(self, content: Union[str, None] = None, **kwargs) -> None:
@@ -114,7 +249,56 @@ class MyClient(commands.Bot):
             self._logger.error(f"Error while logging: {e}")
 
     async def on_message(self, message: discord.Message, /) -> None:
-        await self.process_commands(message)
+        if self.drainer.draining:
+            return
+        with self.tracer.trace_message(message):
+            await self.process_commands(message)
+
+    async def get_prefix(self, message: discord.Message, /):
+        with self.tracer.span("prefix"):
+            return await super().get_prefix(message)
+
+    async def get_context(self, origin, /, *, cls=commands.Context):
+        with self.tracer.span("context"):
+            ctx = await super().get_context(origin, cls=cls)
+        if ctx.command is not None:
+            self.tracer.set_command(ctx.command)
+        return ctx
+
+    async def can_run(self, ctx: commands.Context, /, *, call_once: bool = False) -> bool:
+        with self.tracer.span("checks.global"):
+            return await super().can_run(ctx, call_once=call_once)
+
+    async def invoke(self, ctx: commands.Context, /) -> None:
+        name = f"command {ctx.command.qualified_name}" if ctx.command is not None else "command"
+        with self.drainer.track(name), self.command_scope():
+            started = time.perf_counter()
+            failed = True
+            try:
+                await super().invoke(ctx)
+                # set by Command.dispatch_error, before the on_command_error listeners are even scheduled
+                failed = ctx.command_failed
+            finally:
+                self.analytics.command_finished(ctx, (time.perf_counter() - started) * 1000, failed=failed)
+
+    def command_scope(self) -> contextlib.AbstractContextManager:
+        """
+        Wraps the command or interaction being handled, which limits its database time and scopes
+        its read-your-writes pinning to it (see ``Database.command_scope``).
+        """
+        config = self.config.database
+        return Database.command_scope(config.command_deadline if config is not None else None)
+
+    async def remove_cog(self, name: str, /, **kwargs) -> Optional[commands.Cog]:
+        cog = await super().remove_cog(name, **kwargs)
+        if cog is not None:
+            self.scheduler.cancel_owner(cog)
+            self.bus.unsubscribe_owner(cog)
+        return cog
+
+    def add_command(self, command: commands.Command, /) -> None:
+        super().add_command(command)
+        self.tracer.instrument_command(command)
 
     @property
     def debug(self):
@@ -129,5 +313,10 @@ class MyClient(commands.Bot):
         return self._logger
 
     @property
-    def config(self):
+    def config(self) -> BotConfig:
+        """The current config. Always read it through here, since it's replaced on every reload."""
+        return self._config.current
+
+    @property
+    def config_manager(self) -> ConfigManager:
         return self._config
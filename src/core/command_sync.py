@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ..core.client import MyClient
+    from ..core.config import CommandSyncConfig
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+import discord
+from discord.abc import Snowflake
+
+
+@dataclass
+class SyncResult:
+    scope: Optional[Snowflake]
+    synced: bool
+    command_count: int
+    error: Optional[Exception] = None
+
+    @property
+    def scope_name(self) -> str:
+        return "global" if self.scope is None else str(self.scope.id)
+
+
+class CommandSyncer:
+    """
+    Syncs the app command tree only to the scopes whose commands changed.
+
+    A canonical SHA-256 hash of the payload that would be sent for each scope (global or a guild)
+    is compared with the hash saved after the last successful sync, and unchanged scopes are
+    skipped. Changed scopes are synced concurrently, up to ``concurrency`` at a time.
+    """
+
+    def __init__(
+        self,
+        bot: MyClient,
+        *,
+        state_path: str = "cache/command_sync.json",
+        concurrency: int = 3,
+    ):
+        self.bot: MyClient = bot
+        self.state_path: str = state_path
+        self.concurrency: int = concurrency
+        self._state: Optional[dict[str, dict[str, str]]] = None
+        self._logger = logging.getLogger("command-sync")
+
+    def load_config(self, config: CommandSyncConfig) -> None:
+        self.concurrency = config.concurrency
+
+    @staticmethod
+    def _scope_key(scope: Optional[Snowflake]) -> str:
+        return "global" if scope is None else str(scope.id)
+
+    def _load_state(self) -> dict[str, str]:
+        if self._state is None:
+            try:
+                with open(self.state_path, "r", encoding="utf-8") as f:
+                    self._state = json.load(f)
+            except (OSError, ValueError):
+                self._state = {}
+        # hashes are stored per application, so several bots can share a working directory
+        return self._state.setdefault(str(self.bot.application_id), {})
+
+    def _save_state(self) -> None:
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.state_path)
+
+    async def build_payload(self, scope: Optional[Snowflake]) -> list[dict]:
+        """Builds the exact payload ``CommandTree.sync`` would send for a scope."""
+        tree = self.bot.tree
+        commands = tree.get_commands(guild=scope)
+        if tree.translator:
+            payload = [
+                await command.get_translated_payload(tree, tree.translator)
+                for command in commands
+            ]
+        else:
+            payload = [command.to_dict(tree) for command in commands]
+        return sorted(payload, key=lambda c: (c.get("type", 1), c["name"]))
+
+    async def payload_hash(self, scope: Optional[Snowflake]) -> str:
+        payload = await self.build_payload(scope)
+        canonical = json.dumps(
+            payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    async def _sync_scope(
+        self,
+        scope: Optional[Snowflake],
+        semaphore: asyncio.Semaphore,
+        force: bool,
+    ) -> SyncResult:
+        key = self._scope_key(scope)
+        # one scope failing (HTTP errors, a missing application ID, a translator error) mustn't stop the others
+        try:
+            digest = await self.payload_hash(scope)
+            if not force and self._load_state().get(key) == digest:
+                return SyncResult(scope, False, len(self.bot.tree.get_commands(guild=scope)))
+
+            async with semaphore:
+                synced = await self.bot.tree.sync(guild=scope)
+        except discord.DiscordException as e:
+            self._logger.warning(f"Failed to sync commands to {key}: {type(e).__name__}: {e}")
+            return SyncResult(scope, False, 0, e)
+
+        self._load_state()[key] = digest
+        return SyncResult(scope, True, len(synced))
+
+    async def sync(
+        self, scopes: Iterable[Optional[Snowflake]] = (None,), *, force: bool = False
+    ) -> list[SyncResult]:
+        """
+        Syncs the given scopes if their commands changed since they were last synced.
+
+        Parameters:
+            scopes: ``None`` for the global scope, or guild objects.
+            force: Sync every scope even if its hash didn't change.
+
+        Returns:
+            list[SyncResult]: One result per scope, in order.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(
+            *(self._sync_scope(scope, semaphore, force) for scope in scopes)
+        )
+        if any(result.synced for result in results):
+            self._save_state()
+        return list(results)
+
+    def forget(self, scope: Optional[Snowflake]) -> None:
+        """Drops the saved hash of a scope so its next sync always goes through."""
+        self._load_state().pop(self._scope_key(scope), None)
+        self._save_state()
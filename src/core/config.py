@@ -0,0 +1,458 @@
+import asyncio
+import dataclasses
+import inspect
+import logging
+import os
+import types
+import typing
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Iterable, Optional, Union
+
+import yaml
+
+
+class ConfigError(ValueError):
+    """Raised when the config file can't be read or doesn't match the schema."""
+
+
+def _key(f: dataclasses.Field) -> str:
+    return f.metadata.get("key", f.name.replace("_", "-"))
+
+
+@dataclass(frozen=True, slots=True)
+class ConstantsConfig:
+    owner_ids: list[int] = field(default_factory=list)
+    test_guild_ids: list[int] = field(default_factory=list)
+    log_channel_id: Optional[int] = None
+
+
+@dataclass(frozen=True, slots=True)
+class ReplicaConfig:
+    ip: str
+    port: int
+    username: Optional[str] = None  # defaults to the primary's
+    password: Optional[str] = None
+
+
+@dataclass(frozen=True, slots=True)
+class CircuitBreakerConfig:
+    failure_rate: float = 0.5  # fraction of failed or timed out calls that opens the breaker
+    min_calls: int = 10  # calls in the window before the failure rate counts
+    window: float = 30.0
+    open_for: float = 15.0  # seconds calls fail fast before probing the database again
+    probes: int = 3
+
+
+@dataclass(frozen=True, slots=True)
+class DatabaseConfig:
+    ip: str
+    port: int
+    username: str
+    password: str
+    replicas: list[ReplicaConfig] = field(default_factory=list)
+    max_replica_lag: float = 5.0  # seconds behind the primary before a replica stops serving reads
+    lag_check_interval: float = 5.0
+    call_timeout: float = 10.0  # per call, including waiting for a connection
+    command_deadline: float = 15.0  # total database time of a command or interaction
+    circuit_breaker: CircuitBreakerConfig = field(default_factory=CircuitBreakerConfig)
+
+
+@dataclass(frozen=True, slots=True)
+class ViewsConfig:
+    max_live: int = 1000
+    max_per_user: int = 10
+
+
+@dataclass(frozen=True, slots=True)
+class InteractionsConfig:
+    enabled: bool = True
+    defer_after: float = 2.0  # seconds before a handler that hasn't responded is deferred for it
+    # whether automatic "thinking..." defers are ephemeral, for commands without extras["defer_ephemeral"]
+    ephemeral: bool = False
+
+
+@dataclass(frozen=True, slots=True)
+class ShellConfig:
+    timeout: float = 300.0
+    output_buffer_kb: int = 64
+    edit_interval: float = 2.0
+
+
+@dataclass(frozen=True, slots=True)
+class DiagnosticsConfig:
+    tracemalloc: bool = False
+    tracemalloc_frames: int = 10
+    max_snapshots: int = 5
+
+
+@dataclass(frozen=True, slots=True)
+class CommandSyncConfig:
+    auto: bool = False
+    concurrency: int = 3
+
+
+@dataclass(frozen=True, slots=True)
+class HotReloadConfig:
+    watch: bool = False
+    interval: float = 5.0
+
+
+@dataclass(frozen=True, slots=True)
+class RecorderConfig:
+    enabled: bool = False
+    path: str = "cache/gateway/recording.jsonl.gz"
+    anonymize: bool = True
+    events: list[str] = field(default_factory=list)  # empty records every event
+    flush_interval: float = 5.0
+
+
+@dataclass(frozen=True, slots=True)
+class ExecutorsConfig:
+    io_workers: int = 8
+    io_queue: int = 64
+    cpu_workers: int = 2
+    cpu_queue: int = 16
+
+
+@dataclass(frozen=True, slots=True)
+class MemberStoreConfig:
+    enabled: bool = False
+    min_members: int = 1000  # smaller guilds keep a plain member dict
+    hot_size: int = 1000  # members kept as full objects per guild
+
+
+@dataclass(frozen=True, slots=True)
+class WarmCacheConfig:
+    enabled: bool = True
+    path: str = "cache/warm_cache.bin"
+    max_age: float = 3600.0  # older snapshots are ignored
+    revalidate_delay: float = 5.0  # seconds after startup before restored entries are revalidated
+    batch_size: int = 100
+    concurrency: int = 2  # revalidation batches in flight, across every cache
+
+
+@dataclass(frozen=True, slots=True)
+class TracingConfig:
+    sample_rate: float = 0.0  # fraction of messages traced, 0 disables tracing
+    path: str = "logs/traces.jsonl"
+    max_recent: int = 50  # traces kept in memory per command for `dev trace`
+    flush_interval: float = 5.0
+
+
+@dataclass(frozen=True, slots=True)
+class ApiConfig:
+    base_url: Optional[str] = None  # e.g. http://127.0.0.1:8765 for benchmarks/fake_discord.py
+    gateway_url: Optional[str] = None
+
+
+@dataclass(frozen=True, slots=True)
+class AnalyticsConfig:
+    enabled: bool = True
+    table: str = "command_stats"
+    flush_interval: float = 60.0
+    relative_accuracy: float = 0.02  # of the latency percentiles
+    hll_precision: int = 10  # unique users/guilds are estimated in 2^precision bytes each, ~3% error at 10
+    max_pending: int = 120  # buckets kept while the database is unreachable
+
+
+@dataclass(frozen=True, slots=True)
+class BusConfig:
+    transport: str = "none"  # none, unix or postgres
+    socket: str = "cache/bus/bus.sock"  # unix: the broker's socket, its directory must be private (0700)
+    channel: str = "bot_bus"  # postgres: the LISTEN/NOTIFY channel, anyone who can NOTIFY on it controls the bot
+    node: Optional[str] = None  # this process's name on the bus, hostname:pid by default
+    request_timeout: float = 2.0
+
+
+@dataclass(frozen=True, slots=True)
+class ShutdownConfig:
+    timeout: float = 30.0  # for the whole shutdown
+    in_flight_timeout: float = 20.0  # of which commands and view callbacks may use this much to finish
+
+
+@dataclass(frozen=True, slots=True)
+class RestProxyConfig:
+    enabled: bool = False  # send REST requests through the proxy, which must be running
+    host: str = "127.0.0.1"
+    port: int = 8766
+    upstream: Optional[str] = None  # where the proxy forwards to, api.base-url or Discord by default
+    global_limit: float = 50.0  # requests per second per token
+    max_retries: int = 3  # 429s the proxy retries before passing one on
+    max_wait: float = 30.0  # longest a request may queue before the proxy answers with a 429
+
+
+@dataclass(frozen=True, slots=True)
+class BotConfig:
+    token: str
+    prefix: str = "!"
+    debug: bool = False
+    extensions: list[str] = field(default_factory=list)
+    privileged_intents: dict[str, bool] = field(default_factory=dict)
+    constants: ConstantsConfig = field(default_factory=ConstantsConfig)
+    database: Optional[DatabaseConfig] = None
+    views: ViewsConfig = field(default_factory=ViewsConfig)
+    interactions: InteractionsConfig = field(default_factory=InteractionsConfig)
+    shell: ShellConfig = field(default_factory=ShellConfig)
+    executors: ExecutorsConfig = field(default_factory=ExecutorsConfig)
+    diagnostics: DiagnosticsConfig = field(default_factory=DiagnosticsConfig)
+    command_sync: CommandSyncConfig = field(default_factory=CommandSyncConfig)
+    hot_reload: HotReloadConfig = field(default_factory=HotReloadConfig)
+    recorder: RecorderConfig = field(default_factory=RecorderConfig)
+    member_store: MemberStoreConfig = field(default_factory=MemberStoreConfig)
+    warm_cache: WarmCacheConfig = field(default_factory=WarmCacheConfig)
+    tracing: TracingConfig = field(default_factory=TracingConfig)
+    api: ApiConfig = field(default_factory=ApiConfig)
+    bus: BusConfig = field(default_factory=BusConfig)
+    analytics: AnalyticsConfig = field(default_factory=AnalyticsConfig)
+    shutdown: ShutdownConfig = field(default_factory=ShutdownConfig)
+    rest_proxy: RestProxyConfig = field(default_factory=RestProxyConfig)
+
+
+# Keys that are only read once at startup. Changing them has no effect until the bot restarts.
+RESTART_KEYS = ("token", "privileged-intents", "extensions", "database", "api", "executors", "bus", "rest-proxy")
+
+
+def _convert(value: Any, tp: Any, path: str) -> Any:
+    origin = typing.get_origin(tp)
+    args = typing.get_args(tp)
+
+    if dataclasses.is_dataclass(tp):
+        if value is None:
+            value = {}
+        if not isinstance(value, dict):
+            raise ConfigError(f"{path}: expected a mapping, got {type(value).__name__}.")
+        return parse_section(tp, value, path)
+
+    if origin in (Union, types.UnionType):
+        if value is None and type(None) in args:
+            return None
+        (inner,) = [arg for arg in args if arg is not type(None)]
+        return _convert(value, inner, path)
+
+    if origin is list:
+        if not isinstance(value, list):
+            raise ConfigError(f"{path}: expected a list, got {type(value).__name__}.")
+        return [_convert(item, args[0], f"{path}[{i}]") for i, item in enumerate(value)]
+
+    if origin is dict:
+        if not isinstance(value, dict):
+            raise ConfigError(f"{path}: expected a mapping, got {type(value).__name__}.")
+        return {
+            _convert(k, args[0], path): _convert(v, args[1], f"{path}.{k}")
+            for k, v in value.items()
+        }
+
+    if tp is float and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if tp is int and isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if tp in (bool, str) and isinstance(value, tp):
+        return value
+    raise ConfigError(f"{path}: expected {tp.__name__}, got {type(value).__name__}.")
+
+
+def parse_section(cls: type, data: dict, path: str = "") -> Any:
+    """
+    Validates a mapping against a config dataclass and builds an instance of it.
+
+    Raises:
+        ConfigError: If a key is missing, unknown or has the wrong type.
+    """
+    hints = typing.get_type_hints(cls)
+    fields = {_key(f): f for f in dataclasses.fields(cls)}
+    unknown = set(data) - set(fields)
+    if unknown:
+        raise ConfigError(f"{path or 'config'}: unknown key(s) {', '.join(sorted(unknown))}.")
+
+    kwargs = {}
+    for key, f in fields.items():
+        key_path = f"{path}.{key}" if path else key
+        if key not in data:
+            if f.default is dataclasses.MISSING and f.default_factory is dataclasses.MISSING:
+                raise ConfigError(f"{key_path}: missing required key.")
+            continue
+        kwargs[f.name] = _convert(data[key], hints[f.name], key_path)
+    return cls(**kwargs)
+
+
+def apply_env_overlay(data: dict, environ: dict[str, str], prefix: str = "BOT_") -> dict:
+    """
+    Overrides config values with environment variables.
+
+    ``BOT_TOKEN`` sets ``token`` and ``BOT_DATABASE__PASSWORD`` sets ``database.password``: sections
+    are separated by ``__`` and underscores become dashes, unless the key already exists with
+    underscores. Values are parsed as YAML, so numbers, booleans and lists work. Variables that
+    don't start with a known top-level key are ignored.
+    """
+    top_level = {_key(f) for f in dataclasses.fields(BotConfig)}
+    for name, raw_value in environ.items():
+        if not name.startswith(prefix):
+            continue
+        path = [part.lower() for part in name[len(prefix) :].split("__")]
+        if path[0].replace("_", "-") not in top_level:
+            continue
+        section = data
+        for i, part in enumerate(path):
+            # keys are dashed, except where the file already uses underscores (e.g. intents)
+            key = part if part in section else part.replace("_", "-")
+            if i == len(path) - 1:
+                section[key] = yaml.safe_load(raw_value) if raw_value else raw_value
+                break
+            section = section.setdefault(key, {})
+            if not isinstance(section, dict):
+                break
+    return data
+
+
+def _flatten(data: Any, prefix: str = "") -> dict[str, Any]:
+    if not isinstance(data, dict):
+        return {prefix: data}
+    flat = {}
+    for key, value in data.items():
+        flat.update(_flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+    return flat
+
+
+Subscriber = Callable[[BotConfig, BotConfig], Union[None, Awaitable[None]]]
+
+
+class ConfigManager:
+    """
+    Owns the bot's typed configuration.
+
+    ``reload`` re-reads and validates the file, swaps the new config in atomically and then notifies
+    the subscribers of every key that changed. A bad file never replaces a good config.
+
+    Parameters:
+        path: The config file to read.
+        env_prefix: The prefix of environment variables that override config values.
+    """
+
+    def __init__(self, path: str = "config.yml", *, env_prefix: str = "BOT_"):
+        self.path: str = path
+        self.env_prefix: str = env_prefix
+        self._current: Optional[BotConfig] = None
+        self._raw: dict = {}
+        self._mtime: Optional[float] = None
+        self._subscribers: list[tuple[tuple[str, ...], Subscriber]] = []
+        self._watch_task: Optional[asyncio.Task] = None
+        self._logger = logging.getLogger("config")
+
+    @property
+    def current(self) -> BotConfig:
+        if self._current is None:
+            raise ConfigError("The config hasn't been loaded yet.")
+        return self._current
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return yaml.safe_load(f) or {}
+        except OSError as e:
+            raise ConfigError(f"Could not read {self.path}: {e}") from e
+        except yaml.YAMLError as e:
+            raise ConfigError(f"{self.path} is not a valid YAML file: {e}") from e
+
+    def _parse(self, raw: dict) -> tuple[dict, BotConfig]:
+        raw = apply_env_overlay(raw, dict(os.environ), self.env_prefix)
+        return raw, parse_section(BotConfig, raw)
+
+    def load(self, raw: Optional[dict] = None) -> BotConfig:
+        """
+        Loads the config for the first time.
+
+        Parameters:
+            raw: An already parsed config file. The file is read if this isn't given.
+
+        Raises:
+            ConfigError: If the config is invalid.
+        """
+        self._raw, self._current = self._parse(self._read() if raw is None else raw)
+        self._mtime = self._get_mtime()
+        return self._current
+
+    def _get_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def subscribe(self, keys: Union[str, Iterable[str]], callback: Subscriber) -> Callable[[], None]:
+        """
+        Calls ``callback(old, new)`` after a reload changes any of ``keys`` (or anything under them).
+        The callback may be a coroutine function.
+
+        Returns:
+            Callable[[], None]: A function that removes the subscription.
+        """
+        entry = ((keys,) if isinstance(keys, str) else tuple(keys), callback)
+        self._subscribers.append(entry)
+        return lambda: self._subscribers.remove(entry) if entry in self._subscribers else None
+
+    @staticmethod
+    def _matches(changed: str, key: str) -> bool:
+        return changed == key or changed.startswith(key + ".") or key.startswith(changed + ".")
+
+    async def reload(self) -> list[str]:
+        """
+        Re-reads the config file and swaps it in if it is valid.
+
+        Returns:
+            list[str]: The dotted keys that changed.
+
+        Raises:
+            ConfigError: If the new config is invalid. The current config is kept.
+        """
+        raw, new = self._parse(self._read())
+        self._mtime = self._get_mtime()
+        old_flat, new_flat = _flatten(self._raw), _flatten(raw)
+        changed = sorted(
+            key
+            for key in old_flat.keys() | new_flat.keys()
+            if old_flat.get(key) != new_flat.get(key)
+        )
+        if not changed:
+            return []
+
+        old = self._current
+        self._raw, self._current = raw, new
+
+        restart = [k for k in changed if any(self._matches(k, r) for r in RESTART_KEYS)]
+        if restart:
+            self._logger.warning(f"Changed keys that only apply after a restart: {', '.join(restart)}")
+
+        for keys, callback in list(self._subscribers):
+            if not any(self._matches(c, k) for c in changed for k in keys):
+                continue
+            try:
+                result = callback(old, new)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:  # noqa
+                self._logger.exception(f"Config subscriber {callback!r} failed: {e}")
+        return changed
+
+    async def _watch(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            mtime = self._get_mtime()
+            if mtime is None or mtime == self._mtime:
+                continue
+            try:
+                changed = await self.reload()
+            except ConfigError as e:
+                self._mtime = mtime  # don't retry until the file changes again
+                self._logger.error(f"Not reloading the config: {e}")
+            else:
+                if changed:
+                    self._logger.info(f"Config reloaded. Changed: {', '.join(changed)}")
+
+    def start_watching(self, interval: float = 5.0) -> None:
+        """Polls the config file for changes and reloads it automatically."""
+        self.stop_watching()
+        self._watch_task = asyncio.create_task(self._watch(interval), name="config-watcher")
+
+    def stop_watching(self) -> None:
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
@@ -4,15 +4,243 @@ from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
     from ..core.client import MyClient
+    from ..core.config import CircuitBreakerConfig, ReplicaConfig
 
 import asyncio
+import contextlib
+import contextvars
 import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Iterator, Literal, Optional
 
 import asyncpg
 import discord
 from discord.ext import commands
 
 
+# Seconds since the last replayed transaction, or 0 when the replica has replayed everything it
+# received (an idle primary writes nothing to replay) or isn't a replica at all.
+REPLICA_LAG_QUERY = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+# Errors that mean the database (not the query) is in trouble. They count against the circuit breaker.
+BREAKER_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InsufficientResourcesError,
+    asyncpg.OperatorInterventionError,
+)
+
+_pinned: contextvars.ContextVar[bool] = contextvars.ContextVar("database_pinned", default=False)
+# the command or interaction being handled, pinned to the primary once it writes
+_command: contextvars.ContextVar[Optional[_CommandScope]] = contextvars.ContextVar("database_command", default=None)
+# loop time by which the current command's database calls have to finish
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("database_deadline", default=None)
+
+
+class DatabaseUnavailable(RuntimeError):
+    """Raised instead of querying a database whose circuit breaker is open, or that has been closed."""
+
+    def __init__(self, node: str, retry_after: float):
+        self.node: str = node
+        self.retry_after: float = retry_after
+        super().__init__(f"The database ({node}) is unavailable, retry in {retry_after:.0f}s.")
+
+
+class DatabaseTimeout(DatabaseUnavailable):
+    """Raised when a database call doesn't finish before its deadline."""
+
+    def __init__(self, node: str, timeout: float):
+        self.timeout: float = timeout
+        RuntimeError.__init__(self, f"The database ({node}) didn't answer within {timeout:.1f}s.")
+        self.node = node
+        self.retry_after = 0.0
+
+
+class _CommandScope:
+    __slots__ = ("pinned",)
+
+    def __init__(self):
+        self.pinned: bool = False
+
+
+@contextlib.contextmanager
+def _pinned_scope() -> Iterator[None]:
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a database that keeps failing, so commands fail fast instead of piling up.
+
+    Closed, it counts the outcomes of the calls in the last ``window`` seconds, and opens once at
+    least ``min_calls`` were made and ``failure_rate`` of them failed or timed out. Open, every call
+    is rejected for ``open_for`` seconds. It then lets ``probes`` calls through (half-open): it closes
+    again once they all succeed, and opens again as soon as one fails.
+    """
+
+    def __init__(
+        self,
+        *,
+        failure_rate: float = 0.5,
+        min_calls: int = 10,
+        window: float = 30.0,
+        open_for: float = 15.0,
+        probes: int = 3,
+    ):
+        self.failure_rate: float = failure_rate
+        self.min_calls: int = min_calls
+        self.window: float = window
+        self.open_for: float = open_for
+        self.probes: int = probes
+        self.state: Literal["closed", "open", "half-open"] = "closed"
+        self.trips: int = 0
+        self.rejected: int = 0
+        self._outcomes: deque[tuple[float, bool]] = deque()  # (time, failed)
+        self._failures: int = 0
+        self._opened_at: float = 0.0
+        self._probing: int = 0
+        self._probe_successes: int = 0
+        self._half_opened: int = 0  # how many times it went half-open, to tell its probes apart
+
+    def load_config(self, config: CircuitBreakerConfig) -> None:
+        self.failure_rate = config.failure_rate
+        self.min_calls = config.min_calls
+        self.window = config.window
+        self.open_for = config.open_for
+        self.probes = config.probes
+
+    @property
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.open_for - time.monotonic())
+
+    @property
+    def available(self) -> bool:
+        """Whether a call would be let through right now."""
+        if self.state == "open":
+            return self.retry_after <= 0
+        if self.state == "half-open":
+            return self._probing < self.probes
+        return True
+
+    def before_call(self, node: str) -> Optional[int]:
+        """
+        Returns:
+            A token to pass to ``record`` if the call is a half-open probe, otherwise ``None``.
+
+        Raises:
+            DatabaseUnavailable: If the breaker is open, or half-open with every probe in flight.
+        """
+        if self.state == "open" and self.retry_after <= 0:
+            self.state, self._probing, self._probe_successes = "half-open", 0, 0
+            self._half_opened += 1
+        if self.state == "open" or (self.state == "half-open" and self._probing >= self.probes):
+            self.rejected += 1
+            raise DatabaseUnavailable(node, self.retry_after or self.open_for)
+        if self.state == "half-open":
+            self._probing += 1
+            return self._half_opened
+        return None
+
+    def record(self, failed: Optional[bool], probe: Optional[int] = None) -> None:
+        """
+        Records the outcome of a call. ``None`` (e.g. the caller was cancelled) doesn't count either way.
+        ``probe`` is what ``before_call`` returned for the call.
+        """
+        now = time.monotonic()
+        if self.state == "half-open":
+            # calls that started before it opened, or probes of an earlier half-open state, don't count
+            if probe != self._half_opened:
+                return
+            self._probing -= 1
+            if failed is None:
+                return
+            if failed:
+                self._open(now)
+            else:
+                self._probe_successes += 1
+                if self._probe_successes >= self.probes:
+                    self.state = "closed"
+                    self._outcomes.clear()
+                    self._failures = 0
+            return
+        if self.state == "open" or failed is None:  # open: a call that started before it opened
+            return
+
+        self._outcomes.append((now, failed))
+        self._failures += failed
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._failures -= self._outcomes.popleft()[1]
+        calls = len(self._outcomes)
+        if calls >= self.min_calls and self._failures / calls >= self.failure_rate:
+            self._open(now)
+
+    def _open(self, now: float) -> None:
+        self.state = "open"
+        self.trips += 1
+        self._opened_at = now
+        self._outcomes.clear()
+        self._failures = 0
+
+
+@contextlib.contextmanager
+def _deadline_scope(seconds: Optional[float]) -> Iterator[None]:
+    if seconds is None:
+        yield
+        return
+    deadline = asyncio.get_running_loop().time() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextlib.contextmanager
+def _command_scope(deadline: Optional[float]) -> Iterator[None]:
+    token = _command.set(_CommandScope())
+    try:
+        with _deadline_scope(deadline):
+            yield
+    finally:
+        _command.reset(token)
+
+
+@dataclass
+class DatabaseNode:
+    name: str
+    pool: Optional[asyncpg.Pool]
+    replica: Optional[ReplicaConfig] = None
+    breaker: CircuitBreaker = field(default_factory=CircuitBreaker)
+    healthy: bool = True
+    lag: float = 0.0  # seconds behind the primary
+    outstanding: int = 0  # queries in flight
+    served: int = 0
+
+    @contextlib.contextmanager
+    def track(self) -> Iterator[None]:
+        self.outstanding += 1
+        self.served += 1
+        try:
+            yield
+        finally:
+            self.outstanding -= 1
+
+
 class Database(commands.Cog):
     """
     fuzzy matching postgresql query:
@@ -29,35 +257,243 @@ class Database(commands.Cog):
     def __init__(self, bot: MyClient):
         self.bot: MyClient = bot
         self.logger = logging.getLogger("database")
-        self.poo: asyncpg.pool.Pool | None = None
+        self.pool: Optional[asyncpg.Pool] = None  # the primary's pool
+        self.primary: Optional[DatabaseNode] = None
+        self.replicas: list[DatabaseNode] = []
+        self.max_replica_lag: float = 5.0
+        self.call_timeout: float = 10.0
 
-    async def get_pool(self):
+    async def get_pool(self, host: Optional[str] = None, port: Optional[int] = None, **overrides: Any):
+        config = self.bot.config.database
+        if config is None:
+            raise RuntimeError("The 'database' section is missing from config.yml.")
         kwargs = {
-            "host": self.bot.config["database"]["ip"],
-            "port": self.bot.config["database"]["port"],
-            "user": self.bot.config["database"]["username"],
-            "password": self.bot.config["database"]["password"],
+            "host": host or config.ip,
+            "port": port or config.port,
+            "user": overrides.pop("user", None) or config.username,
+            "password": overrides.pop("password", None) or config.password,
             "min_size": 3,
             "max_size": 10,
-            "command_timeout": 60,
+            "command_timeout": config.call_timeout,
             "loop": asyncio.get_event_loop(),
         }
         return await asyncpg.create_pool(**kwargs)
 
     async def cog_load(self):
+        config = self.bot.config.database
         self.logger.info("Attempting to establish a database connection...")
         self.pool = await self.get_pool()
+        self.primary = DatabaseNode("primary", self.pool)
+        self.primary.breaker.load_config(config.circuit_breaker)
         self.logger.info("Database connection established successfully.")
 
-    async def cog_unload(self):
-        await self.pool.close()
+        self.call_timeout = config.call_timeout
+        self.max_replica_lag = config.max_replica_lag
+        for i, replica in enumerate(config.replicas):
+            node = DatabaseNode(f"replica-{i + 1} ({replica.ip}:{replica.port})", None, replica=replica)
+            node.breaker.load_config(config.circuit_breaker)
+            await self._connect_replica(node)
+            self.replicas.append(node)
+        if self.replicas:
+            self.bot.scheduler.every(
+                "database.replica-lag", self.check_replicas, config.lag_check_interval, first_delay=0
+            )
+
+    async def _connect_replica(self, node: DatabaseNode) -> None:
+        replica = node.replica
+        try:
+            node.pool = await self.get_pool(replica.ip, replica.port, user=replica.username, password=replica.password)
+        except (OSError, asyncpg.PostgresError, asyncio.TimeoutError) as e:
+            node.healthy = False
+            self.logger.warning(f"Couldn't connect to {node.name}, reads will skip it: {e}")
+
+    async def check_replicas(self) -> None:
+        """Measures how far behind each replica is, and reconnects the ones that are down."""
+        if self.pool is None:  # closed
+            return
+        for node in self.replicas:
+            if node.pool is None:
+                await self._connect_replica(node)
+                if node.pool is None:
+                    continue
+            try:
+                node.lag = float(await node.pool.fetchval(REPLICA_LAG_QUERY, timeout=5))
+                node.healthy = True
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError, asyncio.TimeoutError) as e:
+                if node.healthy:
+                    self.logger.warning(f"{node.name} is unreachable, reads will skip it: {e}")
+                node.healthy = False
+
+    @staticmethod
+    def pin_primary() -> contextlib.AbstractContextManager:
+        """
+        Sends every read in the current task to the primary while the ``with`` block runs, for
+        reads that must see a write made elsewhere.
+
+        A command's own writes pin the rest of the command (see ``command_scope``). Writes made
+        outside of one, e.g. by a ``tasks.loop``, a bus handler or a scheduled job, don't pin
+        anything, so background code that reads its own writes has to use this.
+        """
+        return _pinned_scope()
+
+    @staticmethod
+    def command_scope(deadline: Optional[float]) -> contextlib.AbstractContextManager:
+        """
+        Wraps the handling of one command or interaction (and the tasks it starts). Its first write
+        sends its later reads to the primary, so it reads its own writes, until the ``with`` block
+        ends. Its database calls also share a ``deadline`` (see ``Database.deadline``).
+        Commands and interactions get one through ``MyClient.command_scope``.
+        """
+        return _command_scope(deadline)
+
+    @staticmethod
+    def deadline(seconds: Optional[float]) -> contextlib.AbstractContextManager:
+        """
+        Limits the total time the database calls in the ``with`` block (and the tasks it starts) can
+        take. Every call's timeout is cut to what's left, and calls made after the deadline fail
+        straight away with ``DatabaseTimeout``. Nested deadlines can only shorten it.
+        Commands and interactions get one through ``MyClient.command_scope``.
+        """
+        return _deadline_scope(seconds)
+
+    def _node_for_read(self, primary: bool) -> DatabaseNode:
+        command = _command.get()
+        if primary or _pinned.get() or (command is not None and command.pinned):
+            return self.primary
+        eligible = [
+            n
+            for n in self.replicas
+            if n.healthy and n.pool is not None and n.lag <= self.max_replica_lag and n.breaker.available
+        ]
+        if not eligible:
+            return self.primary
+        # least outstanding requests, with ties spread over the replicas
+        fewest = min(n.outstanding for n in eligible)
+        return random.choice([n for n in eligible if n.outstanding == fewest])
+
+    def _span(self, method: str, query: str, node: DatabaseNode):
+        return self.bot.tracer.span(
+            f"db.{method}",
+            "CLIENT",
+            {"db.system": "postgresql", "db.operation": method, "db.statement": query, "db.node": node.name},
+        )
+
+    async def _call(
+        self, node: DatabaseNode, method: str, query: str, *args: Any, timeout: Optional[float], **kwargs: Any
+    ) -> Any:
+        """
+        Runs a pool method under the node's circuit breaker and the current deadline.
+
+        Raises:
+            DatabaseUnavailable: If the node's circuit breaker is open, or the database was closed.
+            DatabaseTimeout: If the call (including waiting for a connection) takes too long.
+        """
+        if node.pool is None:
+            raise DatabaseUnavailable(node.name, 0.0)
+        timeout = self.call_timeout if timeout is None else timeout
+        deadline = _deadline.get()
+        if deadline is not None:
+            timeout = min(timeout, deadline - asyncio.get_running_loop().time())
+            if timeout <= 0:
+                raise DatabaseTimeout(node.name, 0.0)
+        probe = node.breaker.before_call(node.name)
+
+        failed = None
+        try:
+            with self._span(method, query, node), node.track():
+                result = await asyncio.wait_for(getattr(node.pool, method)(query, *args, **kwargs), timeout)
+            failed = False
+            return result
+        except asyncio.TimeoutError:
+            # Only a call that had the full call timeout says the database is slow. One cut short by
+            # its command's deadline (or a short timeout of its own) may just have started too late.
+            failed = True if timeout >= self.call_timeout else None
+            raise DatabaseTimeout(node.name, timeout) from None
+        except BREAKER_ERRORS:
+            failed = True
+            raise
+        except Exception:  # the database answered, the query was just wrong
+            failed = False
+            raise
+        finally:
+            node.breaker.record(failed, probe)
+
+    async def _write(
+        self, method: str, query: str, *args: Any, timeout: Optional[float], **kwargs: Any
+    ) -> Any:
+        # reads later in this command should see this write
+        command = _command.get()
+        if command is not None:
+            command.pinned = True
+        return await self._call(self.primary, method, query, *args, timeout=timeout, **kwargs)
+
+    async def _read(
+        self, method: str, query: str, *args: Any, primary: bool, timeout: Optional[float], **kwargs: Any
+    ) -> Any:
+        node = self._node_for_read(primary)
+        return await self._call(node, method, query, *args, timeout=timeout, **kwargs)
+
+    async def execute(self, query: str, *args: Any, timeout: Optional[float] = None) -> str:
+        return await self._write("execute", query, *args, timeout=timeout)
+
+    async def executemany(self, query: str, args: list[tuple], *, timeout: Optional[float] = None) -> None:
+        await self._write("executemany", query, args, timeout=timeout)
+
+    async def fetch(
+        self, query: str, *args: Any, timeout: Optional[float] = None, primary: bool = False
+    ) -> list[asyncpg.Record]:
+        """Runs a read query, on a replica unless ``primary`` is set or the current command or task is pinned."""
+        return await self._read("fetch", query, *args, timeout=timeout, primary=primary)
+
+    async def fetchrow(
+        self, query: str, *args: Any, timeout: Optional[float] = None, primary: bool = False
+    ) -> Optional[asyncpg.Record]:
+        return await self._read("fetchrow", query, *args, timeout=timeout, primary=primary)
+
+    async def fetchval(
+        self, query: str, *args: Any, column: int = 0, timeout: Optional[float] = None, primary: bool = False
+    ) -> Any:
+        return await self._read("fetchval", query, *args, column=column, timeout=timeout, primary=primary)
+
+    async def close(self, timeout: float = 10.0) -> int:
+        """
+        Waits for the queries in flight to finish, then closes every pool. Pools that don't close
+        within ``timeout`` seconds are terminated.
+
+        Returns:
+            The number of queries that were still running when the pools were terminated.
+        """
+        nodes = [node for node in (self.primary, *self.replicas) if node is not None and node.pool is not None]
+        if not nodes:
+            return 0
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while any(node.outstanding for node in nodes) and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        abandoned = 0
+        for node in nodes:
+            pool, node.pool = node.pool, None
+            try:
+                # also waits for connections that are checked out without a tracked query
+                await asyncio.wait_for(pool.close(), max(deadline - loop.time(), 0.1))
+            except asyncio.TimeoutError:
+                abandoned += node.outstanding
+                self.logger.warning(f"{node.name} didn't close in time, terminating its connections.")
+                pool.terminate()
+        self.pool = None
         self.logger.info("Database connection closed.")
+        return abandoned
+
+    async def cog_unload(self):
+        await self.close()
 
 
 async def setup(bot: MyClient) -> None:
+    database = Database(bot)
     if bot.debug and bot.test_guild_ids:
         await bot.add_cog(
-            Database(bot), guilds=[discord.Object(id=x) for x in bot.test_guild_ids]
+            database, guilds=[discord.Object(id=x) for x in bot.test_guild_ids]
         )
     else:
-        await bot.add_cog(Database(bot))
+        await bot.add_cog(database)
+    bot.db = database
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ..core.client import MyClient
+    from ..core.config import DiagnosticsConfig
+
+import itertools
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Optional, Union
+
+from ..utils.memory import deep_getsizeof
+
+
+@dataclass
+class SnapshotEntry:
+    label: str
+    taken_at: float
+    snapshot: tracemalloc.Snapshot
+    traced_memory: int
+
+
+@dataclass
+class CacheReport:
+    name: str
+    count: int
+    size: int
+
+
+def estimate_size(
+    items: Iterable[Any], count: int, *, exclude: Iterable[Any] = (), sample: int = 50
+) -> int:
+    """
+    Estimates the total size of ``count`` similar objects by measuring the first ``sample`` of them.
+    Measuring every object in a large cache would take far too long to do on the event loop.
+    """
+    measured = list(itertools.islice(items, sample))
+    if not measured:
+        return 0
+    exclude = list(exclude)
+    total = sum(deep_getsizeof(item, exclude=exclude, max_objects=500) for item in measured)
+    return int(total / len(measured) * count)
+
+
+class MemoryDiagnostics:
+    """
+    Opt-in memory introspection.
+
+    Keeps a small history of ``tracemalloc`` snapshots to diff allocation sites between, and reports
+    object counts and estimated sizes for the gateway caches, live views, cooldown buckets and any
+    cache registered through ``register_cache``.
+    """
+
+    def __init__(self, bot: MyClient, *, frames: int = 10, max_snapshots: int = 5):
+        self.bot: MyClient = bot
+        self.frames: int = frames
+        self.snapshots: deque[SnapshotEntry] = deque(maxlen=max_snapshots)
+        self._caches: dict[str, Union[Any, Callable[[], Any]]] = {}
+        self._logger = logging.getLogger("diagnostics")
+
+    def load_config(self, config: DiagnosticsConfig) -> None:
+        self.frames = config.tracemalloc_frames
+        self.snapshots = deque(self.snapshots, maxlen=config.max_snapshots)
+        if config.tracemalloc:
+            self.start()
+
+    @property
+    def is_tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._logger.info(f"Started tracing memory allocations ({self.frames} frames).")
+
+    def stop(self) -> None:
+        tracemalloc.stop()
+        self.snapshots.clear()
+
+    def snapshot(self, label: Optional[str] = None) -> SnapshotEntry:
+        """Takes a snapshot of the current allocations. Starts tracing first if needed."""
+        self.start()
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<unknown>"),
+            )
+        )
+        entry = SnapshotEntry(
+            label=label or f"#{len(self.snapshots) + 1}",
+            taken_at=time.time(),
+            snapshot=snapshot,
+            traced_memory=tracemalloc.get_traced_memory()[0],
+        )
+        self.snapshots.append(entry)
+        return entry
+
+    def diff(
+        self, older: int = -2, newer: int = -1, *, limit: int = 15
+    ) -> list[tracemalloc.StatisticDiff]:
+        """
+        Gets the allocation sites that grew the most between two snapshots.
+
+        Raises:
+            IndexError: If there aren't enough snapshots.
+        """
+        before, after = self.snapshots[older], self.snapshots[newer]
+        stats = after.snapshot.compare_to(before.snapshot, "lineno")
+        return [stat for stat in stats if stat.size_diff > 0][:limit]
+
+    def register_cache(self, name: str, cache: Union[Any, Callable[[], Any]]) -> None:
+        """
+        Registers an in-process cache to be reported on.
+
+        Parameters:
+            name: The name the cache is reported under.
+            cache: A sized container, or a callable that returns one. Containers with an ``nbytes``
+                attribute report that instead of being walked.
+        """
+        self._caches[name] = cache
+
+    def unregister_cache(self, name: str) -> None:
+        self._caches.pop(name, None)
+
+    def _gateway_caches(self) -> dict[str, tuple[Iterable[Any], int]]:
+        # noinspection PyProtectedMember
+        state = self.bot._connection
+        guilds = list(state._guilds.values())
+        # compact member caches (see core/member_store.py) report their own size
+        member_guilds = [g for g in guilds if isinstance(g._members, dict)]
+        members = sum(len(g._members) for g in member_guilds)
+        channels = sum(len(g._channels) for g in guilds)
+        return {
+            "guilds": (guilds, len(guilds)),
+            "members": (
+                itertools.chain.from_iterable(g._members.values() for g in member_guilds),
+                members,
+            ),
+            "channels": (
+                itertools.chain.from_iterable(g._channels.values() for g in guilds),
+                channels,
+            ),
+            "users": (state._users.values(), len(state._users)),
+            "emojis": (state._emojis.values(), len(state._emojis)),
+            "stickers": (state._stickers.values(), len(state._stickers)),
+            "messages": (state._messages or (), len(state._messages or ())),
+            "private channels": (
+                state._private_channels.values(),
+                len(state._private_channels),
+            ),
+        }
+
+    def _command_caches(self) -> dict[str, tuple[Iterable[Any], int]]:
+        buckets, concurrency = [], []
+        for command in self.bot.walk_commands():
+            # noinspection PyProtectedMember
+            buckets.extend(command._buckets._cache.values())
+            if command._max_concurrency is not None:
+                concurrency.extend(command._max_concurrency._mapping.values())
+        return {
+            "cooldown buckets": (buckets, len(buckets)),
+            "concurrency semaphores": (concurrency, len(concurrency)),
+        }
+
+    def caches(self) -> list[CacheReport]:
+        """Gets the object count and estimated size of every known cache, largest first."""
+        # noinspection PyProtectedMember
+        state = self.bot._connection
+        # objects in a cache are measured without the shared objects they point to
+        shared = [self.bot, state, self.bot.view_manager]
+        shared_with_guilds = shared + list(state._guilds.values())
+
+        sources = self._gateway_caches()
+        sources.update(self._command_caches())
+        sources["live views"] = (list(self.bot.view_manager), len(self.bot.view_manager))
+
+        reports = []
+        for name, (items, count) in sources.items():
+            exclude = shared if name == "guilds" else shared_with_guilds
+            reports.append(CacheReport(name, count, estimate_size(items, count, exclude=exclude)))
+
+        for name, cache in self._caches.items():
+            container = cache() if callable(cache) else cache
+            try:
+                count = len(container)
+            except TypeError:
+                count = 1
+            size = getattr(container, "nbytes", None)
+            if size is None:
+                size = deep_getsizeof(container, exclude=shared_with_guilds)
+            reports.append(CacheReport(name, count, size))
+
+        reports.sort(key=lambda r: r.size, reverse=True)
+        return reports
+
+    @staticmethod
+    def process_rss() -> Optional[int]:
+        """Gets the resident set size of the process in bytes, if the platform supports it."""
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            pass
+        try:
+            import resource
+        except ImportError:  # windows
+            return None
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ..core.config import ExecutorsConfig
+
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import multiprocessing
+import pickle
+import time
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator, Literal, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class ExecutorBusy(RuntimeError):
+    """Raised when an executor's workers are all busy and its queue is full."""
+
+    def __init__(self, executor: NamedExecutor):
+        self.executor: NamedExecutor = executor
+        super().__init__(
+            f"The {executor.name} executor is saturated "
+            f"({executor.running} running, {executor.queued} queued)."
+        )
+
+
+@dataclass
+class ExecutorStats:
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    cancelled: int = 0  # calls cancelled before a worker picked them up
+    rejected: int = 0  # calls refused with ExecutorBusy
+    max_queued: int = 0
+    total_wait: float = 0.0  # seconds spent waiting for a free worker
+    max_wait: float = 0.0
+    total_run: float = 0.0
+    max_run: float = 0.0
+
+    @property
+    def avg_wait(self) -> float:
+        return self.total_wait / self.submitted if self.submitted else 0.0
+
+    @property
+    def avg_run(self) -> float:
+        return self.total_run / self.completed if self.completed else 0.0
+
+
+def ensure_picklable(func: Callable) -> None:
+    """
+    Checks that ``func`` can be sent to a worker process.
+
+    Lambdas, closures and methods of objects that hold sockets or locks (cogs, the bot) can't be,
+    and would otherwise only fail once the pool tries to send them.
+
+    Raises:
+        TypeError: If ``func`` can't be pickled.
+    """
+    try:
+        pickle.dumps(func)
+    except (pickle.PicklingError, TypeError, AttributeError) as e:
+        raise TypeError(
+            f"{func!r} can't be sent to a process pool, use a module-level function instead ({e})"
+        ) from None
+
+
+class NamedExecutor:
+    """
+    A thread or process pool with a bounded queue.
+
+    At most ``max_workers`` calls are handed to the pool at once, so its own unbounded queue never
+    grows. Up to ``max_queue`` more callers wait their turn, and any caller beyond that gets
+    ``ExecutorBusy`` straight away instead of piling up behind work that will take minutes.
+    A worker stays reserved until its call finishes, even if the awaiting task is cancelled.
+
+    The pool is created on first use. Process pools use the ``spawn`` start method, since forking a
+    process that runs an event loop and several threads isn't safe.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        kind: Literal["thread", "process"],
+        *,
+        max_workers: int,
+        max_queue: int,
+    ):
+        self.name: str = name
+        self.kind: Literal["thread", "process"] = kind
+        self.max_workers: int = max_workers
+        self.max_queue: int = max_queue
+        self.stats: ExecutorStats = ExecutorStats()
+        self._executor: Optional[concurrent.futures.Executor] = None
+        self._slots = asyncio.Semaphore(max_workers)
+        self._running: int = 0
+        self._queued: int = 0
+        self._logger = logging.getLogger("executors")
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @property
+    def saturated(self) -> bool:
+        return self._running >= self.max_workers and self._queued >= self.max_queue
+
+    def _get_executor(self) -> concurrent.futures.Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix=f"executor-{self.name}"
+                )
+        return self._executor
+
+    async def run(self, func: Callable[..., T], /, *args: Any, **kwargs: Any) -> T:
+        """
+        Runs ``func(*args, **kwargs)`` in the pool and returns its result.
+
+        Raises:
+            ExecutorBusy: If every worker is busy and the queue is full.
+            TypeError: If this is a process pool and ``func`` can't be pickled.
+        """
+        if self.kind == "process":
+            ensure_picklable(func)
+        if self._slots.locked() and self._queued >= self.max_queue:
+            self.stats.rejected += 1
+            raise ExecutorBusy(self)
+
+        stats = self.stats
+        stats.submitted += 1
+        queued_at = time.perf_counter()
+        self._queued += 1
+        stats.max_queued = max(stats.max_queued, self._queued)
+        try:
+            await self._slots.acquire()
+        finally:
+            self._queued -= 1
+        wait = time.perf_counter() - queued_at
+        stats.total_wait += wait
+        stats.max_wait = max(stats.max_wait, wait)
+
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args, **kwargs)
+        try:
+            future = self._get_executor().submit(call)
+        except BaseException:
+            self._slots.release()
+            raise
+        self._running += 1
+        started = time.perf_counter()
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(self._finished, f, started))
+        return await asyncio.wrap_future(future)
+
+    def _finished(self, future: concurrent.futures.Future, started: float) -> None:
+        self._running -= 1
+        self._slots.release()
+        stats = self.stats
+        if future.cancelled():
+            stats.cancelled += 1
+            return
+        duration = time.perf_counter() - started
+        stats.completed += 1
+        stats.total_run += duration
+        stats.max_run = max(stats.max_run, duration)
+        error = future.exception()
+        if error is not None:
+            stats.failed += 1
+            if isinstance(error, BrokenProcessPool):
+                self._logger.error(f"A worker of the {self.name} executor died, the pool will be recreated.")
+                self._executor = None
+
+    def shutdown(self) -> None:
+        """Stops the pool. Queued calls are cancelled and running ones are left to finish."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class Executors:
+    """
+    The bot's named executors. Use ``io`` for blocking calls (file and socket I/O, libraries
+    without async support) and ``cpu`` for CPU-heavy work that would hold the GIL, such as image
+    processing or building spreadsheets, so it can use other cores and never stalls the event loop.
+    """
+
+    def __init__(self):
+        self.io: NamedExecutor = NamedExecutor("io", "thread", max_workers=8, max_queue=64)
+        self.cpu: NamedExecutor = NamedExecutor("cpu", "process", max_workers=2, max_queue=16)
+
+    def __iter__(self) -> Iterator[NamedExecutor]:
+        return iter((self.io, self.cpu))
+
+    def load_config(self, config: ExecutorsConfig) -> None:
+        self.shutdown()
+        self.io = NamedExecutor("io", "thread", max_workers=config.io_workers, max_queue=config.io_queue)
+        self.cpu = NamedExecutor("cpu", "process", max_workers=config.cpu_workers, max_queue=config.cpu_queue)
+
+    def shutdown(self) -> None:
+        for executor in self:
+            executor.shutdown()
@@ -0,0 +1,297 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ..core.client import MyClient
+    from ..core.config import InteractionsConfig
+
+import asyncio
+import contextlib
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import discord
+from discord import app_commands
+
+# Discord drops an interaction that isn't acknowledged within 3 seconds of being created.
+RESPONSE_DEADLINE = 3.0
+
+
+@dataclass
+class HandlerStats:
+    calls: int = 0
+    deferred: int = 0  # acknowledged by the guard because the handler was too slow
+    rerouted: int = 0  # responses sent as followups or edits after the guard deferred
+    exposed: int = 0  # ephemeral responses that replaced a public "thinking..." defer, so were public
+    unanswered: int = 0  # finished without ever acknowledging the interaction
+    total_ack: float = 0.0  # seconds until the interaction was acknowledged, by anyone
+    max_ack: float = 0.0
+
+    @property
+    def acked(self) -> int:
+        return self.calls - self.unanswered
+
+    @property
+    def avg_ack(self) -> float:
+        return self.total_ack / self.acked if self.acked else 0.0
+
+    @property
+    def fallback_rate(self) -> float:
+        return self.deferred / self.calls if self.calls else 0.0
+
+
+class GuardedResponse(discord.InteractionResponse):
+    """
+    An ``InteractionResponse`` that the guard can defer while the handler is still running.
+
+    Responding and the guard's defer are serialized, so they never race each other. Once the guard
+    has deferred, the handler's own ``defer`` does nothing, ``send_message`` sends a followup and
+    ``edit_message`` edits the original response instead, so handlers don't need to know about it.
+    ``send_modal`` can't be rerouted and raises ``InteractionResponded`` like it normally would.
+
+    The first followup after a "thinking..." defer replaces it and keeps its visibility, so an
+    ephemeral response to a public defer is public. That's logged and counted in ``exposed``.
+    """
+
+    __slots__ = (
+        "_guard",
+        "_stats",
+        "_lock",
+        "_started",
+        "_acked",
+        "_auto_deferred",
+        "_timer",
+        "_ephemeral",
+        "_public_thinking",
+    )
+
+    def __init__(
+        self,
+        parent: discord.Interaction,
+        guard: InteractionGuard,
+        stats: HandlerStats,
+        *,
+        ephemeral: bool = False,
+        age: float = 0.0,
+    ):
+        super().__init__(parent)
+        self._guard: InteractionGuard = guard
+        self._stats: HandlerStats = stats
+        self._lock = asyncio.Lock()
+        self._started: float = time.perf_counter() - age  # when Discord created the interaction
+        self._acked: bool = False
+        self._auto_deferred: bool = False
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._ephemeral: bool = ephemeral  # whether a "thinking..." defer is ephemeral
+        self._public_thinking: bool = False  # whether the next followup replaces a public "thinking..."
+
+    @property
+    def auto_deferred(self) -> bool:
+        """Whether the guard acknowledged the interaction instead of the handler."""
+        return self._auto_deferred
+
+    def _ack(self) -> None:
+        if not self._acked and self.is_done():
+            self._acked = True
+            took = time.perf_counter() - self._started
+            self._stats.total_ack += took
+            self._stats.max_ack = max(self._stats.max_ack, took)
+
+    async def _respond(self, method, *args: Any, **kwargs: Any) -> Any:
+        async with self._lock:
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                self._ack()
+
+    async def defer(self, *, ephemeral: bool = False, thinking: bool = False) -> Any:
+        if self._auto_deferred:
+            return None
+        return await self._respond(super().defer, ephemeral=ephemeral, thinking=thinking)
+
+    async def send_message(self, content: Optional[Any] = None, **kwargs: Any) -> Any:
+        if self._auto_deferred:
+            return await self._followup(content, **kwargs)
+        async with self._lock:
+            if not self._auto_deferred:
+                try:
+                    return await super().send_message(content, **kwargs)
+                finally:
+                    self._ack()
+        return await self._followup(content, **kwargs)
+
+    async def edit_message(self, **kwargs: Any) -> Any:
+        if self._auto_deferred:
+            return await self._edit_original(**kwargs)
+        async with self._lock:
+            if not self._auto_deferred:
+                try:
+                    return await super().edit_message(**kwargs)
+                finally:
+                    self._ack()
+        return await self._edit_original(**kwargs)
+
+    async def send_modal(self, modal: discord.ui.Modal, /) -> Any:
+        return await self._respond(super().send_modal, modal)
+
+    async def _followup(self, content: Optional[Any] = None, **kwargs: Any) -> discord.WebhookMessage:
+        self._stats.rerouted += 1
+        if self._public_thinking:
+            self._public_thinking = False
+            if kwargs.get("ephemeral"):
+                self._stats.exposed += 1
+                self._guard.logger.warning(
+                    f"An ephemeral response to interaction {self._parent.id} replaced a public defer and is "
+                    "public. Give its command extras={'defer_ephemeral': True}, or make it respond sooner."
+                )
+        delete_after = kwargs.pop("delete_after", None)
+        if kwargs.get("view") is None:
+            kwargs.pop("view", None)
+        message = await self._parent.followup.send(content, wait=True, **kwargs)
+        if delete_after is not None:
+            await message.delete(delay=delete_after)
+        return message
+
+    async def _edit_original(self, **kwargs: Any) -> discord.InteractionMessage:
+        self._stats.rerouted += 1
+        delete_after = kwargs.pop("delete_after", None)
+        kwargs.pop("suppress_embeds", None)
+        message = await self._parent.edit_original_response(**kwargs)
+        if delete_after is not None:
+            await message.delete(delay=delete_after)
+        return message
+
+    async def _auto_defer(self) -> None:
+        async with self._lock:
+            if self.is_done():
+                return
+            # interactions without a message (app commands, some modals) have nothing to update in place
+            thinking = self._parent.message is None
+            try:
+                await super().defer(thinking=thinking, ephemeral=thinking and self._ephemeral)
+            except discord.HTTPException as e:
+                self._guard.logger.warning(f"Couldn't defer interaction {self._parent.id}: {e}")
+                return
+            self._auto_deferred = True
+            self._public_thinking = thinking and not self._ephemeral
+            self._stats.deferred += 1
+            self._ack()
+
+
+class InteractionGuard:
+    """
+    Keeps slow interaction handlers from missing Discord's 3-second response deadline.
+
+    Every guarded interaction gets a ``GuardedResponse`` and a timer. If the handler hasn't responded
+    ``defer_after`` seconds after Discord created the interaction (so time spent before it reached
+    the handler counts too), the guard defers it, and the handler's later responses are sent as
+    followups. Component callbacks of ``ManagedView`` subclasses and app commands (through
+    ``GuardedCommandTree``) are guarded, and ``stats`` counts per handler how often the fallback was
+    needed.
+
+    App commands are deferred with a "thinking..." message, which is ephemeral if the command has
+    ``extras={"defer_ephemeral": True}``, or if ``ephemeral`` is set and the command doesn't say.
+    """
+
+    def __init__(self, bot: MyClient, *, defer_after: float = 2.0, ephemeral: bool = False):
+        self.bot: MyClient = bot
+        self.enabled: bool = True
+        self.defer_after: float = defer_after
+        self.ephemeral: bool = ephemeral
+        self.stats: dict[str, HandlerStats] = {}
+        self.logger = logging.getLogger("interactions")
+
+    def load_config(self, config: InteractionsConfig) -> None:
+        self.enabled = config.enabled
+        self.defer_after = min(config.defer_after, RESPONSE_DEADLINE)
+        self.ephemeral = config.ephemeral
+
+    def guard(
+        self, interaction: discord.Interaction, handler: str, *, ephemeral: Optional[bool] = None
+    ) -> Optional[GuardedResponse]:
+        """
+        Installs a ``GuardedResponse`` on ``interaction`` and starts its timer.
+
+        This has to run before the handler first touches ``interaction.response``.
+
+        Parameters:
+            interaction: The interaction to guard.
+            handler: The name the handler's stats are kept under.
+            ephemeral: Whether a "thinking..." defer is ephemeral, ``ephemeral`` from the config by default.
+
+        Returns:
+            The guarded response, or ``None`` if the guard is disabled or the interaction can't be
+            deferred (autocomplete, or already responded to).
+        """
+        if not self.enabled or interaction.type is discord.InteractionType.autocomplete:
+            return None
+        # noinspection PyProtectedMember
+        if getattr(interaction, "_cs_response", None) is not None:
+            if isinstance(interaction._cs_response, GuardedResponse) or interaction.response.is_done():  # noqa
+                return None
+
+        stats = self.stats.get(handler)
+        if stats is None:
+            stats = self.stats[handler] = HandlerStats()
+        stats.calls += 1
+
+        # The deadline runs from the interaction's creation, so time spent waiting for the event loop
+        # counts. Clamped, in case this machine's clock is behind or ahead of Discord's.
+        age = min(max(time.time() - interaction.created_at.timestamp(), 0.0), self.defer_after)
+        ephemeral = self.ephemeral if ephemeral is None else ephemeral
+        response = GuardedResponse(interaction, self, stats, ephemeral=ephemeral, age=age)
+        interaction._cs_response = response  # noqa
+        loop = asyncio.get_running_loop()
+        response._timer = loop.call_later(self.defer_after - age, self._fire, response)  # noqa
+        return response
+
+    @staticmethod
+    def _fire(response: GuardedResponse) -> None:
+        if not response.is_done():
+            asyncio.create_task(response._auto_defer(), name="interaction-guard-defer")  # noqa
+
+    @staticmethod
+    def release(response: Optional[GuardedResponse]) -> None:
+        """Stops the timer of a guarded response once its handler has finished."""
+        if response is None:
+            return
+        # noinspection PyProtectedMember
+        if response._timer is not None:
+            response._timer.cancel()  # noqa
+        if not response.is_done():
+            response._stats.unanswered += 1  # noqa
+
+    def worst(self, limit: int = 20) -> list[tuple[str, HandlerStats]]:
+        """Gets the handlers that needed the fallback most often."""
+        ranked = sorted(self.stats.items(), key=lambda kv: (kv[1].deferred, kv[1].max_ack), reverse=True)
+        return ranked[:limit]
+
+
+class GuardedCommandTree(app_commands.CommandTree):
+    """A ``CommandTree`` that runs every app command under the client's ``InteractionGuard``."""
+
+    async def _call(self, interaction: discord.Interaction) -> None:
+        data = interaction.data or {}
+        name = f"/{data.get('name', '?')}"
+        drainer = getattr(self.client, "drainer", None)
+        if drainer is not None and drainer.draining:
+            return await drainer.reject(interaction)
+        guard: Optional[InteractionGuard] = getattr(self.client, "interactions", None)
+        response = None
+        if guard is not None:
+            command = interaction.command
+            ephemeral = command.extras.get("defer_ephemeral") if command is not None else None
+            response = guard.guard(interaction, name, ephemeral=ephemeral)
+        command_scope = getattr(self.client, "command_scope", None)
+        try:
+            with contextlib.ExitStack() as stack:
+                if drainer is not None:
+                    stack.enter_context(drainer.track(name))
+                if command_scope is not None:
+                    stack.enter_context(command_scope())
+                await super()._call(interaction)
+        finally:
+            InteractionGuard.release(response)
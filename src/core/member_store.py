@@ -0,0 +1,432 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ..core.client import MyClient
+    from ..core.config import MemberStoreConfig
+
+import datetime
+import logging
+import math
+import struct
+import sys
+from array import array
+from collections import Counter, OrderedDict
+from collections.abc import ItemsView, MutableMapping, ValuesView
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+import discord
+
+from ..utils.hooks import ParserHook, add_parser_hook, remove_parser_hook
+from ..utils.memory import deep_getsizeof
+
+# User attributes kept for cold members, with the payload key each one is restored from.
+_USER_FIELDS = (
+    ("name", "username", None),
+    ("discriminator", "discriminator", "0"),
+    ("global_name", "global_name", None),
+    ("_avatar", "avatar", None),
+    ("_banner", "banner", None),
+    ("_accent_colour", "accent_color", None),
+    ("_public_flags", "public_flags", 0),
+    ("bot", "bot", False),
+    ("system", "system", False),
+    ("_avatar_decoration_data", "avatar_decoration_data", None),
+    ("_primary_guild", "primary_guild", None),
+    ("_collectibles", "collectibles", None),
+)
+_USER_DEFAULTS = tuple(default for _, _, default in _USER_FIELDS[1:])
+_NO_TIME = math.nan
+
+
+def _timestamp(dt: Optional[datetime.datetime]) -> float:
+    return dt.timestamp() if dt is not None else _NO_TIME
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    if timestamp is None or math.isnan(timestamp):
+        return None
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat()
+
+
+class CompactMemberMap(MutableMapping):
+    """
+    A drop-in replacement for ``Guild._members`` that keeps most members packed in arrays.
+
+    Only the ``hot_size`` most recently used members exist as ``Member`` objects. Every other member
+    is stored as its ID, join time and flags in typed arrays, its role IDs as a slice of one shared
+    array, and its user fields as a tuple, which is a fraction of the size of a ``Member``, its
+    ``User``, ``SnowflakeList``, ``ClientStatus`` and datetimes. Looking up a cold member builds a new
+    ``Member`` from that data, and the least recently used one is packed back into the arrays.
+
+    Since discord.py updates members in place, only hot members can change, and they are packed again
+    when they're evicted. Presences and activities aren't kept for cold members.
+
+    Iterating over ``values()`` (which ``Guild.members`` does) builds a throwaway ``Member`` for every
+    cold member, so prefer ``get`` and the queries below for large guilds.
+    """
+
+    def __init__(self, guild: discord.Guild, *, hot_size: int = 1000):
+        self.guild: discord.Guild = guild
+        self.hot_size: int = hot_size
+        self.materialized: int = 0
+        self.evicted: int = 0
+        self._index: dict[int, int] = {}  # member ID -> slot
+        self._free: list[int] = []
+        self._ids = array("Q")  # 0 marks a free slot
+        self._joined = array("d")
+        self._flags = array("I")
+        self._role_start = array("L")
+        self._role_count = array("H")
+        self._users: list[Optional[tuple | str]] = []
+        self._extra: list[Optional[tuple]] = []  # member fields that are usually unset, None if they all are
+        self._roles = array("Q")
+        self._role_slot = array("L")  # the slot each entry of _roles belongs to
+        self._live_roles: int = 0
+        self._hot: OrderedDict[int, discord.Member] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, member_id: object) -> bool:
+        return member_id in self._index
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(list(self._index))
+
+    def __getitem__(self, member_id: int) -> discord.Member:
+        member = self.get(member_id)
+        if member is None:
+            raise KeyError(member_id)
+        return member
+
+    def get(self, member_id: int, default: Any = None) -> Any:
+        member = self._hot.get(member_id)
+        if member is not None:
+            self._hot.move_to_end(member_id)
+            return member
+        slot = self._index.get(member_id)
+        if slot is None:
+            return default
+        member = self._materialize(slot)
+        self._hot[member_id] = member
+        self._evict()
+        return member
+
+    def __setitem__(self, member_id: int, member: discord.Member) -> None:
+        if member_id not in self._index:
+            self._index[member_id] = self._allocate(member_id)
+        self._hot[member_id] = member
+        self._hot.move_to_end(member_id)
+        self._evict()
+
+    def __delitem__(self, member_id: int) -> None:
+        slot = self._index.pop(member_id)
+        self._hot.pop(member_id, None)
+        self._release(slot)
+
+    def pop(self, member_id: int, *default: Any) -> Any:
+        slot = self._index.get(member_id)
+        if slot is None:
+            if default:
+                return default[0]
+            raise KeyError(member_id)
+        member = self._hot.pop(member_id, None) or self._materialize(slot)
+        del self._index[member_id]
+        self._release(slot)
+        return member
+
+    def clear(self) -> None:
+        self.__init__(self.guild, hot_size=self.hot_size)
+
+    def values(self) -> ValuesView:
+        return _MemberValues(self)
+
+    def items(self) -> ItemsView:
+        return _MemberItems(self)
+
+    def _iter_members(self) -> Iterator[discord.Member]:
+        """Yields every member, building throwaway objects for cold ones instead of caching them."""
+        for member_id, slot in list(self._index.items()):
+            member = self._hot.get(member_id)
+            if member is None and self._users[slot] is not None:
+                member = self._materialize(slot)
+            if member is not None:
+                yield member
+
+    # storage
+
+    def _allocate(self, member_id: int) -> int:
+        if self._free:
+            slot = self._free.pop()
+            self._ids[slot] = member_id
+            self._joined[slot] = _NO_TIME
+            self._flags[slot] = 0
+            self._role_count[slot] = 0
+            self._users[slot] = None
+            self._extra[slot] = None
+            return slot
+        self._ids.append(member_id)
+        self._joined.append(_NO_TIME)
+        self._flags.append(0)
+        self._role_start.append(0)
+        self._role_count.append(0)
+        self._users.append(None)
+        self._extra.append(None)
+        return len(self._ids) - 1
+
+    def _release(self, slot: int) -> None:
+        self._live_roles -= self._role_count[slot]
+        self._ids[slot] = 0
+        self._role_count[slot] = 0
+        self._users[slot] = None
+        self._extra[slot] = None
+        self._free.append(slot)
+
+    def _evict(self) -> None:
+        while len(self._hot) > self.hot_size:
+            member_id, member = self._hot.popitem(last=False)
+            self._pack(self._index[member_id], member)
+            self.evicted += 1
+
+    def _pack(self, slot: int, member: discord.Member) -> None:
+        self._joined[slot] = _timestamp(member.joined_at)
+        self._flags[slot] = member._flags  # noqa
+        self._set_roles(slot, member._roles)  # noqa
+        user = member._user  # noqa
+        fields = tuple(getattr(user, attr, default) for attr, _, default in _USER_FIELDS)
+        # most users only have a username, which is kept on its own instead of in a tuple
+        self._users[slot] = fields[0] if fields[1:] == _USER_DEFAULTS else fields
+        extra = (
+            member.nick,
+            member.pending,
+            member._avatar,  # noqa
+            member._banner,  # noqa
+            member._permissions,  # noqa
+            _timestamp(member.premium_since),
+            _timestamp(member.timed_out_until),
+            member._avatar_decoration_data,  # noqa
+        )
+        has_extra = any(x for x in extra[:5]) or extra[7] is not None
+        has_extra = has_extra or not (math.isnan(extra[5]) and math.isnan(extra[6]))
+        self._extra[slot] = extra if has_extra else None
+
+    def _set_roles(self, slot: int, roles: Iterable[int]) -> None:
+        roles = array("Q", roles)
+        start, count = self._role_start[slot], self._role_count[slot]
+        if len(roles) == count and self._roles[start : start + count] == roles:
+            return
+        self._live_roles += len(roles) - count
+        if len(roles) <= count:
+            self._roles[start : start + len(roles)] = roles
+        else:
+            # the old slice becomes garbage, and is dropped by the next compaction
+            start = len(self._roles)
+            self._roles.extend(roles)
+            self._role_slot.extend([slot] * len(roles))
+            self._role_start[slot] = start
+        self._role_count[slot] = len(roles)
+        if len(self._roles) > 2 * self._live_roles + 4096:
+            self._compact_roles()
+
+    def _compact_roles(self) -> None:
+        roles, owners = array("Q"), array("L")
+        for slot, member_id in enumerate(self._ids):
+            count = self._role_count[slot]
+            if member_id and count:
+                start = self._role_start[slot]
+                self._role_start[slot] = len(roles)
+                roles.extend(self._roles[start : start + count])
+                owners.extend([slot] * count)
+        self._roles, self._role_slot = roles, owners
+
+    def _materialize(self, slot: int) -> discord.Member:
+        self.materialized += 1
+        user = self._users[slot]
+        if isinstance(user, str):
+            user = (user,) + _USER_DEFAULTS
+        user_data = {key: value for (_, key, _), value in zip(_USER_FIELDS, user)}
+        user_data["id"] = self._ids[slot]
+        start = self._role_start[slot]
+        data = {
+            "user": user_data,
+            "roles": self._roles[start : start + self._role_count[slot]].tolist(),
+            "joined_at": _iso(self._joined[slot]),
+            "flags": self._flags[slot],
+        }
+        extra = self._extra[slot]
+        if extra is not None:
+            nick, pending, avatar, banner, permissions, premium_since, timed_out_until, decoration = extra
+            data.update(
+                nick=nick,
+                pending=pending,
+                avatar=avatar,
+                banner=banner,
+                premium_since=_iso(premium_since),
+                communication_disabled_until=_iso(timed_out_until),
+                avatar_decoration_data=decoration,
+            )
+            if permissions is not None:
+                data["permissions"] = str(permissions)
+        # noinspection PyProtectedMember
+        return discord.Member(data=data, guild=self.guild, state=self.guild._state)  # type: ignore
+
+    def sync(self) -> None:
+        """Packs every hot member, so the queries below see their latest roles and join times."""
+        for member_id, member in self._hot.items():
+            self._pack(self._index[member_id], member)
+
+    # queries
+
+    def _role_slots(self, role_id: int) -> Iterator[int]:
+        """Slots of the members that have ``role_id``, found with a C-level search of the role array."""
+        needle = struct.pack("=Q", role_id)
+        haystack = self._roles.tobytes()
+        position = haystack.find(needle)
+        while position != -1:
+            if position % 8 == 0:
+                index = position // 8
+                slot = self._role_slot[index]
+                start = self._role_start[slot]
+                if self._ids[slot] and start <= index < start + self._role_count[slot]:
+                    yield slot
+                position = haystack.find(needle, position + 8)
+            else:
+                position = haystack.find(needle, position + 1)
+
+    def with_role(self, role_id: int) -> list[int]:
+        """Gets the IDs of the members with a role without building a ``Member`` for each of them."""
+        self.sync()
+        return [self._ids[slot] for slot in self._role_slots(role_id)]
+
+    def with_any_role(self, role_ids: Iterable[int]) -> set[int]:
+        self.sync()
+        return {self._ids[slot] for role_id in role_ids for slot in self._role_slots(role_id)}
+
+    def role_counts(self) -> Counter:
+        """Gets the number of members that have each role."""
+        self.sync()
+        self._compact_roles()
+        return Counter(self._roles)
+
+    def joined_between(self, after: datetime.datetime, before: datetime.datetime) -> list[int]:
+        self.sync()
+        low, high = after.timestamp(), before.timestamp()
+        return [self._ids[slot] for slot, joined in enumerate(self._joined) if low <= joined < high and self._ids[slot]]
+
+    @property
+    def hot(self) -> int:
+        return len(self._hot)
+
+    @property
+    def nbytes(self) -> int:
+        """Estimated memory used by the packed members. Hot members aren't included."""
+        arrays = (self._ids, self._joined, self._flags, self._role_start, self._role_count, self._roles, self._role_slot)
+        total = sum(sys.getsizeof(a) for a in arrays)
+        total += sys.getsizeof(self._index) + sys.getsizeof(self._users) + sys.getsizeof(self._extra)
+        total += len(self._index) * (sys.getsizeof(2**63) + sys.getsizeof(2**30))  # index keys and values
+        sample = [user for user in self._users[:50] if user is not None]
+        if sample:
+            per_user = sum(deep_getsizeof(user) for user in sample) / len(sample)
+            total += int(per_user * len(self._index))
+        return total
+
+
+class _MemberValues(ValuesView):
+    def __iter__(self) -> Iterator[discord.Member]:
+        return self._mapping._iter_members()  # noqa
+
+
+class _MemberItems(ItemsView):
+    def __iter__(self) -> Iterator[tuple[int, discord.Member]]:
+        return ((member.id, member) for member in self._mapping._iter_members())  # noqa
+
+
+class MemberStore:
+    """
+    Swaps the member cache of every guild with at least ``min_members`` members for a
+    ``CompactMemberMap``, when it's created and as member chunks arrive.
+    """
+
+    def __init__(self, bot: MyClient, *, enabled: bool = False, min_members: int = 1000, hot_size: int = 1000):
+        self.bot: MyClient = bot
+        self.enabled: bool = enabled
+        self.min_members: int = min_members
+        self.hot_size: int = hot_size
+        self._hooks: list[ParserHook] = []
+        self._logger = logging.getLogger("member-store")
+
+    def load_config(self, config: MemberStoreConfig) -> None:
+        self.min_members = config.min_members
+        self.hot_size = config.hot_size
+        for compact in self.compact_guilds().values():
+            compact.hot_size = config.hot_size
+            compact._evict()  # noqa
+        if config.enabled and not self.enabled:
+            self.start()
+        elif not config.enabled and self.enabled:
+            self.stop()
+
+    def start(self) -> None:
+        # noinspection PyProtectedMember
+        parsers = self.bot._connection.parsers
+        for event in ("GUILD_CREATE", "GUILD_MEMBERS_CHUNK"):
+            hook = add_parser_hook(parsers, event, self._after_parse)
+            if hook is not None:
+                self._hooks.append(hook)
+        self.enabled = True
+        for guild in self.bot.guilds:
+            self.maybe_compact(guild)
+
+    def stop(self) -> None:
+        """Unhooks and turns every compact member cache back into a dict, which builds every member."""
+        # noinspection PyProtectedMember
+        parsers = self.bot._connection.parsers
+        for hook in self._hooks:
+            remove_parser_hook(parsers, hook)
+        self._hooks.clear()
+        self.enabled = False
+        for guild, compact in self.compact_guilds().items():
+            guild._members = dict(compact.items())  # noqa
+
+    def _after_parse(self, data: Any, inner: Callable[[Any], None]) -> None:
+        inner(data)
+        guild_id = data.get("guild_id") or data.get("id")
+        # noinspection PyProtectedMember
+        guild = self.bot._connection._get_guild(int(guild_id)) if guild_id else None
+        if guild is not None:
+            self.maybe_compact(guild)
+
+    def maybe_compact(self, guild: discord.Guild) -> Optional[CompactMemberMap]:
+        # noinspection PyProtectedMember
+        members = guild._members
+        if isinstance(members, CompactMemberMap):
+            return members
+        if len(members) < self.min_members:
+            return None
+        compact = CompactMemberMap(guild, hot_size=self.hot_size)
+        for member_id, member in members.items():
+            compact[member_id] = member
+        guild._members = compact  # noqa
+        self._logger.debug(f"Compacted {len(compact)} members of {guild.id}.")
+        return compact
+
+    def __len__(self) -> int:
+        return sum(len(compact) for compact in self.compact_guilds().values())
+
+    @property
+    def nbytes(self) -> int:
+        return sum(compact.nbytes for compact in self.compact_guilds().values())
+
+    def compact_guilds(self) -> dict[discord.Guild, CompactMemberMap]:
+        # noinspection PyProtectedMember
+        return {g: g._members for g in self.bot.guilds if isinstance(g._members, CompactMemberMap)}
+
+    def with_role(self, role: discord.Role) -> list[int]:
+        """Gets the IDs of the members with ``role``, using the compact search when the guild has one."""
+        # noinspection PyProtectedMember
+        members = role.guild._members
+        if isinstance(members, CompactMemberMap):
+            return members.with_role(role.id)
+        return [member.id for member in role.members]
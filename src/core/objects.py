@@ -1,4 +1,186 @@
-from discord.ext.commands import Paginator as CommandPaginator
+import asyncio
+import codecs
+import io
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Optional, Union
+
+TextSource = Union[str, io.TextIOBase, Iterable[str]]
+
+
+def _safe_cut(text: str, start: int, end: int) -> int:
+    """
+    Finds the closest index <= ``end`` at which ``text`` can be split without breaking a surrogate
+    pair or a run of backticks (i.e. a code block fence).
+    """
+    if end >= len(text):
+        return len(text)
+
+    cut = end
+    if "\ud800" <= text[cut - 1] <= "\udbff":  # don't separate a high surrogate from its pair
+        cut -= 1
+
+    if text[cut] == "`" and text[cut - 1] == "`":
+        run_start = cut - 1
+        while run_start > start and text[run_start - 1] == "`":
+            run_start -= 1
+        if run_start > start:  # a fence that's longer than the whole page has to be split
+            cut = run_start
+    return cut if cut > start else end
+
+
+class _PageBuilder:
+    """Incrementally packs fed text into page bodies of at most ``budget`` characters."""
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self._page: list[str] = []
+        self._page_size: int = 0
+        self._line: list[str] = []
+        self._line_size: int = 0
+
+    def feed(self, text: str) -> Iterator[str]:
+        pos = 0
+        while True:
+            newline = text.find("\n", pos)
+            if newline == -1:
+                yield from self._add_to_line(text[pos:])
+                return
+            yield from self._add_to_line(text[pos:newline])
+            yield from self._end_line()
+            pos = newline + 1
+
+    def close(self) -> Iterator[str]:
+        if self._line:
+            yield from self._end_line()
+        if self._page:
+            yield self._flush_page()
+
+    def _add_to_line(self, segment: str) -> Iterator[str]:
+        if not segment:
+            return
+        self._line.append(segment)
+        self._line_size += len(segment)
+        if self._line_size <= self.budget:
+            return
+
+        # the line doesn't fit on a page of its own, so it's chunked into full pages
+        if self._page:
+            yield self._flush_page()
+        line = "".join(self._line)
+        pos = 0
+        while len(line) - pos > self.budget:
+            cut = _safe_cut(line, pos, pos + self.budget)
+            yield line[pos:cut]
+            pos = cut
+        self._line = [line[pos:]]
+        self._line_size = len(line) - pos
+
+    def _end_line(self) -> Iterator[str]:
+        line = "".join(self._line)
+        self._line.clear()
+        self._line_size = 0
+
+        separator = 1 if self._page else 0
+        if self._page and self._page_size + separator + len(line) > self.budget:
+            yield self._flush_page()
+            separator = 0
+        self._page.append(line)
+        self._page_size += separator + len(line)
+
+    def _flush_page(self) -> str:
+        body = "\n".join(self._page)
+        self._page.clear()
+        self._page_size = 0
+        return body
+
+
+class TextPaginator:
+    """
+    Splits text into Discord-sized pages in a single pass.
+
+    Pages are yielded as they fill up, so the source can be a string, a text file, any iterable of
+    text chunks or an async byte stream, and it is never held in memory more than once. Sizes are
+    counted in characters, and pages are never split inside a surrogate pair or a code block fence.
+
+    Parameters:
+        prefix: Text placed at the start of every page.
+        suffix: Text placed at the end of every page.
+        max_size: The maximum size of a page, including the prefix, suffix and footer.
+        code_block: Whether to add ``block_prefix`` as the code block language after the prefix.
+        block_prefix: The code block language.
+        footer_reserve: Characters left free on each page for a footer such as the page number.
+    """
+
+    def __init__(
+        self,
+        *,
+        prefix: str = "```",
+        suffix: str = "```",
+        max_size: int = 2000,
+        code_block: bool = False,
+        block_prefix: str = "py",
+        footer_reserve: int = 32,
+    ):
+        if code_block:
+            prefix += (
+                block_prefix + "\n" if not block_prefix.endswith("\n") else block_prefix
+            )
+        self.head = prefix if not prefix or prefix.endswith("\n") else prefix + "\n"
+        self.tail = "\n" + suffix if suffix else ""
+        self.budget = max_size - len(self.head) - len(self.tail) - footer_reserve
+        if self.budget <= 0:
+            raise ValueError("max_size is too small to fit the prefix and suffix.")
+
+    def _wrap(self, body: str) -> str:
+        return f"{self.head}{body}{self.tail}"
+
+    def iter_bodies(self, source: TextSource) -> Iterator[str]:
+        """Yields the page contents without the prefix and suffix."""
+        builder = _PageBuilder(self.budget)
+        chunks = (source,) if isinstance(source, str) else source
+        empty = True
+        for chunk in chunks:
+            for body in builder.feed(chunk):
+                empty = False
+                yield body
+        for body in builder.close():
+            empty = False
+            yield body
+        if empty:
+            yield ""
+
+    def paginate(self, source: TextSource) -> Iterator[str]:
+        for body in self.iter_bodies(source):
+            yield self._wrap(body)
+
+    async def apaginate(
+        self,
+        stream: Union[AsyncIterable[bytes], asyncio.StreamReader],
+        *,
+        chunk_size: int = 65536,
+    ) -> AsyncIterator[str]:
+        """
+        Paginates an async byte stream (e.g. a subprocess pipe) as it is being read.
+        Multibyte UTF-8 characters that are split between reads are decoded correctly.
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        builder = _PageBuilder(self.budget)
+
+        async def _read_chunks():
+            while chunk := await stream.read(chunk_size):
+                yield chunk
+
+        chunks = _read_chunks() if hasattr(stream, "read") else stream
+
+        async for chunk in chunks:
+            for body in builder.feed(decoder.decode(chunk)):
+                yield self._wrap(body)
+        for body in builder.feed(decoder.decode(b"", final=True)):
+            yield self._wrap(body)
+        for body in builder.close():
+            yield self._wrap(body)
+
+    def count(self, source: TextSource) -> int:
+        return sum(1 for _ in self.iter_bodies(source))
 
 
 class TextPageSource:
@@ -6,7 +188,7 @@ class TextPageSource:
 
     def __init__(
         self,
-        text,
+        text: TextSource,
         *,
         prefix="```",
         suffix="```",
@@ -14,36 +196,39 @@ class TextPageSource:
         code_block=False,
         block_prefix="py",
     ):
-        self._max_size = max_size
+        self._source = text
+        self._start: Optional[int] = (
+            text.tell() if isinstance(text, io.IOBase) and text.seekable() else None
+        )
+        self._page_count: Optional[int] = None
+        self.paginator = TextPaginator(
+            prefix=prefix,
+            suffix=suffix,
+            max_size=max_size,
+            code_block=code_block,
+            block_prefix=block_prefix,
+        )
 
-        if code_block:
-            prefix += (
-                block_prefix + "\n" if not block_prefix.endswith("\n") else block_prefix
-            )
-        pages = CommandPaginator(prefix=prefix, suffix=suffix, max_size=max_size - 200)
-        for line in text.split("\n"):
-            try:
-                pages.add_line(line)
-            except RuntimeError:
-                converted_lines = self.__convert_to_chunks(line)
-                for line in converted_lines:  # noqa
-                    pages.add_line(line)
-        self.pages = pages
+    def _rewind(self) -> TextSource:
+        if self._start is not None:
+            self._source.seek(self._start)
+        return self._source
+
+    @property
+    def page_count(self) -> int:
+        """The total number of pages. Only computed the first time it's accessed."""
+        if self._page_count is None:
+            self._page_count = self.paginator.count(self._rewind())
+        return self._page_count
+
+    def __iter__(self) -> Iterator[str]:
+        return self.paginator.paginate(self._rewind())
 
     def getPages(self, *, page_number=True):
         """Gets the pages."""
-        pages = []
-        page_num = 1  # noqa
-        for page in self.pages.pages:
-            if page_number:
-                page += f"\nPage {page_num}/{len(self.pages.pages)}"
-                page_num += 1
-            pages.append(page)
+        pages = list(self)
+        self._page_count = len(pages)
+        if page_number:
+            for i, page in enumerate(pages):
+                pages[i] = f"{page}\nPage {i + 1}/{self._page_count}"
         return pages
-
-    def __convert_to_chunks(self, text):
-        """Convert the text to chunks of size max_size-300"""
-        chunks = []
-        for i in range(0, len(text), self._max_size - 300):
-            chunks.append(text[i : i + self._max_size - 300])
-        return chunks
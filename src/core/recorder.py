@@ -0,0 +1,375 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from discord.state import ConnectionState
+
+    from ..core.client import MyClient
+    from ..core.config import RecorderConfig
+
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, Optional
+
+from discord.utils import _to_json  # noqa
+
+from .executors import ExecutorBusy
+from ..utils.hooks import ParserHook, add_parser_hook, remove_parser_hook
+
+FORMAT_VERSION = 1
+
+# Free-form text that may identify people or contain private messages.
+TEXT_KEYS = frozenset(
+    {
+        "content",
+        "username",
+        "global_name",
+        "nick",
+        "name",
+        "topic",
+        "description",
+        "title",
+        "value",
+        "text",
+        "email",
+        "token",
+        "url",
+        "proxy_url",
+        "avatar",
+        "banner",
+        "icon",
+        "splash",
+        "bio",
+        "pronouns",
+        "state",
+        "details",
+        "custom_id",
+    }
+)
+# Keys whose value is a list of snowflakes.
+ID_LIST_KEYS = frozenset({"roles", "mention_roles", "applied_tags", "values"})
+_SNOWFLAKE_WORKER_BITS = 22
+
+
+class Anonymizer:
+    """
+    Scrubs a dispatch payload so it can be shared.
+
+    Text is replaced with filler of the same length, so payload sizes (and the memory they cost once
+    cached) don't change. Snowflakes keep their timestamp bits and get their low bits from a keyed
+    hash, so the same ID always maps to the same fake ID within a process and ordering and
+    ``created_at`` are preserved, but the original can't be recovered once the key is gone.
+    """
+
+    def __init__(self, key: Optional[bytes] = None):
+        self._key: bytes = key or secrets.token_bytes(32)
+        self._ids: dict[str, str] = {}
+
+    def snowflake(self, value: str) -> str:
+        mapped = self._ids.get(value)
+        if mapped is None:
+            original = int(value)
+            digest = hmac.new(self._key, value.encode(), hashlib.sha256).digest()
+            low = int.from_bytes(digest[:8], "big") & ((1 << _SNOWFLAKE_WORKER_BITS) - 1)
+            mapped = str((original >> _SNOWFLAKE_WORKER_BITS) << _SNOWFLAKE_WORKER_BITS | low)
+            self._ids[value] = mapped
+        return mapped
+
+    def __call__(self, data: Any, key: Optional[str] = None) -> Any:
+        if isinstance(data, dict):
+            return {k: self(v, k) for k, v in data.items()}
+        if isinstance(data, list):
+            if key in ID_LIST_KEYS or (key or "").endswith("_ids"):
+                return [self.snowflake(v) if _is_snowflake(v) else self(v) for v in data]
+            return [self(v) for v in data]
+        if isinstance(data, str):
+            if key is not None and (key == "id" or key.endswith("_id")) and _is_snowflake(data):
+                return self.snowflake(data)
+            if key in TEXT_KEYS:
+                return "x" * len(data)
+        return data
+
+
+def _is_snowflake(value: Any) -> bool:
+    return isinstance(value, str) and value.isdigit() and len(value) >= 15
+
+
+class GatewayRecorder:
+    """
+    Records raw gateway dispatch payloads to an append-only, gzip-compressed JSON lines file.
+
+    Every parser of the client's connection state is wrapped, so the payload is captured exactly as
+    the gateway delivered it, before discord.py parses it. Recording only costs one JSON encode per
+    event on the event loop: anonymization, compression and disk writes happen in a worker thread
+    every ``flush_interval`` seconds.
+
+    Each recording session starts with a header line, followed by one ``[timestamp, event, data]``
+    line per dispatch. Every flush is written as its own gzip member, so the file can be appended to
+    across restarts and a crash only loses the last unflushed batch.
+    """
+
+    def __init__(
+        self,
+        bot: MyClient,
+        *,
+        path: str = "cache/gateway/recording.jsonl.gz",
+        anonymize: bool = True,
+        events: Optional[set[str]] = None,
+        flush_interval: float = 5.0,
+    ):
+        self.bot: MyClient = bot
+        self.path: str = path
+        self.anonymize: bool = anonymize
+        self.events: Optional[set[str]] = events
+        self.flush_interval: float = flush_interval
+        self.recorded: int = 0
+        self.bytes_written: int = 0
+        self._buffer: list[bytes] = []
+        self._hooks: list[ParserHook] = []
+        self._anonymizer = Anonymizer()
+        self._write_lock = asyncio.Lock()
+        self._logger = logging.getLogger("recorder")
+
+    @property
+    def is_recording(self) -> bool:
+        return bool(self._hooks)
+
+    def load_config(self, config: RecorderConfig) -> None:
+        changed = (self.path, self.anonymize) != (config.path, config.anonymize)
+        if changed and self.is_recording:
+            self.stop()
+        self.path = config.path
+        self.anonymize = config.anonymize
+        self.events = set(config.events) or None
+        if config.flush_interval != self.flush_interval:
+            self.flush_interval = config.flush_interval
+            if self.is_recording:
+                self._schedule_flush()
+        if config.enabled and not self.is_recording:
+            self.start()
+        elif not config.enabled and self.is_recording:
+            self.stop()
+
+    def _record(self, data: Any, inner: Callable[[Any], None], event: str) -> None:
+        # encode before parsing, since some parsers mutate the payload
+        self._buffer.append(_to_json([round(time.time(), 4), event, data]).encode("utf-8"))
+        self.recorded += 1
+        inner(data)
+
+    def _hook_for(self, event: str) -> Callable[[Any, Callable[[Any], None]], None]:
+        return lambda data, inner: self._record(data, inner, event)
+
+    def start(self) -> None:
+        """Starts recording. Must be called from within the event loop."""
+        if self.is_recording:
+            return
+        # noinspection PyProtectedMember
+        parsers = self.bot._connection.parsers
+        for event in list(parsers):
+            if self.events is None or event in self.events:
+                self._hooks.append(add_parser_hook(parsers, event, self._hook_for(event)))
+
+        header = {
+            "version": FORMAT_VERSION,
+            "started_at": time.time(),
+            "anonymized": self.anonymize,
+            "events": sorted(hook.event for hook in self._hooks),
+        }
+        self._buffer.append(json.dumps(header).encode("utf-8"))
+        self._schedule_flush()
+        self._logger.info(f"Recording gateway events to {self.path}.")
+
+    def stop(self) -> None:
+        """Stops recording and restores the original parsers. Pending events are flushed in the background."""
+        if not self.is_recording:
+            return
+        self._unhook()
+        asyncio.create_task(self._scheduled_flush())
+        self._logger.info(f"Stopped recording gateway events ({self.recorded} recorded).")
+
+    async def close(self) -> None:
+        if self.is_recording:
+            self._unhook()
+        await self.flush()
+
+    def _unhook(self) -> None:
+        # noinspection PyProtectedMember
+        parsers = self.bot._connection.parsers
+        for hook in self._hooks:
+            remove_parser_hook(parsers, hook)
+        self._hooks.clear()
+        self.bot.scheduler.cancel("gateway-recorder.flush")
+
+    def _schedule_flush(self) -> None:
+        self.bot.scheduler.every("gateway-recorder.flush", self._scheduled_flush, self.flush_interval)
+
+    async def _scheduled_flush(self) -> None:
+        try:
+            await self.flush()
+        except ExecutorBusy:
+            pass
+        except OSError as e:
+            self._logger.error(f"Failed to write the gateway recording: {e}")
+
+    async def flush(self) -> None:
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        async with self._write_lock:
+            try:
+                self.bytes_written += await self.bot.executors.io.run(self._write, lines)
+            except ExecutorBusy:
+                self._buffer[:0] = lines  # try again on the next flush
+                raise
+
+    def _write(self, lines: list[bytes]) -> int:
+        if self.anonymize:
+            lines = [
+                line if line.startswith(b"{") else self._anonymize_line(line) for line in lines
+            ]
+        chunk = gzip.compress(b"\n".join(lines) + b"\n", compresslevel=6)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "ab") as f:
+            f.write(chunk)
+        return len(chunk)
+
+    def _anonymize_line(self, line: bytes) -> bytes:
+        timestamp, event, data = json.loads(line)
+        return _to_json([timestamp, event, self._anonymizer(data)]).encode("utf-8")
+
+
+@dataclass
+class Recording:
+    """
+    One recording session read back from a file. Its records are read from the file as they're
+    iterated, so they can only be iterated once, and before moving on to the next session.
+    """
+
+    header: dict
+    records: Iterator[tuple[float, str, Any]] = field(default_factory=lambda: iter(()))
+    first_at: Optional[float] = None
+    last_at: Optional[float] = None
+
+    @property
+    def duration(self) -> float:
+        """The time between the first and the last record read so far."""
+        return self.last_at - self.first_at if self.first_at is not None else 0.0
+
+
+def _read_items(path: str) -> Iterator[Any]:
+    header_read = False
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+                header_read = True
+    except EOFError:
+        pass  # the last batch was cut off, e.g. by a crash while writing
+    except (gzip.BadGzipFile, zlib.error, json.JSONDecodeError) as e:
+        if not header_read:
+            raise ValueError(f"{path} is not a gateway recording: {e}") from e
+
+
+def _read_records(session: Recording, items: Iterator[Any], following: list[dict]) -> Iterator[tuple[float, str, Any]]:
+    for item in items:
+        if isinstance(item, dict):  # the next session's header
+            following.append(item)
+            return
+        if session.first_at is None:
+            session.first_at = item[0]
+        session.last_at = item[0]
+        yield item[0], item[1], item[2]
+
+
+def read_recording(path: str) -> Iterator[Recording]:
+    """
+    Reads the sessions in a recording file one at a time. Each session's records are streamed from the
+    file while they're iterated, and the ones that weren't are skipped when the next session is read.
+
+    Raises:
+        OSError: If the file can't be read.
+        ValueError: If the file isn't a gateway recording.
+    """
+    items = _read_items(path)
+    item = next(items, None)
+    while item is not None:
+        if not isinstance(item, dict):
+            raise ValueError("The recording doesn't start with a header.")
+        if item.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported recording version: {item.get('version')}")
+        session = Recording(item)
+        following: list[dict] = []
+        session.records = _read_records(session, items, following)
+        yield session
+        for _ in session.records:
+            pass
+        item = following[0] if following else None
+
+
+@dataclass
+class ReplayStats:
+    events: int = 0
+    duration: float = 0.0
+    skipped: Counter = field(default_factory=Counter)
+    errors: Counter = field(default_factory=Counter)
+    per_event: Counter = field(default_factory=Counter)
+    parse_time: Counter = field(default_factory=Counter)  # seconds spent in each event's parser
+
+
+class GatewayReplayer:
+    """
+    Feeds a recording back into a client's gateway parsers.
+
+    Parameters:
+        state: The connection state whose parsers receive the events.
+        speed: ``1.0`` keeps the original timing, ``10.0`` replays ten times faster and ``None``
+            replays as fast as possible. Events are always delivered in their original order, and
+            the loop gets a chance to run the handlers they dispatch between events.
+    """
+
+    def __init__(self, state: ConnectionState, *, speed: Optional[float] = 1.0):
+        self.state: ConnectionState = state
+        self.speed: Optional[float] = speed
+
+    async def replay(self, recording: Recording) -> ReplayStats:
+        stats = ReplayStats()
+        parsers = self.state.parsers
+        started = time.perf_counter()
+        origin = None
+
+        for timestamp, event, data in recording.records:
+            if origin is None:
+                origin = timestamp
+            if self.speed is not None:
+                due = started + (timestamp - origin) / self.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            parser = parsers.get(event)
+            if parser is None:
+                stats.skipped[event] += 1
+                continue
+            parse_started = time.perf_counter()
+            try:
+                parser(data)
+            except Exception:  # noqa
+                stats.errors[event] += 1
+            stats.parse_time[event] += time.perf_counter() - parse_started
+            stats.per_event[event] += 1
+            stats.events += 1
+            await asyncio.sleep(0)  # let the dispatched handlers run, like the gateway does between messages
+
+        stats.duration = time.perf_counter() - started
+        return stats
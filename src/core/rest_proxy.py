@@ -0,0 +1,470 @@
+"""
+A local HTTP proxy that applies Discord's REST rate limits for every bot process on the host.
+
+Each process only knows the buckets it has used itself, so several processes sharing a token run
+into the same limits without seeing each other, and get 429s (and eventually Cloudflare bans) for
+it. With ``rest-proxy`` enabled in ``config.yml``, the bot sends every REST request here instead, and
+the proxy forwards them upstream one bucket at a time::
+
+    python -m src.core.rest_proxy                                       # upstream from config.yml
+    python -m src.core.rest_proxy --upstream http://127.0.0.1:8765      # benchmarks/fake_discord.py
+
+``GET /_proxy/metrics`` returns the queue depth, waits and 429s of every route.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import dataclasses
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Optional
+
+import aiohttp
+from aiohttp import web
+
+from .config import ConfigError, ConfigManager, RestProxyConfig
+
+_log = logging.getLogger("rest-proxy")
+
+# the path segments after which Discord scopes a bucket to the resource (the "major parameters")
+_MAJOR = {"channels": 1, "guilds": 1, "webhooks": 2, "interactions": 2}
+_API_PREFIX = re.compile(r"^/api/v\d+")
+_SNOWFLAKE = re.compile(r"^\d+$")
+# never forwarded in either direction
+_HOP_BY_HOP = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+    "host",
+    "content-length",
+    "content-encoding",
+    "accept-encoding",
+}
+UNLIMITED = 1 << 30
+# the global limit is per second, counted where Discord receives the requests, so leave room for latency jitter
+_GLOBAL_WINDOW = 1.1
+
+
+def route_key(method: str, path: str) -> tuple[str, str]:
+    """
+    Splits a request into its route (``POST /channels/{id}/messages``) and its major parameters
+    (the channel, guild, webhook or interaction it's about), which together identify its bucket.
+    """
+    segments = _API_PREFIX.sub("", path).strip("/").split("/")
+    template, major = [], []
+    keep = 0
+    previous = ""
+    for segment in segments:
+        if keep:
+            major.append(segment)
+            template.append("{token}" if major and len(major) > 1 else "{id}")
+            keep -= 1
+        elif segment in _MAJOR and not major:
+            template.append(segment)
+            keep = _MAJOR[segment]
+        elif previous == "reactions":
+            template.append("{emoji}")
+        elif _SNOWFLAKE.match(segment):
+            template.append("{id}")
+        else:
+            template.append(segment)
+        previous = segment
+    return f"{method} /{'/'.join(template)}", ":".join(major)
+
+
+@dataclass
+class RouteMetrics:
+    requests: int = 0
+    sent: int = 0
+    queued: int = 0  # waiting in the proxy right now
+    max_queued: int = 0
+    total_wait: float = 0.0  # seconds between arriving and being sent upstream
+    max_wait: float = 0.0
+    rate_limited: int = 0  # 429s from upstream, each one retried
+    rejected: int = 0  # gave up after max-wait or max-retries
+    errors: int = 0  # upstream unreachable
+
+    def to_dict(self) -> dict:
+        sent = self.sent
+        return {
+            "requests": self.requests,
+            "sent": sent,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "avg_wait_ms": round(self.total_wait / sent * 1000, 2) if sent else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "rate_limited": self.rate_limited,
+            "rejected": self.rejected,
+            "errors": self.errors,
+        }
+
+
+class Bucket:
+    """
+    One Discord rate-limit bucket. Requests take a slot in arrival order and wait for the window
+    to reset once it's used up. When a window starts, nobody knows when it ends until the first of its
+    responses says so, and requests beyond the limit wait for that rather than for a guess.
+    """
+
+    __slots__ = ("limit", "remaining", "reset_at", "window_start", "in_flight", "last_used", "_lock", "_learned")
+
+    def __init__(self):
+        self.limit: Optional[int] = None  # until the first response
+        self.remaining: int = 1
+        self.reset_at: Optional[float] = None  # loop time, None while the window's responses are pending
+        self.window_start: float = 0.0
+        self.in_flight: int = 0
+        self.last_used: float = 0.0
+        self._lock = asyncio.Lock()  # FIFO, so the route's requests go out in order
+        self._learned = asyncio.Event()
+
+    @property
+    def idle(self) -> bool:
+        return self.in_flight == 0 and not self._lock.locked()
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            while True:
+                now = loop.time()
+                if self.remaining > 0:
+                    self.remaining -= 1
+                    self.in_flight += 1
+                    self.last_used = now
+                    return
+                if self.reset_at is None:
+                    if self.in_flight:
+                        self._learned.clear()
+                        await self._learned.wait()
+                    else:  # every request failed without telling us anything
+                        self.remaining = 1
+                elif now >= self.reset_at:
+                    self.remaining = self.limit
+                    self.reset_at = None
+                    self.window_start = now
+                else:
+                    await asyncio.sleep(self.reset_at - now)
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        if not self.in_flight:
+            self._learned.set()
+
+    def update(self, headers, now: float) -> None:
+        remaining = headers.get("X-RateLimit-Remaining")
+        if remaining is None:
+            if self.limit is None:  # a route without a rate limit
+                self.limit = self.remaining = UNLIMITED
+            self._learned.set()
+            return
+        reset_at = now + float(headers.get("X-RateLimit-Reset-After", 0))
+        if reset_at <= self.window_start:  # a straggler from an earlier window
+            return
+        # the header counts every request upstream has seen, including other processes'
+        remaining = max(int(remaining) - self.in_flight, 0)
+        if self.limit is None or (self.reset_at is not None and reset_at > self.reset_at + 0.1):
+            self.remaining = remaining
+        else:
+            self.remaining = min(self.remaining, remaining)
+        self.limit = int(headers.get("X-RateLimit-Limit", remaining + 1))
+        self.reset_at = reset_at
+        self._learned.set()
+
+    def exhaust(self, retry_after: float, now: float) -> None:
+        self.remaining = 0
+        self.reset_at = now + retry_after
+        if self.limit is None:
+            self.limit = 1
+        self._learned.set()
+
+
+class FairLimiter:
+    """
+    The global limit of one token, counted over a sliding window a little longer than a second, so no
+    second of Discord's sees more than ``rate`` requests. When it's reached, waiting requests are let
+    through round-robin by route, so one busy route can't starve the others.
+    """
+
+    def __init__(self, rate: float):
+        self.rate: int = max(int(rate), 1)
+        self.paused_until: float = 0.0
+        self._sent: deque[float] = deque()
+        self._queues: OrderedDict[str, deque[asyncio.Future]] = OrderedDict()
+        self._pump: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def pause(self, seconds: float) -> None:
+        """Stops every request for ``seconds``, after a global 429."""
+        self.paused_until = max(self.paused_until, asyncio.get_running_loop().time() + seconds)
+
+    def _take(self, now: float) -> bool:
+        sent = self._sent
+        while sent and sent[0] <= now - _GLOBAL_WINDOW:
+            sent.popleft()
+        if now < self.paused_until or len(sent) >= self.rate:
+            return False
+        sent.append(now)
+        return True
+
+    async def acquire(self, route: str) -> None:
+        loop = asyncio.get_running_loop()
+        if not self._queues and self._take(loop.time()):
+            return
+        future = loop.create_future()
+        self._queues.setdefault(route, deque()).append(future)
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run(), name="rest-proxy-global")
+        await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._queues:
+            now = loop.time()
+            if not self._take(now):
+                until = self._sent[0] + _GLOBAL_WINDOW if len(self._sent) >= self.rate else now
+                await asyncio.sleep(max(self.paused_until, until) - now + 0.001)
+                continue
+            route, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            if queue:
+                self._queues.move_to_end(route)
+            else:
+                del self._queues[route]
+            if future.done():  # the request gave up waiting
+                self._sent.pop()
+            else:
+                future.set_result(None)
+
+
+class RestProxy:
+    """
+    Forwards REST requests upstream under one shared view of the rate limits.
+
+    Requests are grouped into Discord's buckets (learned from the ``X-RateLimit-Bucket`` header, like
+    discord.py does) and each bucket lets requests through in arrival order as its window allows. The
+    global limit is tracked per token. A 429 from upstream updates the bucket or pauses the token,
+    and the request is retried instead of being passed back. Requests that would wait longer than
+    ``max_wait`` get a 429 of their own, which discord.py handles like any other.
+    """
+
+    def __init__(self, config: RestProxyConfig, upstream: str):
+        self.config: RestProxyConfig = config
+        self.upstream: str = upstream.rstrip("/")
+        self.metrics: dict[str, RouteMetrics] = {}
+        self.started_at: float = time.time()
+        self._buckets: dict[str, Bucket] = {}
+        self._hashes: dict[str, str] = {}  # token:route -> Discord's bucket hash
+        self._limiters: dict[str, FairLimiter] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._prune_task: Optional[asyncio.Task] = None
+        self.app = web.Application(client_max_size=25 * 1024 * 1024)
+        self.app.router.add_get("/_proxy/metrics", self.get_metrics)
+        self.app.router.add_route("*", "/api/{tail:.*}", self.forward)
+
+    async def start(self) -> None:
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60))
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.config.host, self.config.port).start()
+        self._prune_task = asyncio.create_task(self._prune(), name="rest-proxy-prune")
+        _log.info(
+            f"REST proxy listening on http://{self.config.host}:{self.config.port}, forwarding to {self.upstream}"
+        )
+
+    async def close(self) -> None:
+        if self._prune_task is not None:
+            self._prune_task.cancel()
+        if self._runner is not None:
+            await self._runner.cleanup()
+        if self._session is not None:
+            await self._session.close()
+
+    async def _prune(self) -> None:
+        # one bucket per channel and guild adds up, drop the ones nobody used for a while
+        while True:
+            await asyncio.sleep(60)
+            cutoff = asyncio.get_running_loop().time() - 300
+            for key in [k for k, b in self._buckets.items() if b.idle and b.last_used < cutoff]:
+                del self._buckets[key]
+
+    def _bucket(self, identity: str, route: str, major: str) -> Bucket:
+        name = self._hashes.get(f"{identity}:{route}", route)
+        key = f"{identity}:{name}:{major}"
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = Bucket()
+        return bucket
+
+    def _limiter(self, identity: str) -> FairLimiter:
+        limiter = self._limiters.get(identity)
+        if limiter is None:
+            limiter = self._limiters[identity] = FairLimiter(self.config.global_limit)
+        return limiter
+
+    @staticmethod
+    def _too_many(retry_after: float, message: str) -> web.Response:
+        body = {"message": message, "retry_after": round(retry_after, 3), "global": False}
+        # discord.py treats a 429 without Via as a Cloudflare ban
+        headers = {"Retry-After": str(max(1, round(retry_after))), "Via": "1.1 rest-proxy"}
+        return web.json_response(body, status=429, headers=headers)
+
+    async def forward(self, request: web.Request) -> web.StreamResponse:
+        loop = asyncio.get_running_loop()
+        arrived = loop.time()
+        authorization = request.headers.get("Authorization", "")
+        identity = hashlib.sha256(authorization.encode()).hexdigest()[:16]
+        route, major = route_key(request.method, request.path)
+        # interaction callbacks don't count against the global limit
+        is_global = not request.path.rstrip("/").endswith("/callback")
+        metrics = self.metrics.get(route)
+        if metrics is None:
+            metrics = self.metrics[route] = RouteMetrics()
+        metrics.requests += 1
+        metrics.queued += 1
+        metrics.max_queued = max(metrics.max_queued, metrics.queued)
+
+        body = await request.read()
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in _HOP_BY_HOP}
+        url = self.upstream + str(request.rel_url)
+        queued = True
+        try:
+            for attempt in range(self.config.max_retries + 1):
+                bucket = self._bucket(identity, route, major)
+                remaining = self.config.max_wait - (loop.time() - arrived)
+                try:
+                    await asyncio.wait_for(bucket.acquire(), max(remaining, 0))
+                except asyncio.TimeoutError:
+                    metrics.rejected += 1
+                    retry_after = bucket.reset_at - loop.time() if bucket.reset_at is not None else 1.0
+                    return self._too_many(max(retry_after, 1.0), "Queued for too long in the proxy.")
+                try:
+                    if is_global:
+                        try:
+                            await asyncio.wait_for(self._limiter(identity).acquire(route), max(remaining, 0))
+                        except asyncio.TimeoutError:
+                            metrics.rejected += 1
+                            return self._too_many(1.0, "Queued for too long in the proxy.")
+                    if queued:
+                        queued = False
+                        metrics.queued -= 1
+                        metrics.sent += 1
+                        waited = loop.time() - arrived
+                        metrics.total_wait += waited
+                        metrics.max_wait = max(metrics.max_wait, waited)
+                    try:
+                        async with self._session.request(request.method, url, headers=headers, data=body) as response:
+                            data = await response.read()
+                    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                        metrics.errors += 1
+                        _log.warning(f"{route} failed upstream: {type(e).__name__}: {e}")
+                        return web.json_response({"message": "The proxy couldn't reach Discord."}, status=502)
+                finally:
+                    bucket.release()
+
+                now = loop.time()
+                discord_hash = response.headers.get("X-RateLimit-Bucket")
+                if discord_hash is not None and f"{identity}:{route}" not in self._hashes:
+                    # the route's first response, its requests that are still queued keep the same bucket
+                    self._hashes[f"{identity}:{route}"] = discord_hash
+                    self._buckets.setdefault(f"{identity}:{discord_hash}:{major}", bucket)
+                if response.status != 429:
+                    bucket.update(response.headers, now)
+                elif attempt < self.config.max_retries and response.headers.get("Via"):
+                    metrics.rate_limited += 1
+                    retry_after = self._retry_after(response.headers, data)
+                    scope = response.headers.get("X-RateLimit-Scope")
+                    if response.headers.get("X-RateLimit-Global") or scope == "global":
+                        self._limiter(identity).pause(retry_after)
+                    else:
+                        bucket.exhaust(retry_after, now)
+                    continue
+                out = {k: v for k, v in response.headers.items() if k.lower() not in _HOP_BY_HOP}
+                return web.Response(status=response.status, body=data, headers=out)
+            metrics.rejected += 1
+            return self._too_many(1.0, "Still rate limited after retrying.")
+        finally:
+            if queued:
+                metrics.queued -= 1
+
+    @staticmethod
+    def _retry_after(headers, data: bytes) -> float:
+        try:
+            return float(json.loads(data)["retry_after"])
+        except (ValueError, KeyError, TypeError):
+            return float(headers.get("Retry-After", 1))
+
+    def snapshot(self) -> dict:
+        return {
+            "uptime": round(time.time() - self.started_at, 1),
+            "upstream": self.upstream,
+            "buckets": len({id(bucket) for bucket in self._buckets.values()}),
+            "global_queued": sum(limiter.depth for limiter in self._limiters.values()),
+            "routes": {
+                route: metrics.to_dict()
+                for route, metrics in sorted(self.metrics.items(), key=lambda kv: kv[1].total_wait, reverse=True)
+            },
+        }
+
+    async def get_metrics(self, _request: web.Request) -> web.Response:
+        return web.json_response(self.snapshot())
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m src.core.rest_proxy", description=__doc__.split("\n\n")[1])
+    parser.add_argument("--config", default="config.yml", help="Read the rest-proxy section from this file.")
+    parser.add_argument("--host", default=None)
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--upstream", default=None, help="Where to forward to (default: api.base-url or Discord).")
+    parser.add_argument("--global-limit", type=float, default=None, help="Requests per second per token.")
+    return parser.parse_args()
+
+
+async def _serve(config: RestProxyConfig, upstream: str) -> None:
+    proxy = RestProxy(config, upstream)
+    await proxy.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await proxy.close()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="[{asctime}] [{levelname:<8}] {name}: {message}", style="{")
+    args = _parse_args()
+    try:
+        bot_config = ConfigManager(args.config).load()
+        config, base_url = bot_config.rest_proxy, bot_config.api.base_url
+    except ConfigError as e:
+        _log.warning(f"Using the default settings: {e}")
+        config, base_url = RestProxyConfig(), None
+    config = dataclasses.replace(
+        config,
+        host=args.host or config.host,
+        port=args.port or config.port,
+        global_limit=args.global_limit or config.global_limit,
+    )
+    upstream = args.upstream or config.upstream or base_url or "https://discord.com"
+    try:
+        asyncio.run(_serve(config, upstream))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
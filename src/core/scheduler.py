@@ -0,0 +1,488 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ..core.client import MyClient
+
+import asyncio
+import datetime
+import heapq
+import itertools
+import logging
+import math
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Literal, Optional, Union
+
+from discord.ext import commands
+
+JobFunc = Callable[[], Awaitable[Any]]
+OverlapPolicy = Literal["skip", "queue", "replace"]
+CatchUpPolicy = Literal["coalesce", "all", "skip"]
+
+
+class Trigger:
+    """When a job runs. Times are unix timestamps."""
+
+    def first(self, now: float) -> Optional[float]:
+        raise NotImplementedError
+
+    def next(self, previous: float) -> Optional[float]:
+        raise NotImplementedError
+
+    def advance(self, previous: float, now: float, limit: int = 1000) -> tuple[Optional[float], int]:
+        """
+        Get the first occurrence after ``now``, and how many occurrences between ``previous`` and
+        ``now`` were missed.
+        """
+        missed = 0
+        upcoming = self.next(previous)
+        while upcoming is not None and upcoming <= now and missed < limit:
+            missed += 1
+            upcoming = self.next(upcoming)
+        return upcoming, missed
+
+
+@dataclass(frozen=True)
+class Once(Trigger):
+    at: float
+
+    def first(self, now: float) -> Optional[float]:
+        return self.at
+
+    def next(self, previous: float) -> Optional[float]:
+        return None
+
+    def __str__(self) -> str:
+        return f"once at {datetime.datetime.fromtimestamp(self.at):%Y-%m-%d %H:%M:%S}"
+
+
+@dataclass(frozen=True)
+class Every(Trigger):
+    seconds: float
+    first_delay: Optional[float] = None  # defaults to one interval
+
+    def __post_init__(self):
+        if self.seconds <= 0:
+            raise ValueError("The interval must be positive.")
+
+    def first(self, now: float) -> Optional[float]:
+        return now + (self.seconds if self.first_delay is None else self.first_delay)
+
+    def next(self, previous: float) -> Optional[float]:
+        return previous + self.seconds
+
+    def advance(self, previous: float, now: float, limit: int = 1000) -> tuple[Optional[float], int]:
+        missed = max(0, math.floor((now - previous) / self.seconds))
+        return previous + (missed + 1) * self.seconds, missed
+
+    def __str__(self) -> str:
+        return f"every {self.seconds:g}s"
+
+
+_CRON_ALIASES = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+# (name, lowest, highest) of each field
+_CRON_FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7))
+
+
+def _parse_cron_field(text: str, name: str, lowest: int, highest: int) -> frozenset[int]:
+    values: set[int] = set()
+    for part in text.split(","):
+        expression, _, step_text = part.partition("/")
+        try:
+            step = int(step_text) if step_text else 1
+            if expression == "*":
+                start, end = lowest, highest
+            elif "-" in expression:
+                start, end = (int(x) for x in expression.split("-", 1))
+            else:
+                start = int(expression)
+                end = highest if step_text else start
+        except ValueError:
+            raise ValueError(f"Invalid cron {name} field: {text!r}") from None
+        if step < 1 or not lowest <= start <= end <= highest:
+            raise ValueError(f"Cron {name} field {text!r} is out of range ({lowest}-{highest}).")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+@dataclass(frozen=True)
+class Cron(Trigger):
+    """
+    A standard five-field cron expression (minute, hour, day of month, month, day of week, with
+    Sunday as 0 or 7), or one of the ``@hourly``-style aliases. Like cron, when both the day of
+    month and the day of week are restricted, a day matching either one runs the job.
+    """
+
+    expression: str
+    tz: datetime.tzinfo = datetime.timezone.utc
+    _fields: tuple[frozenset[int], ...] = field(init=False, repr=False, compare=False)
+    _any_day: bool = field(init=False, repr=False, compare=False)
+    _any_weekday: bool = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        parts = _CRON_ALIASES.get(self.expression.strip(), self.expression).split()
+        if len(parts) != 5:
+            raise ValueError(f"A cron expression needs 5 fields, got {len(parts)}: {self.expression!r}")
+        fields = [_parse_cron_field(part, *spec) for part, spec in zip(parts, _CRON_FIELDS)]
+        fields[4] = frozenset(day % 7 for day in fields[4])
+        object.__setattr__(self, "_fields", tuple(fields))
+        object.__setattr__(self, "_any_day", parts[2] == "*")
+        object.__setattr__(self, "_any_weekday", parts[4] == "*")
+
+    def _day_matches(self, dt: datetime.datetime) -> bool:
+        day = dt.day in self._fields[2]
+        weekday = (dt.weekday() + 1) % 7 in self._fields[4]
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def first(self, now: float) -> Optional[float]:
+        return self.next(now)
+
+    def next(self, previous: float) -> Optional[float]:
+        minutes, hours, _, months, _ = self._fields
+        dt = datetime.datetime.fromtimestamp(previous, self.tz).replace(second=0, microsecond=0)
+        dt += datetime.timedelta(minutes=1)
+        limit = dt.year + 5
+        while dt.year <= limit:
+            if dt.month not in months:
+                year, month = (dt.year + 1, 1) if dt.month == 12 else (dt.year, dt.month + 1)
+                dt = dt.replace(year=year, month=month, day=1, hour=0, minute=0)
+            elif not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif dt.hour not in hours:
+                dt = dt.replace(minute=0) + datetime.timedelta(hours=1)
+            elif dt.minute not in minutes:
+                dt += datetime.timedelta(minutes=1)
+            else:
+                return dt.timestamp()
+        return None  # e.g. February 30th
+
+    def __str__(self) -> str:
+        return f"cron {self.expression}"
+
+
+@dataclass
+class JobMetrics:
+    runs: int = 0
+    failures: int = 0
+    cancelled: int = 0
+    skipped: int = 0  # runs dropped because the previous ones were still running
+    missed: int = 0  # occurrences dropped by the catch-up policy after a stall
+    last_duration: float = 0.0
+    max_duration: float = 0.0
+    total_duration: float = 0.0
+    last_lag: float = 0.0  # how late the last run started, in seconds
+    max_lag: float = 0.0
+    total_lag: float = 0.0
+    last_error: Optional[str] = None
+
+    @property
+    def avg_duration(self) -> float:
+        return self.total_duration / self.runs if self.runs else 0.0
+
+    @property
+    def avg_lag(self) -> float:
+        return self.total_lag / self.runs if self.runs else 0.0
+
+
+@dataclass(eq=False)
+class Job:
+    name: str
+    func: JobFunc
+    trigger: Trigger
+    jitter: float = 0.0
+    max_concurrency: int = 1
+    overlap: OverlapPolicy = "skip"
+    catch_up: CatchUpPolicy = "coalesce"
+    misfire_grace: float = 1.0
+    max_catch_up: int = 10
+    owner: Any = None
+    metrics: JobMetrics = field(default_factory=JobMetrics)
+    next_run: Optional[float] = None  # including jitter
+    cancelled: bool = False
+    _base: Optional[float] = None  # next occurrence without jitter, so jitter doesn't accumulate
+    _generation: int = 0  # invalidates heap entries when the job is rescheduled or cancelled
+    _tasks: dict[asyncio.Task, None] = field(default_factory=dict)
+    _queue: deque[float] = field(default_factory=deque)
+
+    @property
+    def running(self) -> int:
+        return len(self._tasks)
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+
+class JobScheduler:
+    """
+    Runs background jobs from a single timer task.
+
+    Every pending job sits in one heap ordered by its next run time, and the timer task only wakes
+    up when the earliest one is due, instead of every job sleeping in its own task. ``jitter`` spreads
+    jobs that share a period so they don't all wake the loop in the same tick.
+
+    When a job comes due while ``max_concurrency`` runs of it are still going, ``overlap`` decides
+    what happens: ``"skip"`` drops the new run, ``"queue"`` starts it when a slot frees up, and
+    ``"replace"`` cancels the oldest run. At most ``max_catch_up`` runs are queued.
+
+    When the timer wakes up late (the loop was blocked, or the machine was suspended) and
+    occurrences were missed, ``catch_up`` decides what happens: ``"coalesce"`` runs once, ``"all"``
+    runs every missed occurrence up to ``max_catch_up``, and ``"skip"`` drops runs that are more
+    than ``misfire_grace`` seconds late. The extra runs of ``"all"`` are queued whatever the
+    ``overlap`` policy, so they run one after another instead of being skipped.
+
+    Jobs whose function is a method of a cog belong to that cog, and are cancelled when it's removed.
+    """
+
+    def __init__(self, bot: MyClient):
+        self.bot: MyClient = bot
+        self.jobs: dict[str, Job] = {}
+        self._heap: list[tuple[float, int, int, Job]] = []
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._logger = logging.getLogger("scheduler")
+
+    def schedule(
+        self,
+        name: str,
+        func: JobFunc,
+        trigger: Trigger,
+        *,
+        jitter: float = 0.0,
+        max_concurrency: int = 1,
+        overlap: OverlapPolicy = "skip",
+        catch_up: CatchUpPolicy = "coalesce",
+        misfire_grace: float = 1.0,
+        max_catch_up: int = 10,
+        owner: Any = None,
+    ) -> Job:
+        """
+        Schedules ``func`` to be called with no arguments whenever ``trigger`` fires. A job that's
+        already scheduled under ``name`` is cancelled and replaced.
+
+        Raises:
+            ValueError: If a policy or limit is invalid.
+        """
+        if overlap not in ("skip", "queue", "replace"):
+            raise ValueError(f"Unknown overlap policy: {overlap!r}")
+        if catch_up not in ("coalesce", "all", "skip"):
+            raise ValueError(f"Unknown catch-up policy: {catch_up!r}")
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1.")
+        if owner is None and isinstance(getattr(func, "__self__", None), commands.Cog):
+            owner = func.__self__
+
+        self.cancel(name)
+        job = Job(
+            name,
+            func,
+            trigger,
+            jitter=jitter,
+            max_concurrency=max_concurrency,
+            overlap=overlap,
+            catch_up=catch_up,
+            misfire_grace=misfire_grace,
+            max_catch_up=max_catch_up,
+            owner=owner,
+        )
+        self.jobs[name] = job
+        first = trigger.first(time.time())
+        if first is not None:
+            self._push(job, first)
+        return job
+
+    def once(
+        self,
+        name: str,
+        func: JobFunc,
+        *,
+        delay: float = 0.0,
+        at: Optional[datetime.datetime] = None,
+        **kwargs: Any,
+    ) -> Job:
+        """Runs ``func`` once, ``delay`` seconds from now or at ``at``."""
+        when = at.timestamp() if at is not None else time.time() + delay
+        return self.schedule(name, func, Once(when), **kwargs)
+
+    def every(
+        self, name: str, func: JobFunc, seconds: float, *, first_delay: Optional[float] = None, **kwargs: Any
+    ) -> Job:
+        """Runs ``func`` every ``seconds`` seconds, starting one interval (or ``first_delay``) from now."""
+        return self.schedule(name, func, Every(seconds, first_delay), **kwargs)
+
+    def cron(
+        self,
+        name: str,
+        func: JobFunc,
+        expression: str,
+        *,
+        tz: datetime.tzinfo = datetime.timezone.utc,
+        **kwargs: Any,
+    ) -> Job:
+        """Runs ``func`` on a cron schedule. See ``Cron``."""
+        return self.schedule(name, func, Cron(expression, tz), **kwargs)
+
+    def cancel(self, job: Union[str, Job]) -> bool:
+        """Unschedules a job and cancels its running and queued runs. Returns whether it existed."""
+        if isinstance(job, str):
+            job = self.jobs.get(job)
+            if job is None:
+                return False
+        if self.jobs.get(job.name) is job:
+            del self.jobs[job.name]
+        job.cancelled = True
+        job.next_run = None
+        job._generation += 1
+        job._queue.clear()
+        for task in list(job._tasks):
+            task.cancel()
+        return True
+
+    def cancel_owner(self, owner: Any) -> int:
+        """Cancels every job that belongs to ``owner``. Returns how many were cancelled."""
+        jobs = [job for job in self.jobs.values() if job.owner is owner]
+        for job in jobs:
+            self.cancel(job)
+        return len(jobs)
+
+    def _push(self, job: Job, base: float) -> None:
+        job._base = base
+        job.next_run = base + random.uniform(0, job.jitter) if job.jitter else base
+        heapq.heappush(self._heap, (job.next_run, next(self._counter), job._generation, job))
+        if self._heap[0][3] is job:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="job-scheduler")
+
+    async def close(self, grace: float = 0.0) -> list[str]:
+        """
+        Stops firing jobs and cancels every run that's still going.
+
+        Parameters:
+            grace: Seconds to let running jobs finish before they're cancelled.
+
+        Returns:
+            The names of the jobs whose runs had to be cancelled.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        running = {task: job.name for job in self.jobs.values() for task in job._tasks}
+        if running and grace > 0:
+            await asyncio.wait(running, timeout=grace)
+        cancelled = sorted({name for task, name in running.items() if not task.done()})
+        for job in list(self.jobs.values()):
+            self.cancel(job)
+        await asyncio.gather(*running, return_exceptions=True)
+        return cancelled
+
+    async def _run(self) -> None:
+        while True:
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                due, _, generation, job = heapq.heappop(self._heap)
+                if generation == job._generation and not job.cancelled:
+                    self._fire(job, due, now)
+
+            # drop cancelled entries so they don't decide the next wake up
+            while self._heap and self._heap[0][2] != self._heap[0][3]._generation:
+                heapq.heappop(self._heap)
+            self._wakeup.clear()
+            timeout = max(0.0, self._heap[0][0] - time.time()) if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _fire(self, job: Job, due: float, now: float) -> None:
+        upcoming, missed = job.trigger.advance(job._base, now, limit=max(job.max_catch_up, 1000))
+        if job.catch_up == "skip" and now - due > job.misfire_grace:
+            job.metrics.missed += missed + 1
+        else:
+            self._start(job, due)
+            catch_up = 0
+            if job.catch_up == "all":
+                # Queued rather than started, so they run back to back behind the run that's going
+                # (started above, or the one that made it skip) instead of being dropped by the
+                # overlap policy.
+                catch_up = max(0, min(missed, job.max_catch_up - len(job._queue)))
+                occurrence = job._base
+                for _ in range(catch_up):
+                    occurrence = job.trigger.next(occurrence)
+                    job._queue.append(occurrence)
+            job.metrics.missed += missed - catch_up
+
+        if upcoming is not None:
+            self._push(job, upcoming)
+        else:
+            job.next_run = None
+            self._retire(job)
+
+    def _start(self, job: Job, due: float) -> None:
+        if len(job._tasks) >= job.max_concurrency:
+            if job.overlap == "skip":
+                job.metrics.skipped += 1
+                return
+            if job.overlap == "queue" and len(job._queue) < job.max_catch_up:
+                job._queue.append(due)
+                return
+            if job.overlap == "queue":  # the backlog is full
+                job.metrics.skipped += 1
+                return
+            next(iter(job._tasks)).cancel()  # replace the oldest run
+        task = asyncio.create_task(self._execute(job, due), name=f"job:{job.name}")
+        job._tasks[task] = None
+        task.add_done_callback(lambda t: self._on_done(job, t))
+
+    async def _execute(self, job: Job, due: float) -> None:
+        metrics = job.metrics
+        started = time.time()
+        lag = max(0.0, started - due)
+        metrics.last_lag = lag
+        metrics.max_lag = max(metrics.max_lag, lag)
+        metrics.total_lag += lag
+        clock = time.perf_counter()
+        try:
+            await job.func()
+        except asyncio.CancelledError:
+            metrics.cancelled += 1
+            raise
+        except Exception as e:
+            metrics.failures += 1
+            metrics.last_error = f"{type(e).__name__}: {e}"
+            self._logger.exception(f"Job {job.name!r} failed: {e}")
+        finally:
+            duration = time.perf_counter() - clock
+            metrics.runs += 1
+            metrics.last_duration = duration
+            metrics.max_duration = max(metrics.max_duration, duration)
+            metrics.total_duration += duration
+
+    def _on_done(self, job: Job, task: asyncio.Task) -> None:
+        job._tasks.pop(task, None)
+        if job._queue and not job.cancelled:
+            self._start(job, job._queue.popleft())
+        elif job.next_run is None:
+            self._retire(job)
+
+    def _retire(self, job: Job) -> None:
+        """Forgets a job that will never run again once its last run has finished."""
+        if not job._tasks and not job._queue and self.jobs.get(job.name) is job:
+            del self.jobs[job.name]
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ..core.client import MyClient
+    from ..core.config import ShutdownConfig
+
+import asyncio
+import contextlib
+import inspect
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Iterator, Optional, Union
+
+import discord
+
+DRAINING_MESSAGE = "I'm restarting right now. Please try again in a moment."
+
+
+@dataclass
+class DrainReport:
+    took: float = 0.0
+    finished: int = 0  # in-flight handlers that finished while the bot waited for them
+    abandoned: list[str] = field(default_factory=list)  # everything that was cancelled or timed out
+    steps: list[tuple[str, float]] = field(default_factory=list)  # (step, seconds)
+
+    @property
+    def clean(self) -> bool:
+        return not self.abandoned
+
+    def summary(self) -> str:
+        text = f"Drained in {self.took:.1f}s, {self.finished} in-flight handler(s) finished"
+        if self.abandoned:
+            text += f", abandoned: {', '.join(self.abandoned)}"
+        return text + "."
+
+
+class Drainer:
+    """
+    Shuts the bot down in order, within a deadline.
+
+    ``drain`` stops new commands, interactions and view callbacks from starting, waits up to
+    ``in_flight_timeout`` seconds for the ones already running, and then flushes and closes the
+    client's components, dependants before what they depend on: scheduled jobs first, then everything
+    that writes (analytics, the warm cache, recorder and traces), the bus, the database pools, the
+    HTTP session and the executors, and the log handlers last. Each step gets what's left of
+    ``timeout``, and whatever doesn't make it is cancelled and listed in the report.
+
+    The Discord connection is left open, so ``dev restart`` can still edit its message afterwards.
+    ``MyClient.close`` drains before closing it.
+    """
+
+    def __init__(self, bot: MyClient):
+        self.bot: MyClient = bot
+        self.timeout: float = 30.0
+        self.in_flight_timeout: float = 20.0
+        self.draining: bool = False
+        self.report: Optional[DrainReport] = None
+        self._in_flight: dict[asyncio.Task, str] = {}
+        self._drain_task: Optional[asyncio.Task] = None
+        self.logger = logging.getLogger("shutdown")
+
+    def load_config(self, config: ShutdownConfig) -> None:
+        self.timeout = config.timeout
+        self.in_flight_timeout = min(config.in_flight_timeout, config.timeout)
+
+    @property
+    def in_flight(self) -> list[str]:
+        return list(self._in_flight.values())
+
+    # tracking
+
+    def add(self, task: asyncio.Task, name: str) -> None:
+        """Makes ``drain`` wait for ``task`` before closing anything."""
+        self._in_flight[task] = name
+        task.add_done_callback(self._discard)
+
+    def _discard(self, task: asyncio.Task) -> None:
+        self._in_flight.pop(task, None)
+
+    @contextlib.contextmanager
+    def track(self, name: str) -> Iterator[None]:
+        """Tracks the current task as in flight while the ``with`` block runs."""
+        task = asyncio.current_task()
+        self._in_flight[task] = name
+        try:
+            yield
+        finally:
+            self._in_flight.pop(task, None)
+
+    async def reject(self, interaction: discord.Interaction) -> None:
+        """Tells the user an interaction arrived too late to be handled."""
+        if interaction.type is discord.InteractionType.autocomplete:
+            return
+        with contextlib.suppress(discord.HTTPException):
+            await interaction.response.send_message(DRAINING_MESSAGE, ephemeral=True)
+
+    # draining
+
+    async def drain(self) -> DrainReport:
+        """Runs the shutdown sequence once. Later calls wait for it and return the same report."""
+        if self._drain_task is None:
+            # whoever asked for the drain (e.g. dev restart) may be in flight itself
+            self._drain_task = asyncio.create_task(self._drain(asyncio.current_task()), name="drain")
+        return await asyncio.shield(self._drain_task)
+
+    async def _drain(self, caller: Optional[asyncio.Task]) -> DrainReport:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        deadline = loop.time() + self.timeout
+        report = DrainReport()
+        self.draining = True
+        self.logger.info(f"Draining, waiting for {len(self._in_flight)} in-flight handler(s)...")
+
+        waiting = {task: name for task, name in self._in_flight.items() if task is not caller}
+        if waiting:
+            done, pending = await asyncio.wait(waiting, timeout=self.in_flight_timeout)
+            report.finished = len(done)
+            for task in pending:
+                report.abandoned.append(waiting[task])
+                task.cancel()
+        report.steps.append(("in-flight", time.perf_counter() - started))
+
+        bot = self.bot
+        steps: list[tuple[str, Callable[[float], Union[Awaitable[Any], Any]]]] = [
+            # a long job may only use half of what's left, the flushes after it matter more
+            ("jobs", lambda remaining: bot.scheduler.close(grace=remaining / 2)),
+            ("analytics", lambda _: bot.analytics.flush(final=True)),
+            ("warm cache", lambda _: bot.warm_cache.save()),
+            ("recorder", lambda _: bot.recorder.close()),
+            ("traces", lambda _: bot.tracer.close()),
+            ("bus", lambda _: bot.bus.close()),
+            ("views", lambda _: bot.view_manager.close()),
+            ("database", lambda remaining: bot.db.close(remaining) if bot.db is not None else None),
+            ("http session", lambda _: bot.session.close() if bot.session is not None else None),
+            ("executors", lambda _: bot.executors.shutdown()),
+            ("config watcher", lambda _: bot.config_manager.stop_watching() if bot.config_manager else None),
+        ]
+        for name, step in steps:
+            remaining = deadline - loop.time()
+            step_started = time.perf_counter()
+            if remaining <= 0:
+                report.abandoned.append(f"{name} (out of time)")
+                continue
+            try:
+                result = step(remaining)
+                if inspect.isawaitable(result):
+                    result = await asyncio.wait_for(result, remaining)
+            except asyncio.TimeoutError:
+                report.abandoned.append(f"{name} (timed out)")
+            except Exception as e:
+                report.abandoned.append(f"{name} ({type(e).__name__}: {e})")
+            else:
+                # steps that gave up on part of their work say what
+                if name == "jobs" and result:
+                    report.abandoned.extend(f"job {job}" for job in result)
+                elif name == "analytics" and result:
+                    report.abandoned.append(f"{result} analytics bucket(s)")
+                elif name == "database" and result:
+                    report.abandoned.append(f"{result} database quer{'y' if result == 1 else 'ies'}")
+            report.steps.append((name, time.perf_counter() - step_started))
+
+        report.took = time.perf_counter() - started
+        self.report = report
+        log = self.logger.info if report.clean else self.logger.warning
+        log(report.summary())
+        self._flush_logs()
+        return report
+
+    @staticmethod
+    def _flush_logs() -> None:
+        for handler in logging.getLogger().handlers:
+            with contextlib.suppress(Exception):
+                handler.flush()
@@ -0,0 +1,463 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from discord.http import HTTPClient
+
+    from ..core.client import MyClient
+    from ..core.config import TracingConfig
+
+import contextvars
+import json
+import logging
+import os
+import random
+import secrets
+import time
+import weakref
+from collections import defaultdict, deque
+from typing import Any, Callable, Optional
+
+import discord
+from discord.ext import commands
+
+from .executors import ExecutorBusy
+from ..utils.hooks import ParserHook, add_parser_hook, remove_parser_hook
+
+# OpenTelemetry enum values, see opentelemetry/proto/trace/v1/trace.proto
+SPAN_KINDS = {"INTERNAL": 1, "SERVER": 2, "CLIENT": 3}
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+_active: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("span", default=None)
+# [parse started, parse finished] of the MESSAGE_CREATE that spawned this task, in unix nanoseconds
+_received: contextvars.ContextVar[Optional[list[int]]] = contextvars.ContextVar("received", default=None)
+
+
+class Span:
+    __slots__ = ("name", "kind", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "status", "error")
+
+    def __init__(
+        self,
+        name: str,
+        kind: str,
+        parent_id: Optional[str],
+        attributes: Optional[dict[str, Any]] = None,
+        start_ns: Optional[int] = None,
+    ):
+        self.name: str = name
+        self.kind: str = kind
+        self.span_id: str = secrets.token_hex(8)
+        self.parent_id: Optional[str] = parent_id
+        self.start_ns: int = start_ns or time.time_ns()
+        self.end_ns: int = 0
+        self.attributes: dict[str, Any] = attributes or {}
+        self.status: int = STATUS_UNSET
+        self.error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.status = STATUS_ERROR
+            self.error = f"{type(error).__name__}: {error}"
+
+    def to_otlp(self, trace_id: str) -> dict:
+        span = {
+            "traceId": trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KINDS[self.kind],
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": self.status},
+        }
+        if self.parent_id is not None:
+            span["parentSpanId"] = self.parent_id
+        if self.error is not None:
+            span["status"]["message"] = self.error
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}  # int64 is a string in OTLP/JSON
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+class Trace:
+    """The spans recorded while handling one message."""
+
+    __slots__ = ("trace_id", "root", "spans", "command", "finished")
+
+    def __init__(self, root: Span):
+        self.trace_id: str = secrets.token_hex(16)
+        self.root: Span = root
+        self.spans: list[Span] = [root]
+        self.command: Optional[str] = None
+        self.finished: bool = False
+
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration_ms
+
+    def add(self, span: Span) -> None:
+        # tasks spawned by the command (e.g. delete_after) inherit the trace and may outlive it
+        if not self.finished:
+            self.spans.append(span)
+
+    def waterfall(self) -> list[tuple[int, Span]]:
+        """The spans in start order, each with its depth in the tree."""
+        children: dict[Optional[str], list[Span]] = defaultdict(list)
+        for span in self.spans:
+            children[span.parent_id].append(span)
+        result: list[tuple[int, Span]] = []
+        stack = [(0, self.root)]
+        while stack:
+            depth, span = stack.pop()
+            result.append((depth, span))
+            for child in sorted(children[span.span_id], key=lambda s: s.start_ns, reverse=True):
+                stack.append((depth + 1, child))
+        return result
+
+
+class _NoopSpan:
+    """Returned by ``Tracer.span`` when the current task isn't being traced, so untraced code pays almost nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *_) -> None:
+        return None
+
+
+_NOOP = _NoopSpan()
+_INSTRUMENTED_ATTRS = ("can_run", "_parse_arguments", "call_before_hooks", "invoke")
+
+
+class _SpanContext:
+    __slots__ = ("trace", "name", "kind", "attributes", "span", "token")
+
+    def __init__(self, trace: Trace, name: str, kind: str, attributes: Optional[dict[str, Any]]):
+        self.trace: Trace = trace
+        self.name: str = name
+        self.kind: str = kind
+        self.attributes: Optional[dict[str, Any]] = attributes
+        self.span: Optional[Span] = None
+        self.token: Optional[contextvars.Token] = None
+
+    def __enter__(self) -> Span:
+        parent = _current_span.get()
+        self.span = Span(self.name, self.kind, parent.span_id if parent else None, self.attributes)
+        self.trace.add(self.span)
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.span.end(exc)
+        _current_span.reset(self.token)
+
+
+class _TraceContext:
+    __slots__ = ("tracer", "message", "trace", "tokens")
+
+    def __init__(self, tracer: Tracer, message: discord.Message):
+        self.tracer: Tracer = tracer
+        self.message: discord.Message = message
+        self.trace: Optional[Trace] = None
+        self.tokens: tuple = ()
+
+    def __enter__(self) -> Trace:
+        received = _received.get()
+        root = Span(
+            "message",
+            "SERVER",
+            None,
+            {
+                "discord.guild_id": self.message.guild.id if self.message.guild else 0,
+                "discord.channel_id": self.message.channel.id,
+            },
+            start_ns=received[0] if received else None,
+        )
+        self.trace = Trace(root)
+        if received and received[1]:
+            receive = Span("gateway.receive", "INTERNAL", root.span_id, {"discord.event": "MESSAGE_CREATE"}, received[0])
+            receive.end_ns = received[1]
+            self.trace.add(receive)
+        self.tokens = (_active.set(self.trace), _current_span.set(root))
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        trace_token, span_token = self.tokens
+        _current_span.reset(span_token)
+        _active.reset(trace_token)
+        self.trace.root.end(exc)
+        self.trace.finished = True
+        if self.trace.command is not None:  # plain chatter isn't worth keeping
+            self.tracer.record(self.trace)
+
+
+class Tracer:
+    """
+    Records where the time goes while a prefix command is handled.
+
+    A sampled message gets a trace, and every stage it passes through is recorded as a span nested
+    under it: the gateway parse of ``MESSAGE_CREATE``, prefix resolution, context building, global
+    and command checks, converters, the callback, and anything the callback does through the HTTP
+    client or ``Database``. The trace is carried in a context variable, so it follows the message
+    into every coroutine it awaits and every task it spawns, and code outside a trace only pays for
+    one context variable lookup per span.
+
+    Finished traces are kept in memory per command for ``dev trace`` and appended to ``path`` as
+    OTLP/JSON, one ``ExportTraceServiceRequest`` per line, so they can be loaded into any
+    OpenTelemetry collector. Traces of messages that didn't invoke a command are dropped.
+    """
+
+    def __init__(
+        self,
+        bot: MyClient,
+        *,
+        sample_rate: float = 0.0,
+        path: str = "logs/traces.jsonl",
+        max_recent: int = 50,
+        flush_interval: float = 5.0,
+    ):
+        self.bot: MyClient = bot
+        self.sample_rate: float = sample_rate
+        self.path: str = path
+        self.max_recent: int = max_recent
+        self.flush_interval: float = flush_interval
+        self.recent: dict[str, deque[Trace]] = {}
+        self.exported: int = 0
+        self._pending: list[Trace] = []
+        self._hook: Optional[ParserHook] = None
+        self._instrumented: weakref.WeakSet[commands.Command] = weakref.WeakSet()
+        self._started: bool = False
+        self._logger = logging.getLogger("tracing")
+
+    def load_config(self, config: TracingConfig) -> None:
+        was_enabled = self.enabled
+        self.sample_rate = config.sample_rate
+        if self.enabled and not was_enabled:
+            for command in self.bot.walk_commands():
+                self.instrument_command(command)
+        elif was_enabled and not self.enabled:
+            self._uninstrument_all()
+        self.path = config.path
+        if config.flush_interval != self.flush_interval:
+            self.flush_interval = config.flush_interval
+            if self._started:
+                self._schedule_flush()
+        if config.max_recent != self.max_recent:
+            self.max_recent = config.max_recent
+            self.recent = {name: deque(traces, maxlen=self.max_recent) for name, traces in self.recent.items()}
+
+    def start(self) -> None:
+        """Hooks the gateway parser and starts the export loop. Must be called from within the event loop."""
+        if self._started:
+            return
+        # noinspection PyProtectedMember
+        self._hook = add_parser_hook(self.bot._connection.parsers, "MESSAGE_CREATE", self._on_message_create)
+        self._schedule_flush()
+        self._started = True
+
+    def _schedule_flush(self) -> None:
+        self.bot.scheduler.every("tracer.flush", self._scheduled_flush, self.flush_interval)
+
+    async def close(self) -> None:
+        if self._hook is not None:
+            # noinspection PyProtectedMember
+            remove_parser_hook(self.bot._connection.parsers, self._hook)
+            self._hook = None
+        if self._started:
+            self.bot.scheduler.cancel("tracer.flush")
+            self._started = False
+        await self.flush()
+
+    def _on_message_create(self, data: Any, inner: Callable[[Any], None]) -> None:
+        if not self.enabled:
+            return inner(data)
+        # the on_message task is created inside the parser, so it inherits this
+        received = [time.time_ns(), 0]
+        token = _received.set(received)
+        try:
+            inner(data)
+        finally:
+            received[1] = time.time_ns()
+            _received.reset(token)
+
+    def trace_message(self, message: discord.Message):
+        """Starts a trace for ``message`` if it's sampled. Use as a ``with`` block around its handling."""
+        if not self.enabled or message.author.bot or random.random() >= self.sample_rate:
+            return _NOOP
+        return _TraceContext(self, message)
+
+    @staticmethod
+    def span(name: str, kind: str = "INTERNAL", attributes: Optional[dict[str, Any]] = None):
+        """A ``with`` block recorded as a child of the current span, if the current task is being traced."""
+        trace = _active.get()
+        if trace is None:
+            return _NOOP
+        return _SpanContext(trace, name, kind, attributes)
+
+    @staticmethod
+    def set_command(command: commands.Command) -> None:
+        """Names the current trace after the command it invoked."""
+        trace = _active.get()
+        if trace is not None:
+            trace.command = command.qualified_name
+            trace.root.name = f"command {command.qualified_name}"
+            trace.root.attributes["discord.command"] = command.qualified_name
+
+    def instrument_http(self, http: HTTPClient) -> None:
+        """Records every REST request made while tracing as a client span."""
+        if getattr(http.request, "_traced", False):
+            return
+        original = http.request
+
+        async def request(route, **kwargs):
+            if _active.get() is None:
+                return await original(route, **kwargs)
+            attributes = {"http.request.method": route.method, "http.route": route.path}
+            with self.span(f"{route.method} {route.path}", "CLIENT", attributes) as span:
+                try:
+                    return await original(route, **kwargs)
+                except discord.HTTPException as e:
+                    span.attributes["http.response.status_code"] = e.status
+                    raise
+
+        request._traced = True
+        http.request = request
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def instrument_command(self, command: commands.Command) -> None:
+        """
+        Records the checks, converters and callback of ``command`` (and its subcommands) as spans.
+
+        Does nothing while tracing is disabled, since every wrapper adds a coroutine frame to each
+        invocation; ``load_config`` instruments every command once sampling is turned on.
+        """
+        if not self.enabled:
+            return
+        commands_ = [command, *command.walk_commands()] if isinstance(command, commands.Group) else [command]
+        for cmd in commands_:
+            if cmd not in self._instrumented:
+                self._instrument(cmd)
+
+    def _instrument(self, cmd: commands.Command) -> None:
+        can_run, parse_arguments = cmd.can_run, cmd._parse_arguments  # noqa
+        call_before_hooks, invoke = cmd.call_before_hooks, cmd.invoke
+        key = ("_trace_callback", id(cmd))
+
+        async def traced_can_run(ctx):
+            with self.span("checks"):
+                return await can_run(ctx)
+
+        async def traced_parse_arguments(ctx):
+            with self.span("converters"):
+                return await parse_arguments(ctx)
+
+        async def traced_call_before_hooks(ctx):
+            await call_before_hooks(ctx)
+            # prepare() ends here and invoke() calls the callback next, so the span is closed by traced_invoke
+            callback = self.span("callback")
+            if callback is not _NOOP:
+                callback.__enter__()
+                ctx.__dict__[key] = callback
+
+        async def traced_invoke(ctx):
+            if _active.get() is None:
+                return await invoke(ctx)
+            with self.span("invoke", attributes={"discord.command": cmd.qualified_name}):
+                try:
+                    await invoke(ctx)
+                except BaseException as e:
+                    callback = ctx.__dict__.pop(key, None)
+                    if callback is not None:
+                        callback.__exit__(type(e), e, e.__traceback__)
+                    raise
+                callback = ctx.__dict__.pop(key, None)
+                if callback is not None:
+                    callback.__exit__(None, None, None)
+
+        # instance attributes shadow the methods, and deleting them restores the originals
+        cmd.can_run = traced_can_run
+        cmd._parse_arguments = traced_parse_arguments
+        cmd.call_before_hooks = traced_call_before_hooks
+        cmd.invoke = traced_invoke
+        self._instrumented.add(cmd)
+
+    def _uninstrument_all(self) -> None:
+        for cmd in list(self._instrumented):
+            for attr in _INSTRUMENTED_ATTRS:
+                cmd.__dict__.pop(attr, None)
+        self._instrumented.clear()
+
+    def record(self, trace: Trace) -> None:
+        recent = self.recent.get(trace.command)
+        if recent is None:
+            recent = self.recent[trace.command] = deque(maxlen=self.max_recent)
+        recent.append(trace)
+        self._pending.append(trace)
+
+    def slowest(self, command: str, limit: int = 10) -> list[Trace]:
+        return sorted(self.recent.get(command, ()), key=lambda t: t.duration_ms, reverse=True)[:limit]
+
+    async def _scheduled_flush(self) -> None:
+        try:
+            await self.flush()
+        except ExecutorBusy:
+            pass
+        except OSError as e:
+            self._logger.error(f"Failed to export traces: {e}")
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        traces, self._pending = self._pending, []
+        lines = [json.dumps(self._to_otlp(trace), separators=(",", ":")) for trace in traces]
+        try:
+            await self.bot.executors.io.run(self._write, lines)
+        except ExecutorBusy:
+            self._pending[:0] = traces  # try again on the next flush
+            raise
+        self.exported += len(lines)
+
+    def _write(self, lines: list[str]) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def _to_otlp(self, trace: Trace) -> dict:
+        resource = [_otlp_attribute("service.name", "discord-bot")]
+        if self.bot.user is not None:
+            resource.append(_otlp_attribute("service.instance.id", str(self.bot.user.id)))
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": resource},
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "bot.tracing"},
+                            "spans": [span.to_otlp(trace.trace_id) for span in trace.spans],
+                        }
+                    ],
+                }
+            ]
+        }
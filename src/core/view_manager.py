@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ..core.client import MyClient
+    from ..core.config import ViewsConfig
+    from ..ui.views import ManagedView
+
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Iterator, Optional
+
+
+class TimerWheel:
+    """
+    A hashed timing wheel.
+
+    All timers share a single ticking task, so scheduling, refreshing and cancelling a timer is O(1)
+    no matter how many timers are pending.
+
+    Parameters:
+        callback: Called with the key of every timer that expires.
+        resolution: The length of a single tick in seconds.
+        size: The number of slots in the wheel.
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[Hashable], None],
+        *,
+        resolution: float = 1.0,
+        size: int = 512,
+    ):
+        self._callback = callback
+        self._resolution = resolution
+        self._size = size
+        self._slots: list[dict[Hashable, int]] = [{} for _ in range(size)]
+        self._positions: dict[Hashable, int] = {}
+        self._cursor: int = 0
+        self._task: Optional[asyncio.Task] = None
+        self._logger = logging.getLogger("view-manager")
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._positions
+
+    def schedule(self, key: Hashable, delay: float) -> None:
+        """(Re)schedule ``key`` to expire in ``delay`` seconds."""
+        self.cancel(key)
+        ticks = max(1, math.ceil(delay / self._resolution))
+        rounds, offset = divmod(ticks, self._size)
+        slot = (self._cursor + offset) % self._size
+        if offset == 0:  # a full turn of the wheel lands on the current slot
+            rounds -= 1
+        self._slots[slot][key] = rounds
+        self._positions[key] = slot
+
+    def cancel(self, key: Hashable) -> None:
+        slot = self._positions.pop(key, None)
+        if slot is not None:
+            self._slots[slot].pop(key, None)
+
+    def remaining(self, key: Hashable) -> Optional[float]:
+        """Get the approximate number of seconds until ``key`` expires."""
+        slot = self._positions.get(key)
+        if slot is None:
+            return None
+        rounds = self._slots[slot][key]
+        ticks = (slot - self._cursor) % self._size or self._size
+        return (rounds * self._size + ticks) * self._resolution
+
+    def _advance(self) -> None:
+        self._cursor = (self._cursor + 1) % self._size
+        slot = self._slots[self._cursor]
+        if not slot:
+            return
+
+        expired = []
+        for key, rounds in slot.items():
+            if rounds <= 0:
+                expired.append(key)
+            else:
+                slot[key] = rounds - 1
+
+        for key in expired:
+            del slot[key]
+            del self._positions[key]
+            try:
+                self._callback(key)
+            except Exception as e:  # noqa
+                self._logger.exception(f"Timer callback failed for {key!r}: {e}")
+
+    async def _run(self) -> None:
+        next_tick = time.monotonic() + self._resolution
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            # catch up on any ticks missed while the loop was blocked
+            while time.monotonic() >= next_tick:
+                self._advance()
+                next_tick += self._resolution
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="view-manager-timer-wheel")
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+class ViewManager:
+    """
+    Tracks every live ``ManagedView``.
+
+    Timeouts for all views are driven by one shared ``TimerWheel`` instead of a task per view, and the
+    number of live views is capped globally and per user. When a cap is hit the least recently used
+    view is evicted by timing it out, so its ``on_timeout`` cleanup still runs.
+    """
+
+    def __init__(
+        self,
+        bot: MyClient,
+        *,
+        max_views: int = 1000,
+        max_views_per_user: int = 10,
+        resolution: float = 1.0,
+    ):
+        self.bot: MyClient = bot
+        self.max_views: int = max_views
+        self.max_views_per_user: int = max_views_per_user
+        self.evictions: int = 0
+        self._views: OrderedDict[int, ManagedView] = OrderedDict()
+        self._by_user: dict[int, OrderedDict[int, None]] = {}
+        self._created_at: dict[int, float] = {}
+        self._wheel = TimerWheel(self._on_expire, resolution=resolution)
+        self._logger = logging.getLogger("view-manager")
+
+    def __len__(self) -> int:
+        return len(self._views)
+
+    def __iter__(self) -> Iterator[ManagedView]:
+        return iter(list(self._views.values()))
+
+    def load_config(self, config: ViewsConfig) -> None:
+        self.max_views = config.max_live
+        self.max_views_per_user = config.max_per_user
+
+    def start(self) -> None:
+        self._wheel.start()
+
+    def close(self) -> None:
+        self._wheel.stop()
+
+    def register(self, view: ManagedView) -> None:
+        key = id(view)
+        if key in self._views:
+            return self.touch(view)
+
+        owner_id = view.owner_id
+        if owner_id is not None:
+            owned = self._by_user.setdefault(owner_id, OrderedDict())
+            while self.max_views_per_user and len(owned) >= self.max_views_per_user:
+                self.evict(self._views[next(iter(owned))], reason="per-user cap")
+            # evicting the user's last view drops their entry, so fetch it again
+            self._by_user.setdefault(owner_id, OrderedDict())[key] = None
+
+        while self.max_views and len(self._views) >= self.max_views:
+            self.evict(next(iter(self._views.values())), reason="global cap")
+
+        self._views[key] = view
+        self._created_at[key] = time.monotonic()
+        if view.managed_timeout:
+            self._wheel.schedule(key, view.managed_timeout)
+
+    def touch(self, view: ManagedView) -> None:
+        """Mark ``view`` as recently used and refresh its timeout."""
+        key = id(view)
+        if key not in self._views:
+            return
+        self._views.move_to_end(key)
+        owned = self._by_user.get(view.owner_id)
+        if owned is not None and key in owned:
+            owned.move_to_end(key)
+        if view.managed_timeout:
+            self._wheel.schedule(key, view.managed_timeout)
+
+    def discard(self, view: ManagedView) -> None:
+        """Stop tracking ``view``. Does not stop the view itself."""
+        key = id(view)
+        if self._views.pop(key, None) is None:
+            return
+        self._created_at.pop(key, None)
+        self._wheel.cancel(key)
+        owned = self._by_user.get(view.owner_id)
+        if owned is not None:
+            owned.pop(key, None)
+            if not owned:
+                del self._by_user[view.owner_id]
+
+    def evict(self, view: ManagedView, *, reason: str = "evicted") -> None:
+        self.evictions += 1
+        self._logger.debug(f"Evicting {view!r} ({reason}).")
+        self._expire(view)
+
+    def age(self, view: ManagedView) -> Optional[float]:
+        created_at = self._created_at.get(id(view))
+        return None if created_at is None else time.monotonic() - created_at
+
+    def remaining(self, view: ManagedView) -> Optional[float]:
+        return self._wheel.remaining(id(view))
+
+    def _on_expire(self, key: Hashable) -> None:
+        view = self._views.get(key)  # noqa
+        if view is not None:
+            self._expire(view)
+
+    def _expire(self, view: ManagedView) -> None:
+        self.discard(view)
+        # noinspection PyProtectedMember
+        view._dispatch_timeout()  # runs on_timeout and removes the view from the view store
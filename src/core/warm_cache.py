@@ -0,0 +1,361 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ..core.client import MyClient
+    from ..core.config import WarmCacheConfig
+
+import asyncio
+import functools
+import logging
+import mmap
+import os
+import pickle
+import struct
+import time
+import zlib
+from collections.abc import Mapping, MutableMapping, MutableSet
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+# File layout, all little-endian:
+#   header   magic, format version, entry count, creation time
+#   index    one record per cache, followed by its UTF-8 name
+#   blobs    one pickle per cache, each starting on an 8-byte boundary
+# The index is small and read up front. Blobs are unpickled straight from the mapped file, and
+# only for caches that are registered and whose version still matches.
+MAGIC = b"WARMCCH\x00"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8sHIxxd")
+_RECORD = struct.Struct("<HIQQI")  # name length, cache version, offset, length, CRC-32
+
+Revalidator = Callable[[list[Hashable]], Awaitable[Mapping[Hashable, Any]]]
+
+
+@dataclass
+class _IndexEntry:
+    version: int
+    offset: int
+    length: int
+    crc: int
+
+
+@dataclass
+class WarmCacheEntry:
+    name: str
+    cache: Any
+    version: int
+    dump: Callable[[Any], Any]
+    load: Callable[[Any, Any], int]
+    revalidate: Optional[Revalidator]
+    restored: int = 0
+    revalidated: int = 0
+    dropped: int = 0
+    _stale: dict[Hashable, Any] = field(default_factory=dict, repr=False)
+
+
+def _dump_default(cache: Any) -> Any:
+    if isinstance(cache, Mapping):
+        return dict(cache)
+    if isinstance(cache, MutableSet):
+        return set(cache)
+    raise TypeError(f"{type(cache).__name__} caches need a dump and load function.")
+
+
+def _load_default(cache: Any, data: Any) -> int:
+    """Adds the snapshot's entries without overwriting anything that was filled in the meantime."""
+    if isinstance(cache, MutableMapping):
+        restored = 0
+        for key, value in data.items():
+            if key not in cache:
+                cache[key] = value
+                restored += 1
+        return restored
+    if isinstance(cache, MutableSet):
+        before = len(cache)
+        cache |= data
+        return len(cache) - before
+    raise TypeError(f"{type(cache).__name__} caches need a dump and load function.")
+
+
+class WarmCache:
+    """
+    Saves registered in-process caches to a snapshot file when the bot shuts down, and refills them
+    from it on the next start, so a restart doesn't cold-load everything from the database at once.
+
+    Restored entries are served straight away and revalidated in the background, in batches and with
+    limited concurrency. An entry that was overwritten in the meantime is left alone, and one the
+    revalidator doesn't return is dropped. Snapshots older than ``max_age`` are ignored, and so is a
+    cache whose registered ``version`` differs from the saved one.
+
+    The snapshot is pickled, so it's only ever read from the bot's own cache folder.
+    """
+
+    def __init__(
+        self,
+        bot: MyClient,
+        *,
+        path: str = "cache/warm_cache.bin",
+        max_age: float = 3600.0,
+        revalidate_delay: float = 5.0,
+        batch_size: int = 100,
+        concurrency: int = 2,
+    ):
+        self.bot: MyClient = bot
+        self.enabled: bool = True
+        self.path: str = path
+        self.max_age: float = max_age
+        self.revalidate_delay: float = revalidate_delay
+        self.batch_size: int = batch_size
+        self.concurrency: int = concurrency
+        self.loaded_at: Optional[float] = None  # creation time of the loaded snapshot
+        self._entries: dict[str, WarmCacheEntry] = {}
+        self._index: dict[str, _IndexEntry] = {}
+        self._mmap: Optional[mmap.mmap] = None
+        self._limiter: Optional[asyncio.Semaphore] = None
+        self._logger = logging.getLogger("warm-cache")
+
+    def load_config(self, config: WarmCacheConfig) -> None:
+        self.enabled = config.enabled
+        self.path = config.path
+        self.max_age = config.max_age
+        self.revalidate_delay = config.revalidate_delay
+        self.batch_size = config.batch_size
+        self.concurrency = config.concurrency
+
+    def __iter__(self):
+        return iter(self._entries.values())
+
+    def register(
+        self,
+        name: str,
+        cache: Any,
+        *,
+        version: int = 1,
+        revalidate: Optional[Revalidator] = None,
+        dump: Optional[Callable[[Any], Any]] = None,
+        load: Optional[Callable[[Any, Any], int]] = None,
+    ) -> WarmCacheEntry:
+        """
+        Registers a cache to be saved on shutdown and restored on startup. It's also reported by
+        ``dev mem caches``.
+
+        Parameters:
+            name: A unique name for the cache. It's the key the cache is saved under.
+            cache: A dict-like or set-like cache. Anything else needs ``dump`` and ``load``.
+            version: Bump this when the cached values change shape, so old snapshots are ignored.
+            revalidate: Called with batches of restored keys. It returns fresh values for the keys
+                that still exist, and the others are removed from the cache.
+            dump: Returns a picklable copy of the cache.
+            load: Adds the data returned by ``dump`` to the cache, and returns the number of entries
+                it restored.
+
+        Returns:
+            The registration, which also holds the restore and revalidation counts.
+        """
+        entry = WarmCacheEntry(
+            name=name,
+            cache=cache,
+            version=version,
+            dump=dump or _dump_default,
+            load=load or _load_default,
+            revalidate=revalidate,
+        )
+        self._entries[name] = entry
+        self.bot.memory.register_cache(name, cache)
+        if name in self._index:
+            self._restore(entry)
+        return entry
+
+    def unregister(self, name: str) -> None:
+        self._entries.pop(name, None)
+
+    def invalidate(self, name: str, keys: Optional[list[Hashable]] = None) -> int:
+        """
+        Removes entries from a registered cache, so they're loaded fresh the next time they're used.
+
+        Parameters:
+            name: The name the cache was registered under.
+            keys: The keys to remove. Every entry is removed if this isn't given.
+
+        Returns:
+            The number of entries removed.
+
+        Raises:
+            KeyError: If no cache is registered under ``name``.
+        """
+        entry = self._entries[name]
+        cache = entry.cache
+        if keys is None:
+            removed = len(cache)
+            cache.clear()
+            entry._stale.clear()
+            return removed
+        removed = 0
+        for key in keys:
+            entry._stale.pop(key, None)
+            if key in cache:
+                cache.discard(key) if isinstance(cache, MutableSet) else cache.pop(key)
+                removed += 1
+        return removed
+
+    # loading
+
+    def load(self) -> None:
+        """
+        Maps the snapshot file and restores every registered cache from it. Caches registered later
+        are restored when they register, until the bot is ready and the snapshot is released.
+        """
+        if not self.enabled or self._mmap is not None:
+            return
+        try:
+            with open(self.path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):  # missing or empty
+            return
+        try:
+            created_at = self._read_index()
+        except (ValueError, struct.error, UnicodeDecodeError) as e:
+            self._logger.warning(f"Ignoring the cache snapshot at {self.path}: {e}")
+            self.release()
+            return
+        age = time.time() - created_at
+        if age > self.max_age:
+            self._logger.info(f"Ignoring the cache snapshot at {self.path}, it's {age / 60:.0f} minute(s) old.")
+            self.release()
+            return
+        self.loaded_at = created_at
+        for entry in self._entries.values():
+            self._restore(entry)
+        self.bot.scheduler.once("warm-cache.release", self._release_when_ready)
+
+    async def _release_when_ready(self) -> None:
+        await self.bot.wait_until_ready()
+        self.release()
+
+    def _read_index(self) -> float:
+        data = self._mmap
+        magic, version, count, created_at = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("unknown file format")
+        position = _HEADER.size
+        index = {}
+        for _ in range(count):
+            name_length, cache_version, offset, length, crc = _RECORD.unpack_from(data, position)
+            position += _RECORD.size
+            name = bytes(data[position : position + name_length]).decode("utf-8")
+            position += name_length
+            if offset + length > len(data):
+                raise ValueError(f"the entry for {name} is truncated")
+            index[name] = _IndexEntry(cache_version, offset, length, crc)
+        self._index = index
+        return created_at
+
+    def _restore(self, entry: WarmCacheEntry) -> None:
+        saved = self._index.pop(entry.name, None)
+        if saved is None or self._mmap is None:
+            return
+        if saved.version != entry.version:
+            self._logger.info(f"Not restoring {entry.name}: saved as version {saved.version}, now {entry.version}.")
+            return
+        blob = memoryview(self._mmap)[saved.offset : saved.offset + saved.length]
+        try:
+            if zlib.crc32(blob) != saved.crc:
+                raise ValueError("checksum mismatch")
+            data = pickle.loads(blob)
+            entry.restored = entry.load(entry.cache, data)
+        except Exception as e:
+            self._logger.warning(f"Couldn't restore {entry.name} from the snapshot: {type(e).__name__}: {e}")
+            return
+        finally:
+            blob.release()
+        self._logger.info(f"Restored {entry.restored} entries of {entry.name}.")
+        if entry.revalidate is not None and isinstance(entry.cache, Mapping):
+            entry._stale = {key: data[key] for key in data if entry.cache.get(key) is data[key]}
+            self.bot.scheduler.once(
+                f"warm-cache.revalidate:{entry.name}",
+                functools.partial(self._revalidate, entry),
+                delay=self.revalidate_delay,
+            )
+
+    def release(self) -> None:
+        """Closes the snapshot file. Caches registered afterwards start cold."""
+        self._index.clear()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    # revalidation
+
+    async def _revalidate(self, entry: WarmCacheEntry) -> None:
+        await self.bot.wait_until_ready()
+        if self._limiter is None:
+            # shared by every cache, so they don't all hit the database at once
+            self._limiter = asyncio.Semaphore(self.concurrency)
+        keys = list(entry._stale)
+        for start in range(0, len(keys), self.batch_size):
+            batch = keys[start : start + self.batch_size]
+            async with self._limiter:
+                try:
+                    fresh = await entry.revalidate(batch)
+                except Exception as e:
+                    self._logger.error(f"Revalidating {entry.name} failed, keeping the restored entries: {e}")
+                    entry._stale.clear()
+                    return
+            cache = entry.cache
+            for key in batch:
+                stale = entry._stale.pop(key)
+                if cache.get(key) is not stale:  # filled or removed by the cache's owner since
+                    continue
+                if key in fresh:
+                    cache[key] = fresh[key]
+                    entry.revalidated += 1
+                else:
+                    del cache[key]
+                    entry.dropped += 1
+        self._logger.info(f"Revalidated {entry.name}: {entry.revalidated} refreshed, {entry.dropped} dropped.")
+
+    # saving
+
+    async def save(self) -> None:
+        """Writes every registered cache to the snapshot file, replacing the previous one."""
+        if not self.enabled or not self._entries:
+            return
+        blobs = []
+        for entry in self._entries.values():
+            try:
+                blob = pickle.dumps(entry.dump(entry.cache), protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                self._logger.warning(f"Not saving {entry.name}: {type(e).__name__}: {e}")
+                continue
+            blobs.append((entry.name, entry.version, blob))
+        self.release()  # the old snapshot may still be mapped
+        start = time.perf_counter()
+        size = await self.bot.executors.io.run(self._write, blobs)
+        self._logger.info(
+            f"Saved {len(blobs)} cache(s) to {self.path} ({size} bytes) in {time.perf_counter() - start:.2f}s."
+        )
+
+    def _write(self, blobs: list[tuple[str, int, bytes]]) -> int:
+        names = [name.encode("utf-8") for name, _, _ in blobs]
+        offset = _HEADER.size + sum(_RECORD.size + len(name) for name in names)
+        records, padded = [], []
+        for name, (_, version, blob) in zip(names, blobs):
+            offset += -offset % 8
+            records.append(_RECORD.pack(len(name), version, offset, len(blob), zlib.crc32(blob)) + name)
+            padded.append((offset, blob))
+            offset += len(blob)
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(blobs), time.time()))
+            for record in records:
+                f.write(record)
+            for position, blob in padded:
+                f.write(b"\x00" * (position - f.tell()))
+                f.write(blob)
+            size = f.tell()
+        os.replace(tmp_path, self.path)
+        return size
@@ -13,6 +13,9 @@ import discord
 from discord import Embed
 from discord.ext import commands
 
+from ..core.database import DatabaseTimeout, DatabaseUnavailable
+from ..core.executors import ExecutorBusy
+from ..utils.logs import TIMESTAMP_FORMAT
 from ..utils.static import Emotes
 
 
@@ -65,6 +68,31 @@ class PrefixCommandErrorHandler(commands.Cog):
             )
             send_kwargs = {}
 
+        elif isinstance(error, ExecutorBusy):
+            ctx.command.reset_cooldown(ctx)
+            embed = Embed(
+                title="Woah, calm down.",
+                description="I'm a bit busy right now. Please try again in a moment.",
+                color=discord.Colour.red(),
+            )
+            send_kwargs = {}
+
+        elif isinstance(error, DatabaseUnavailable):
+            ctx.command.reset_cooldown(ctx)
+            if isinstance(error, DatabaseTimeout):
+                description = "My database is taking too long to answer. Please try again in a moment."
+            else:
+                description = (
+                    "I can't reach my database right now. "
+                    f"Please try again in about {max(5, round(error.retry_after))} seconds."
+                )
+            embed = Embed(
+                title="Something's up on my end.",
+                description=description,
+                color=discord.Colour.red(),
+            )
+            send_kwargs = {}
+
         elif isinstance(error, commands.MissingRole):
             ctx.command.reset_cooldown(ctx)
             embed = Embed(
@@ -289,7 +317,10 @@ class PrefixCommandErrorHandler(commands.Cog):
             async with aiofiles.open(
                 "logs/error.log", "a", encoding="utf-8"
             ) as logfile:
-                await logfile.write(f"{tb}\n\n{error}")
+                await logfile.write(
+                    f"[{datetime.now().strftime(TIMESTAMP_FORMAT)}] "
+                    f"{type(error).__name__}: {error}\n{tb}\n"
+                )
 
         try:
             await ctx.send(embed=embed, **send_kwargs)
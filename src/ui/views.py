@@ -1,10 +1,14 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Iterable, Optional, Union
+from typing import TYPE_CHECKING, Any, Iterable, Optional, Union
 
 if TYPE_CHECKING:
     from ..core.client import MiasmaClient
+    from ..core.view_manager import ViewManager
+    from ..utils.shell import ShellProcess
 
+import asyncio
+import contextlib
 import traceback as tb
 
 import discord
@@ -12,15 +16,88 @@ from discord import Embed
 from discord.ext import commands
 from discord.ui import View
 
+from ..core.interactions import InteractionGuard
+
+
+def _get_author(
+    interaction_or_ctx: discord.Interaction | commands.Context | None,
+) -> Optional[discord.abc.User]:
+    if interaction_or_ctx is None:
+        return None
+    if isinstance(interaction_or_ctx, discord.Interaction):
+        return interaction_or_ctx.user
+    return interaction_or_ctx.author
+
+
+class ManagedView(View):
+    """
+    A view whose timeout and lifetime are handled by the client's ``ViewManager``.
+
+    The view does not start its own timeout task. Instead, it is registered with the manager,
+    which times it out from a shared timer wheel and evicts it early if the global or per-user
+    view cap is reached. Falls back to the default discord.py behaviour if no manager is available.
+
+    Item callbacks run under the client's ``InteractionGuard``, which defers the interaction if a
+    callback is about to miss Discord's response deadline.
+    """
 
-class BaseView(View):
+    def __init__(
+        self,
+        bot: Optional[MiasmaClient],
+        interaction_or_ctx: discord.Interaction | commands.Context | None,
+        timeout: float | None,
+    ):
+        manager: Optional[ViewManager] = getattr(bot, "view_manager", None)
+        super().__init__(timeout=timeout if manager is None else None)
+        self.managed_timeout: float | None = timeout
+        author = _get_author(interaction_or_ctx)
+        self.owner_id: Optional[int] = author.id if author is not None else None
+        self._view_manager: Optional[ViewManager] = manager
+        if manager is not None:
+            manager.register(self)
+
+    def _dispatch_item(self, item: Any, interaction: discord.Interaction):
+        drainer = getattr(interaction.client, "drainer", None)
+        if drainer is not None and drainer.draining:
+            return asyncio.create_task(drainer.reject(interaction), name="drain-reject")
+        if self._view_manager is not None:
+            self._view_manager.touch(self)
+        name = self._handler_name(item)
+        guard: Optional[InteractionGuard] = getattr(interaction.client, "interactions", None)
+        response = guard.guard(interaction, name) if guard is not None else None
+        # the callback's task inherits the database deadline and pinning scope set here
+        command_scope = getattr(interaction.client, "command_scope", None)
+        with command_scope() if command_scope is not None else contextlib.nullcontext():
+            # noinspection PyProtectedMember
+            task = super()._dispatch_item(item, interaction)
+        if task is None:
+            InteractionGuard.release(response)
+            return task
+        if response is not None:
+            task.add_done_callback(lambda _: InteractionGuard.release(response))
+        if drainer is not None:
+            drainer.add(task, name)
+        return task
+
+    def _handler_name(self, item: Any) -> str:
+        callback = getattr(item.callback, "callback", item.callback)
+        name = getattr(callback, "__name__", None) or getattr(item, "custom_id", None) or type(item).__name__
+        return f"{type(self).__name__}.{name}"
+
+    def stop(self) -> None:
+        if self._view_manager is not None:
+            self._view_manager.discard(self)
+        super().stop()
+
+
+class BaseView(ManagedView):
     def __init__(
         self,
         bot: MiasmaClient,
         interaction: discord.Interaction | commands.Context = None,
         timeout: float | None = 60.0,
     ):
-        super().__init__(timeout=timeout)
+        super().__init__(bot, interaction, timeout)
         self.bot = bot
         self.interaction_or_ctx: discord.Interaction | commands.Context = interaction
         self.message: discord.Message | None = None
@@ -92,7 +169,30 @@ class ConfirmView(BaseView):
         self.stop()
 
 
-class PaginatorView(discord.ui.View):
+class ProcessView(BaseView):
+    """Shows a kill button while a shell process is running."""
+
+    def __init__(
+        self,
+        bot: MiasmaClient,
+        interaction_or_ctx: discord.Interaction | commands.Context,
+        process: ShellProcess,
+    ):
+        # the view is stopped by the command once the process exits
+        super().__init__(bot, interaction_or_ctx, timeout=None)
+        self.process: ShellProcess = process
+
+    async def on_timeout(self) -> None:
+        pass
+
+    @discord.ui.button(label="Kill", style=discord.ButtonStyle.red)
+    async def kill(self, interaction: discord.Interaction, _):
+        await interaction.response.defer()
+        self.process.kill()
+        self.stop()
+
+
+class PaginatorView(ManagedView):
     def __init__(
         self,
         items: list[Union[str, int, Embed]] = None,
@@ -130,7 +230,12 @@ class PaginatorView(discord.ui.View):
                 "All items within the iterable must be of type 'str', 'int' or 'Embed'."
             )
 
-        super().__init__(timeout=timeout)
+        bot = (
+            interaction.client
+            if isinstance(interaction, discord.Interaction)
+            else interaction.bot
+        )
+        super().__init__(bot, interaction, timeout)
         self.items = list(self.items)
         if (
             len(self.items) == 1
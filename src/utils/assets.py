@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ..core.executors import NamedExecutor
+
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import uuid
+from typing import Optional
+
+import aiofiles
+
+# Discord rejects emojis larger than 256 KiB.
+EMOJI_MAX_SIZE = 256 * 1024
+
+
+class AssetCache:
+    """
+    A content-addressed on-disk cache for downloaded assets.
+
+    Blobs are stored under the SHA-256 of their content, and a small JSON index maps source URLs to
+    digests, so the same image is only stored once no matter how many URLs point at it. Derived
+    blobs (e.g. a downscaled copy) are stored next to their source, keyed by digest and variant.
+
+    Concurrent writes of the same blob share one write. The index is saved in the background by
+    ``executor`` (the loop's default executor if not given), once for any number of ``put`` calls
+    made while the previous save was running. ``flush`` waits for the last save.
+    """
+
+    def __init__(self, directory: str = "cache/assets", *, executor: Optional[NamedExecutor] = None):
+        self.directory: str = directory
+        self.executor: Optional[NamedExecutor] = executor
+        self._index_path = os.path.join(directory, "index.json")
+        self._index: Optional[dict[str, str]] = None
+        self._index_dirty: bool = False
+        self._save_task: Optional[asyncio.Task] = None
+        self._writes: dict[str, asyncio.Task] = {}
+        self._logger = logging.getLogger("assets")
+
+    def _blob_path(self, digest: str, variant: Optional[str] = None) -> str:
+        name = digest if variant is None else f"{digest}.{variant}"
+        return os.path.join(self.directory, digest[:2], name)
+
+    def _load_index(self) -> dict[str, str]:
+        if self._index is None:
+            try:
+                with open(self._index_path, "r", encoding="utf-8") as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _write_index(self, content: str) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._index_path + ".tmp"  # only one save runs at a time
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, self._index_path)
+
+    async def _save_index(self) -> None:
+        while self._index_dirty:
+            self._index_dirty = False
+            content = json.dumps(self._index)
+            try:
+                if self.executor is not None:
+                    await self.executor.run(self._write_index, content)
+                else:
+                    await asyncio.get_running_loop().run_in_executor(None, self._write_index, content)
+            except Exception as e:
+                self._logger.error(f"Couldn't save the asset index: {type(e).__name__}: {e}")
+
+    def _schedule_save(self) -> None:
+        self._index_dirty = True
+        if self._save_task is None or self._save_task.done():
+            self._save_task = asyncio.create_task(self._save_index(), name="assets-save-index")
+
+    async def flush(self) -> None:
+        """Waits for the index to be saved."""
+        if self._save_task is not None:
+            await self._save_task
+
+    async def _read(self, path: str) -> Optional[bytes]:
+        try:
+            async with aiofiles.open(path, "rb") as f:
+                return await f.read()
+        except OSError:
+            return None
+
+    @staticmethod
+    async def _write_file(path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            async with aiofiles.open(tmp_path, "wb") as f:
+                await f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    async def _write(self, path: str, data: bytes) -> None:
+        # blobs are content-addressed, so a write in flight to the same path has the same bytes
+        task = self._writes.get(path)
+        if task is None:
+            task = self._writes[path] = asyncio.create_task(self._write_file(path, data))
+            task.add_done_callback(lambda _: self._writes.pop(path, None))
+        await asyncio.shield(task)
+
+    async def get(self, url: str) -> Optional[bytes]:
+        digest = self._load_index().get(url)
+        return None if digest is None else await self._read(self._blob_path(digest))
+
+    async def put(self, url: str, data: bytes) -> str:
+        """Stores ``data`` as the content of ``url`` and returns its digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            await self._write(path, data)
+        index = self._load_index()
+        if index.get(url) != digest:
+            index[url] = digest
+            self._schedule_save()
+        return digest
+
+    async def get_variant(self, digest: str, variant: str) -> Optional[bytes]:
+        return await self._read(self._blob_path(digest, variant))
+
+    async def put_variant(self, digest: str, variant: str, data: bytes) -> None:
+        await self._write(self._blob_path(digest, variant), data)
+
+
+def fit_image(data: bytes, max_size: int = EMOJI_MAX_SIZE) -> bytes:
+    """
+    Downscales a static or animated image until it is at most ``max_size`` bytes.
+    This is CPU-bound and meant to be run in a process pool.
+
+    Raises:
+        RuntimeError: If Pillow isn't installed.
+        ValueError: If the image can't be made small enough.
+    """
+    try:
+        from PIL import Image, ImageSequence
+    except ImportError:
+        raise RuntimeError("Pillow is required to downscale images (pip install Pillow).")
+
+    with Image.open(io.BytesIO(data)) as image:
+        animated = getattr(image, "is_animated", False)
+        if animated:
+            frames = [frame.copy() for frame in ImageSequence.Iterator(image)]
+            durations = [frame.info.get("duration", 100) for frame in frames]
+        else:
+            frames = [image.copy()]
+            durations = []
+        loop = image.info.get("loop", 0)
+
+    width, height = frames[0].size
+    scale = 1.0
+    while True:
+        scale *= 0.8
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        if max(size) < 32:
+            raise ValueError("The image can't be downscaled enough to fit.")
+
+        # animations also lose every other frame once they get small, since frames dominate the size
+        step = 2 if animated and max(size) <= 64 else 1
+        resized = [f.resize(size, Image.LANCZOS) for f in frames[::step]]
+        buffer = io.BytesIO()
+        if animated:
+            resized[0].save(
+                buffer,
+                format="GIF",
+                save_all=True,
+                append_images=resized[1:],
+                duration=[d * step for d in durations[::step]],
+                loop=loop,
+                disposal=2,
+                optimize=True,
+            )
+        else:
+            resized[0].save(buffer, format="PNG", optimize=True)
+
+        if buffer.tell() <= max_size:
+            return buffer.getvalue()
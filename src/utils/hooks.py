@@ -0,0 +1,49 @@
+from typing import Any, Callable, Optional
+
+Parser = Callable[[Any], None]
+
+
+class ParserHook:
+    """
+    Wraps one of the connection state's gateway parsers.
+
+    ``hook(data, inner)`` is called instead of the parser and must call ``inner(data)`` itself.
+    Each hook keeps the parser (or hook) it wrapped when it was installed in ``inner``. Hooks can be
+    stacked and removed in any order: ``remove_parser_hook`` finds the hook that wraps the removed
+    one and points its ``inner`` past it.
+    """
+
+    __slots__ = ("event", "hook", "inner")
+
+    def __init__(self, event: str, hook: Callable[[Any, Parser], None], inner: Parser):
+        self.event: str = event
+        self.hook = hook
+        self.inner: Parser = inner
+
+    def __call__(self, data: Any) -> None:
+        self.hook(data, self.inner)
+
+
+def add_parser_hook(
+    parsers: dict[str, Parser], event: str, hook: Callable[[Any, Parser], None]
+) -> Optional[ParserHook]:
+    """Installs ``hook`` around the parser of ``event``. Returns ``None`` if there is no such parser."""
+    inner = parsers.get(event)
+    if inner is None:
+        return None
+    wrapper = ParserHook(event, hook, inner)
+    parsers[event] = wrapper
+    return wrapper
+
+
+def remove_parser_hook(parsers: dict[str, Parser], wrapper: ParserHook) -> None:
+    """Removes a hook installed by ``add_parser_hook``, even if other hooks were installed on top of it."""
+    current = parsers.get(wrapper.event)
+    if current is wrapper:
+        parsers[wrapper.event] = wrapper.inner
+        return
+    while isinstance(current, ParserHook):
+        if current.inner is wrapper:
+            current.inner = wrapper.inner
+            return
+        current = current.inner
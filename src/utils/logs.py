@@ -0,0 +1,120 @@
+import mmap
+import os
+import re
+from collections import deque
+from datetime import datetime, timedelta
+from typing import BinaryIO, Iterator, Optional
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+_TIMESTAMP_RE = re.compile(rb"^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\]")
+_DURATION_RE = re.compile(r"^(\d+)\s*([smhdw])$", re.IGNORECASE)
+_DURATION_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+
+
+def _decode(line: bytes) -> str:
+    return line.decode("utf-8", errors="replace").rstrip("\r")
+
+
+def _iter_lines_reversed(f: BinaryIO, chunk_size: int = 8192) -> Iterator[bytes]:
+    """Yields the lines of a binary file from last to first, reading it backwards in chunks."""
+    f.seek(0, os.SEEK_END)
+    pos = f.tell()
+    if pos == 0:
+        return
+
+    f.seek(pos - 1)
+    if f.read(1) == b"\n":  # don't yield an empty line for the trailing newline
+        pos -= 1
+
+    remainder = b""
+    while pos > 0:
+        read = min(chunk_size, pos)
+        pos -= read
+        f.seek(pos)
+        lines = (f.read(read) + remainder).split(b"\n")
+        remainder = lines[0]
+        yield from reversed(lines[1:])
+    yield remainder
+
+
+def tail(path: str, n: int) -> list[str]:
+    """Gets the last ``n`` lines of a file without reading the rest of it."""
+    lines = []
+    with open(path, "rb") as f:
+        for line in _iter_lines_reversed(f):
+            if len(lines) >= n:
+                break
+            lines.append(_decode(line))
+    lines.reverse()
+    return lines
+
+
+def since(path: str, when: datetime, *, limit: Optional[int] = None) -> list[str]:
+    """
+    Gets all lines logged at or after ``when``.
+    Lines without a timestamp (e.g. tracebacks) belong to the last timestamped line above them.
+    The file is read backwards and reading stops at the first entry older than ``when``.
+    """
+    lines: deque[str] = deque()
+    entry: list[str] = []
+    with open(path, "rb") as f:
+        for line in _iter_lines_reversed(f):
+            match = _TIMESTAMP_RE.match(line)
+            if match is None:
+                entry.append(_decode(line))
+                continue
+            logged_at = datetime.strptime(match.group(1).decode(), TIMESTAMP_FORMAT)
+            if logged_at < when:
+                break
+            entry.append(_decode(line))
+            lines.extendleft(entry)  # entry is in reverse order, extendleft flips it back
+            entry.clear()
+            if limit is not None and len(lines) >= limit:
+                break
+    return list(lines)
+
+
+def grep(
+    path: str, pattern: str, *, limit: int = 500, ignore_case: bool = True
+) -> list[str]:
+    """
+    Gets the last ``limit`` lines that match the regex ``pattern``.
+    The file is memory-mapped and scanned with the regex directly, so only matching lines are decoded.
+
+    Raises:
+        re.error: If the pattern is invalid.
+    """
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    regex = re.compile(pattern.encode("utf-8"), flags)
+    matches: deque[str] = deque(maxlen=limit)
+
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            last_end = -1
+            for match in regex.finditer(mm):
+                start = mm.rfind(b"\n", 0, match.start()) + 1
+                if start <= last_end:  # another match on a line we already have
+                    continue
+                end = mm.find(b"\n", match.end())
+                if end == -1:
+                    end = len(mm)
+                matches.append(_decode(mm[start:end]))
+                last_end = end
+    return list(matches)
+
+
+def parse_since(text: str) -> datetime:
+    """
+    Parses either a relative duration (``30m``, ``2h``, ``1d``) or an absolute ISO timestamp.
+
+    Raises:
+        ValueError: If the text is neither.
+    """
+    text = text.strip()
+    match = _DURATION_RE.match(text)
+    if match is not None:
+        amount, unit = match.groups()
+        return datetime.now() - timedelta(**{_DURATION_UNITS[unit.lower()]: int(amount)})
+    return datetime.fromisoformat(text)
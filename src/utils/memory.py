@@ -0,0 +1,59 @@
+import sys
+from collections import deque
+from typing import Any, Iterable
+
+
+def deep_getsizeof(
+    obj: Any, *, exclude: Iterable[Any] = (), max_objects: int = 10_000
+) -> int:
+    """
+    Estimates the memory footprint of an object and everything it references.
+
+    Shared objects are only counted once. Classes, modules and functions are skipped, so the
+    estimate is roughly the memory that would be freed if ``obj`` was garbage collected.
+
+    Parameters:
+        obj: The object to measure.
+        exclude: Objects that are referenced but not owned by ``obj`` (e.g. the bot instance).
+        max_objects: The maximum number of objects to visit before giving up.
+
+    Returns:
+        int: The estimated size in bytes.
+    """
+    seen: set[int] = {id(x) for x in exclude}
+    queue = deque([obj])
+    total = 0
+
+    while queue and len(seen) < max_objects:
+        current = queue.popleft()
+        if id(current) in seen or isinstance(
+            current, (type, type(sys), type(deep_getsizeof))
+        ):
+            continue
+        seen.add(id(current))
+        try:
+            total += sys.getsizeof(current)
+        except TypeError:
+            continue
+
+        if isinstance(current, dict):
+            queue.extend(current.keys())
+            queue.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset, deque)):
+            queue.extend(current)
+
+        if hasattr(current, "__dict__"):
+            queue.append(current.__dict__)
+        for slot in getattr(type(current), "__slots__", ()):
+            if hasattr(current, slot):
+                queue.append(getattr(current, slot))
+
+    return total
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
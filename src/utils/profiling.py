@@ -0,0 +1,145 @@
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from types import CodeType, FrameType
+from typing import Any, Optional
+
+
+def _code_name(code: CodeType) -> str:
+    name = getattr(code, "co_qualname", code.co_name)  # co_qualname is only available on 3.11+
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _await_chain(awaitable: Any) -> tuple[list[str], Optional[str]]:
+    """
+    Walks the chain of awaits starting at a suspended coroutine.
+
+    Returns:
+        tuple[list[str], Optional[str]]: The names of the coroutines in the chain (outermost first),
+            and a description of the leaf object being awaited (e.g. a Future), if any.
+    """
+    chain = []
+    while awaitable is not None:
+        code = getattr(awaitable, "cr_code", None) or getattr(awaitable, "ag_code", None)
+        if code is None:
+            code = getattr(awaitable, "gi_code", None)
+        if code is None:
+            return chain, type(awaitable).__name__
+        chain.append(_code_name(code))
+        awaitable = (
+            getattr(awaitable, "cr_await", None)
+            or getattr(awaitable, "ag_await", None)
+            or getattr(awaitable, "gi_yieldfrom", None)
+        )
+    return chain, None
+
+
+class CommandProfiler:
+    """
+    Profiles everything that runs on the event loop thread while it is active.
+
+    Two profilers run at the same time:
+        - ``cProfile`` gives exact self and cumulative times per function.
+        - A sampling thread records the stack of the event loop thread every ``interval`` seconds,
+          producing collapsed stacks for flamegraphs. When the followed task is suspended it walks
+          the task's await chain instead, which gives the time each coroutine spent awaiting.
+
+    Parameters:
+        task: The task whose await chain is followed. Defaults to the current task.
+        interval: The sampling interval in seconds.
+    """
+
+    def __init__(
+        self, task: Optional[asyncio.Task] = None, *, interval: float = 0.005
+    ):
+        self.task: Optional[asyncio.Task] = task
+        self.interval: float = interval
+        self.stacks: Counter[str] = Counter()
+        self.awaited: Counter[str] = Counter()  # seconds spent awaiting, per coroutine
+        self.samples: int = 0
+        self.wall_time: float = 0.0
+        self._profile = cProfile.Profile()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop_thread_id: Optional[int] = None
+        self._started_at: float = 0.0
+
+    def _collapse_frames(self, frame: Optional[FrameType]) -> str:
+        names = []
+        while frame is not None:
+            names.append(_code_name(frame.f_code))
+            frame = frame.f_back
+        names.reverse()
+        return ";".join(names)
+
+    def _sample(self) -> None:
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            # weight each sample by the real time since the last one,
+            # since the GIL can delay this thread well past the interval
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            self.samples += 1
+            coro = self.task.get_coro() if self.task is not None else None
+            if coro is not None and not getattr(coro, "cr_running", True):
+                chain, leaf = _await_chain(coro)
+                for name in set(chain):
+                    self.awaited[name] += elapsed
+                self.stacks[";".join(chain + [f"<awaiting {leaf}>" if leaf else "<awaiting>"])] += 1
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)  # noqa
+            if frame is not None:
+                self.stacks[self._collapse_frames(frame)] += 1
+
+    def __enter__(self) -> "CommandProfiler":
+        if self.task is None:
+            self.task = asyncio.current_task()
+        self._loop_thread_id = threading.get_ident()
+        self._thread = threading.Thread(
+            target=self._sample, name="command-profiler", daemon=True
+        )
+        self._started_at = time.perf_counter()
+        self._thread.start()
+        self._profile.enable()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self._profile.disable()
+        self.wall_time = time.perf_counter() - self._started_at
+        self._stop.set()
+        self._thread.join()
+
+    def stats_report(self, sort: str, limit: int = 15) -> str:
+        buffer = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=buffer)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        # drop the preamble pstats prints before the table
+        text = buffer.getvalue()
+        start = text.find("   ncalls")
+        return text[start:].rstrip() if start != -1 else text.strip()
+
+    def awaited_report(self, limit: int = 15) -> str:
+        lines = [
+            f"{seconds * 1000:>10.1f} ms  {name}"
+            for name, seconds in self.awaited.most_common(limit)
+        ]
+        return "\n".join(lines) or "Nothing was awaited."
+
+    def report(self, limit: int = 15) -> str:
+        return (
+            f"Wall time: {self.wall_time * 1000:.1f} ms, {self.samples} samples\n\n"
+            f"Top {limit} by cumulative time:\n{self.stats_report('cumulative', limit)}\n\n"
+            f"Top {limit} by self time:\n{self.stats_report('tottime', limit)}\n\n"
+            f"Awaited time per coroutine (sampled):\n{self.awaited_report(limit)}\n"
+        )
+
+    def collapsed_stacks(self) -> str:
+        """The samples in the collapsed stack format read by ``flamegraph.pl`` and speedscope."""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.items())
@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from discord.ext import commands
+
+import ast
+import importlib
+import importlib.util
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from types import ModuleType
+from typing import Iterable, Optional
+
+# Modules that own live objects (the client instance, the entrypoint) and can't be swapped out at runtime.
+PINNED_MODULES = frozenset({"main", "src.core.client"})
+# The packages whose modules can be reloaded. Everything else, like a virtualenv inside the repository, is skipped.
+PACKAGES = ("src",)
+_INSTALLED_DIRS = frozenset({"site-packages", "dist-packages"})
+
+
+@dataclass
+class ReloadPlan:
+    changed_modules: list[str] = field(default_factory=list)
+    modules: list[str] = field(default_factory=list)  # non-extension modules, in dependency order
+    extensions: list[str] = field(default_factory=list)
+    restart_required: list[str] = field(default_factory=list)
+    ignored_files: list[str] = field(default_factory=list)
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.modules and not self.extensions
+
+
+@dataclass
+class ReloadResult:
+    name: str
+    is_extension: bool
+    duration: float
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def module_name_for_path(path: str) -> Optional[str]:
+    """
+    Converts a repository-relative file path to a module name,
+    e.g. ``src/core/objects.py`` -> ``src.core.objects``.
+    """
+    if not path.endswith(".py"):
+        return None
+    parts = path[:-3].replace("\\", "/").split("/")
+    if parts[-1] == "__init__":
+        parts.pop()
+    return ".".join(parts) if parts else None
+
+
+def _is_type_checking_block(node: ast.AST) -> bool:
+    test = getattr(node, "test", None)
+    return isinstance(node, ast.If) and (
+        (isinstance(test, ast.Name) and test.id == "TYPE_CHECKING")
+        or (isinstance(test, ast.Attribute) and test.attr == "TYPE_CHECKING")
+    )
+
+
+def _runtime_imports(module: ModuleType) -> set[str]:
+    """Gets the absolute names of everything a module imports at runtime (``TYPE_CHECKING`` imports are skipped)."""
+    filename = getattr(module, "__file__", None)
+    if not filename or not filename.endswith(".py"):
+        return set()
+    try:
+        with open(filename, "r", encoding="utf-8") as f:
+            tree = ast.parse(f.read(), filename)
+    except (OSError, SyntaxError):
+        return set()
+
+    package = module.__name__ if hasattr(module, "__path__") else module.__name__.rpartition(".")[0]
+    imports = set()
+    stack = list(tree.body)
+    while stack:
+        node = stack.pop()
+        if _is_type_checking_block(node):
+            stack.extend(node.orelse)
+            continue
+        if isinstance(node, ast.Import):
+            imports.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                base = importlib.util.resolve_name("." * node.level + (node.module or ""), package)
+            else:
+                base = node.module
+            imports.add(base)
+            # `from package import module` imports a submodule rather than an attribute
+            imports.update(f"{base}.{alias.name}" for alias in node.names)
+        else:
+            stack.extend(ast.iter_child_nodes(node))
+    return imports
+
+
+def _project_modules(root: str, packages: Iterable[str]) -> dict[str, ModuleType]:
+    packages = tuple(packages)
+    directories = tuple(os.path.join(os.path.abspath(root), package) + os.sep for package in packages)
+    modules = {}
+    for name, module in list(sys.modules.items()):
+        # also skips __main__, the entrypoint can never be reloaded
+        if name.partition(".")[0] not in packages:
+            continue
+        filename = getattr(module, "__file__", None)
+        if not filename:
+            continue
+        filename = os.path.abspath(filename)
+        if filename.startswith(directories) and not _INSTALLED_DIRS.intersection(filename.split(os.sep)):
+            modules[name] = module
+    return modules
+
+
+def build_import_graph(root: str = ".", packages: Iterable[str] = PACKAGES) -> dict[str, set[str]]:
+    """
+    Maps every loaded module of the project's packages to the project modules it imports.
+    This parses every module's source, so it's best run in an executor.
+    """
+    modules = _project_modules(root, packages)
+    return {
+        name: {dep for dep in _runtime_imports(module) if dep in modules and dep != name}
+        for name, module in modules.items()
+    }
+
+
+def _dependency_order(names: set[str], graph: dict[str, set[str]]) -> list[str]:
+    """Orders modules so that every module comes after the modules it imports."""
+    order, visited = [], set()
+
+    def visit(name: str) -> None:
+        if name in visited:
+            return
+        visited.add(name)
+        for dep in sorted(graph.get(name, ())):
+            if dep in names:
+                visit(dep)
+        order.append(name)
+
+    for name in sorted(names):
+        visit(name)
+    return order
+
+
+def _pinned_closure(graph: dict[str, set[str]]) -> set[str]:
+    """
+    Gets the pinned modules and everything they import, directly or not. The client holds instances
+    and classes from all of them, so reloading any of them leaves it using the old ones.
+    """
+    closure = set()
+    stack = [name for name in PINNED_MODULES if name in graph]
+    while stack:
+        name = stack.pop()
+        if name in closure:
+            continue
+        closure.add(name)
+        stack.extend(graph.get(name, ()))
+    return closure
+
+
+def plan_reload(
+    changed_files: Iterable[str], extensions: Iterable[str], root: str = "."
+) -> ReloadPlan:
+    """
+    Works out the smallest set of modules and extensions to reload for a set of changed files.
+
+    An extension is reloaded if any module in its import tree changed. Non-extension modules in that
+    tree which (transitively) import a changed module are reloaded first, in dependency order, so
+    the extension picks up the new objects.
+
+    Changes to the pinned modules, or to anything they import, need a restart instead. Reloading them
+    would leave the client on the old objects while the reloaded extensions use the new ones.
+
+    This parses the source of every loaded project module, so it's best run in an executor.
+    """
+    plan = ReloadPlan()
+    extensions = set(extensions)
+    graph = build_import_graph(root)
+    pinned = _pinned_closure(graph)
+
+    for path in changed_files:
+        name = module_name_for_path(path)
+        if name is None:
+            plan.ignored_files.append(path)
+        elif name in PINNED_MODULES or name in pinned:
+            plan.restart_required.append(name)
+        elif name in graph:
+            plan.changed_modules.append(name)
+        else:
+            plan.ignored_files.append(f"{path} (not loaded)")
+
+    # reverse edges: module -> modules that import it
+    dependents: dict[str, set[str]] = {name: set() for name in graph}
+    for name, deps in graph.items():
+        for dep in deps:
+            dependents[dep].add(name)
+
+    stale = set()
+    stack = list(plan.changed_modules)
+    while stack:
+        name = stack.pop()
+        # pinned modules keep their references to the old objects until the next restart
+        if name in stale or name in PINNED_MODULES:
+            continue
+        stale.add(name)
+        stack.extend(dependents.get(name, ()))
+
+    extension_modules = set()
+    for name in stale:
+        owner = next(
+            (ext for ext in extensions if name == ext or name.startswith(ext + ".")), None
+        )
+        if owner is not None:
+            extension_modules.add(name)
+            if owner not in plan.extensions:
+                plan.extensions.append(owner)
+
+    plan.extensions.sort()
+    plan.modules = _dependency_order(stale - extension_modules, graph)
+    plan.restart_required.sort()
+    return plan
+
+
+async def execute_reload(bot: commands.Bot, plan: ReloadPlan) -> list[ReloadResult]:
+    """
+    Reloads the modules and extensions in a plan, timing each one.
+
+    A module that fails to reload is restored to its previous contents, and an extension that fails
+    is rolled back by discord.py, so a bad change never leaves a half-loaded module behind.
+    """
+    results = []
+    for name in plan.modules:
+        module = sys.modules.get(name)
+        if module is None:
+            continue
+        previous = dict(module.__dict__)
+        started = time.perf_counter()
+        try:
+            importlib.reload(module)
+        except Exception as e:
+            module.__dict__.clear()
+            module.__dict__.update(previous)
+            results.append(ReloadResult(name, False, time.perf_counter() - started, e))
+        else:
+            results.append(ReloadResult(name, False, time.perf_counter() - started))
+
+    for name in plan.extensions:
+        started = time.perf_counter()
+        try:
+            await bot.reload_extension(name)
+        except Exception as e:
+            results.append(ReloadResult(name, True, time.perf_counter() - started, e))
+        else:
+            results.append(ReloadResult(name, True, time.perf_counter() - started))
+    return results
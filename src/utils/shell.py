@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ..core.executors import NamedExecutor
+
+import asyncio
+import functools
+import os
+import signal
+import subprocess
+import time
+from typing import Any, AsyncIterator, Callable, Optional, TypeVar, Union
+
+T = TypeVar("T")
+
+
+async def _run_blocking(executor: Optional[NamedExecutor], func: Callable[..., T], *args: Any) -> T:
+    if executor is not None:
+        return await executor.run(func, *args)
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+class OutputBuffer:
+    """A ring buffer that only keeps the last ``max_bytes`` bytes written to it."""
+
+    def __init__(self, max_bytes: int = 64 * 1024):
+        self.max_bytes: int = max_bytes
+        self.total_bytes: int = 0
+        self.version: int = 0  # bumped on every write, used to detect changes cheaply
+        self._buffer = bytearray()
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def write(self, data: bytes) -> None:
+        if not data:
+            return
+        self.total_bytes += len(data)
+        self.version += 1
+        if len(data) >= self.max_bytes:
+            self._buffer[:] = data[-self.max_bytes :]
+            return
+        self._buffer += data
+        overflow = len(self._buffer) - self.max_bytes
+        if overflow > 0:
+            del self._buffer[:overflow]
+
+    @property
+    def dropped_bytes(self) -> int:
+        return self.total_bytes - len(self._buffer)
+
+    def text(self) -> str:
+        return self._buffer.decode("utf-8", errors="replace")
+
+    def tail(self, chars: int) -> str:
+        # a UTF-8 character is at most 4 bytes, so this is always enough to fill `chars`
+        return self._buffer[-chars * 4 :].decode("utf-8", errors="replace")[-chars:]
+
+
+class ShellProcess:
+    """
+    Runs a shell command in its own process group and streams its combined stdout/stderr into an
+    ``OutputBuffer`` as it is produced.
+
+    Parameters:
+        command: The shell command to run.
+        max_output: The number of output bytes to keep.
+        timeout: The wall-clock time limit in seconds. The process group is killed when it is reached.
+        executor: Where the pipe is read on Windows, where the event loop can't watch subprocesses.
+            Defaults to the loop's default executor.
+    """
+
+    def __init__(
+        self,
+        command: str,
+        *,
+        max_output: int = 64 * 1024,
+        timeout: float = 300.0,
+        executor: Optional[NamedExecutor] = None,
+    ):
+        self.command: str = command
+        self.timeout: float = timeout
+        self.executor: Optional[NamedExecutor] = executor
+        self.output: OutputBuffer = OutputBuffer(max_output)
+        self.timed_out: bool = False
+        self.killed: bool = False
+        self.started_at: Optional[float] = None
+        self.ended_at: Optional[float] = None
+        self._process: Optional[
+            Union[asyncio.subprocess.Process, subprocess.Popen]
+        ] = None
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._process.pid if self._process is not None else None
+
+    @property
+    def returncode(self) -> Optional[int]:
+        if self._process is None:
+            return None
+        if isinstance(self._process, subprocess.Popen):
+            return self._process.poll()
+        return self._process.returncode
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.ended_at or time.monotonic()) - self.started_at
+
+    async def _start(self) -> AsyncIterator[bytes]:
+        if os.name == "nt":
+            kwargs = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+        else:
+            kwargs = {"start_new_session": True}  # puts the shell and its children in a new group
+        pipes = {
+            "stdin": subprocess.DEVNULL,
+            "stdout": subprocess.PIPE,
+            "stderr": subprocess.STDOUT,
+        }
+
+        self.started_at = time.monotonic()
+        try:
+            self._process = await asyncio.create_subprocess_shell(
+                self.command, **pipes, **kwargs
+            )
+        except NotImplementedError:
+            # The selector event loop used on Windows has no subprocess support,
+            # so the pipe is read from a worker thread instead of blocking on communicate()
+            self._process = subprocess.Popen(
+                self.command, shell=True, **pipes, **kwargs
+            )
+            return self._read_pipe(self._process.stdout)
+        return self._read_stream(self._process.stdout)
+
+    @staticmethod
+    async def _read_stream(stream: asyncio.StreamReader) -> AsyncIterator[bytes]:
+        while chunk := await stream.read(65536):
+            yield chunk
+
+    async def _read_pipe(self, pipe) -> AsyncIterator[bytes]:
+        while chunk := await _run_blocking(self.executor, pipe.read1, 65536):
+            yield chunk
+
+    async def _pump(self, chunks: AsyncIterator[bytes]) -> None:
+        async for chunk in chunks:
+            self.output.write(chunk)
+
+    async def _wait(self) -> int:
+        if isinstance(self._process, subprocess.Popen):
+            return await _run_blocking(self.executor, self._process.wait)
+        return await self._process.wait()
+
+    async def run(self) -> int:
+        """Runs the command to completion and returns its exit code."""
+        chunks = await self._start()
+        try:
+            await asyncio.wait_for(self._pump(chunks), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out = True
+            self.kill()
+        except asyncio.CancelledError:
+            self.kill()
+            raise
+        try:
+            if self.timed_out:
+                return await self._wait()
+            # the output can end long before the process does, e.g. when it closes stdout and keeps running
+            try:
+                return await asyncio.wait_for(
+                    self._wait(), timeout=max(self.timeout - self.elapsed, 0)
+                )
+            except asyncio.TimeoutError:
+                self.timed_out = True
+                self.kill()
+                return await self._wait()
+            except asyncio.CancelledError:
+                self.kill()
+                raise
+        finally:
+            self.ended_at = time.monotonic()
+
+    def kill(self) -> None:
+        """Kills the whole process group, including anything the shell started."""
+        if self._process is None or self.returncode is not None:
+            return
+        self.killed = True
+        if os.name == "nt":
+            subprocess.Popen(
+                ["taskkill", "/F", "/T", "/PID", str(self.pid)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            return
+        try:
+            os.killpg(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+async def run_exec(
+    *args: str, timeout: float = 60.0, executor: Optional[NamedExecutor] = None
+) -> tuple[int, str, str]:
+    """
+    Runs a program without a shell and waits for it without blocking the event loop.
+    ``executor`` runs the program on Windows, where the event loop can't watch subprocesses.
+
+    Returns:
+        tuple[int, str, str]: The exit code, stdout and stderr.
+
+    Raises:
+        asyncio.TimeoutError: If the program doesn't exit within ``timeout`` seconds.
+    """
+    pipes = {"stdout": subprocess.PIPE, "stderr": subprocess.PIPE}
+    try:
+        process = await asyncio.create_subprocess_exec(*args, **pipes)
+    except NotImplementedError:  # selector event loop on Windows
+        run = functools.partial(subprocess.run, args, timeout=timeout, **pipes)
+        result = await asyncio.wait_for(_run_blocking(executor, run), timeout)
+        stdout, stderr, returncode = result.stdout, result.stderr, result.returncode
+    else:
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            raise
+        returncode = process.returncode
+    return returncode, stdout.decode(errors="replace"), stderr.decode(errors="replace")
@@ -0,0 +1,97 @@
+import datetime
+import decimal
+import io
+import json
+from typing import Any
+
+# Sheet names are limited to 31 characters.
+MAX_SHEET_NAME = 31
+
+Table = tuple[list[str], list[tuple]]  # column names, rows
+
+
+def _cell(value: Any) -> Any:
+    """Converts a database value to something a worksheet cell can hold."""
+    if value is None or isinstance(value, (bool, int, float, decimal.Decimal, str)):
+        return value
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:  # cells can't hold time zones
+            value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return value
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value, default=str)
+    return str(value)
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+def build_xlsx(tables: dict[str, Table]) -> io.BytesIO:
+    """
+    Writes one worksheet per table, with the column names in the first row.
+    This is CPU-bound and meant to be run in a process pool.
+
+    Raises:
+        RuntimeError: If openpyxl isn't installed.
+    """
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise RuntimeError("openpyxl is required to export to Excel (pip install openpyxl).")
+
+    workbook = Workbook(write_only=True)
+    for name, (columns, rows) in tables.items():
+        sheet = workbook.create_sheet(name[:MAX_SHEET_NAME])
+        sheet.append(columns)
+        for row in rows:
+            sheet.append([_cell(value) for value in row])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def parse_xlsx(data: bytes) -> dict[str, str]:
+    """
+    Reads a workbook written by ``build_xlsx``. Each worksheet becomes a JSON array of row objects,
+    keyed by the column names in its first row, so the database can cast the values to its column
+    types (see ``json_populate_recordset``). Empty rows are skipped.
+    This is CPU-bound and meant to be run in a process pool.
+
+    Raises:
+        RuntimeError: If openpyxl isn't installed.
+        ValueError: If the file isn't a workbook.
+    """
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RuntimeError("openpyxl is required to import from Excel (pip install openpyxl).")
+
+    try:
+        workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    except Exception as e:  # openpyxl raises zipfile, KeyError and its own errors for bad files
+        raise ValueError(f"Not an Excel workbook: {e}") from e
+    tables = {}
+    try:
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if not header:
+                continue
+            columns = [str(column) for column in header if column is not None]
+            records = [
+                {column: _json_value(value) for column, value in zip(columns, row)}
+                for row in rows
+                if any(value is not None for value in row)
+            ]
+            tables[sheet.title] = json.dumps(records)
+    finally:
+        workbook.close()
+    return tables
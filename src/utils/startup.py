@@ -1,9 +1,19 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ..core.config import ApiConfig, RestProxyConfig
+
 import logging
 import os
 import sys
 from typing import Optional
 
 import yaml
+import yarl
+from discord.gateway import DiscordWebSocket
+from discord.http import INTERNAL_API_VERSION, Route
 from discord.utils import MISSING
 
 
@@ -119,6 +129,25 @@ def load_config(
             return {}
 
 
+def configure_api(config: ApiConfig, logger: logging.Logger, proxy: Optional[RestProxyConfig] = None) -> None:
+    """
+    Points discord.py at another REST API and gateway, e.g. the fake Discord in
+    ``benchmarks/fake_discord.py``. Must be called before the client logs in.
+
+    With the REST proxy enabled, REST requests go to the proxy instead, which forwards them to
+    ``api.base-url`` (or its own ``upstream``).
+    """
+    if proxy is not None and proxy.enabled:
+        Route.BASE = f"http://{proxy.host}:{proxy.port}/api/v{INTERNAL_API_VERSION}"
+        logger.warning(f"Sending REST requests through the proxy at {Route.BASE}")
+    elif config.base_url:
+        Route.BASE = f"{config.base_url.rstrip('/')}/api/v{INTERNAL_API_VERSION}"
+        logger.warning(f"Using the REST API at {Route.BASE}")
+    if config.gateway_url:
+        DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(config.gateway_url)
+        logger.warning(f"Using the gateway at {config.gateway_url}")
+
+
 def silence_loggers(logger_names: list[str]) -> None:
     for logger_name in logger_names:
         logging.getLogger(logger_name).setLevel(logging.CRITICAL)
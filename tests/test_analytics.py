@@ -0,0 +1,14 @@
+import asyncio
+
+from benchmarks.harness import BenchmarkClient
+
+
+def test_invocations_are_recorded_once_with_their_outcome():
+    async def main():
+        async with BenchmarkClient() as bench:
+            for content in ("!ping", "!ping", "!fail", "!add 1 x", "!nope"):
+                await bench.handle(bench.message(content))
+            return {name: (stats.calls, stats.errors) for name, stats in bench.client.analytics.totals.items()}
+
+    # the error handler runs after invoke returns and records nothing itself
+    assert asyncio.run(main()) == {"ping": (2, 0), "fail": (1, 1), "add": (1, 1)}
@@ -0,0 +1,35 @@
+import asyncio
+import json
+import os
+
+from src.utils.assets import AssetCache
+
+
+def test_concurrent_puts_of_the_same_bytes_share_one_write(tmp_path):
+    async def main():
+        cache = AssetCache(str(tmp_path))
+        data = b"emoji" * 1000
+        urls = [f"https://cdn.example/{i}.png" for i in range(20)]
+        digests = await asyncio.gather(*(cache.put(url, data) for url in urls))
+        await cache.flush()
+        assert len(set(digests)) == 1
+        for url in urls:
+            assert await cache.get(url) == data
+        return digests[0]
+
+    digest = asyncio.run(main())
+    blob_directory = tmp_path / digest[:2]
+    assert os.listdir(blob_directory) == [digest]  # no temporary files left behind
+    with open(tmp_path / "index.json", encoding="utf-8") as f:
+        assert len(json.load(f)) == 20
+
+
+def test_concurrent_variant_writes_dont_fail(tmp_path):
+    async def main():
+        cache = AssetCache(str(tmp_path))
+        digest = await cache.put("https://cdn.example/a.png", b"a")
+        await asyncio.gather(*(cache.put_variant(digest, "fit", b"small") for _ in range(10)))
+        assert await cache.get_variant(digest, "fit") == b"small"
+        await cache.flush()
+
+    asyncio.run(main())
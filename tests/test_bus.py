@@ -0,0 +1,168 @@
+import asyncio
+import base64
+import os
+import time
+import types
+
+import pytest
+
+from src.core.bus import REQUEST, RESPONSE, Bus, Frame, PostgresTransport, UnixTransport, pack, unpack
+
+
+async def _join(path: str, node: str) -> Bus:
+    bus = Bus(None)
+    bus.node = node
+    bus.transport = UnixTransport(bus, path)
+    await bus.transport.start()
+    return bus
+
+
+def test_requests_get_a_reply_per_handler_and_a_response_per_process(tmp_path):
+    async def fail_slowly(data, sender):
+        await asyncio.sleep(0.2)  # answers after second's two replies, which alone match the ACK's count of 2
+        return 1 / 0
+
+    async def main():
+        path = str(tmp_path / "bus.sock")
+        first = await _join(path, "first")
+        second = await _join(path, "second")
+        third = await _join(path, "third")
+        try:
+            second.subscribe("count", lambda data, sender: 1)
+            second.subscribe("count", lambda data, sender: 2)
+            third.subscribe("count", fail_slowly)
+            await asyncio.sleep(0.1)  # let the subscriptions reach the broker
+
+            started = time.monotonic()
+            replies = await first.request("count", timeout=5)
+            assert time.monotonic() - started < 1  # didn't wait for the timeout
+            assert sorted((r.node, r.value, r.error) for r in replies) == [
+                ("second", 1, None),
+                ("second", 2, None),
+                ("third", None, "ZeroDivisionError: division by zero"),
+            ]
+        finally:
+            for bus in (third, second, first):
+                await bus.close()
+
+    asyncio.run(main())
+
+
+def test_the_socket_is_private(tmp_path):
+    async def main():
+        path = str(tmp_path / "bus" / "bus.sock")
+        bus = await _join(path, "first")
+        try:
+            assert os.stat(os.path.dirname(path)).st_mode & 0o777 == 0o700
+            assert os.stat(path).st_mode & 0o777 == 0o600
+        finally:
+            await bus.close()
+
+    asyncio.run(main())
+
+
+def test_a_shared_directory_is_refused(tmp_path):
+    os.chmod(tmp_path, 0o755)
+    transport = UnixTransport(Bus(None), str(tmp_path / "bus.sock"))
+    with pytest.raises(RuntimeError, match="chmod 700"):
+        asyncio.run(transport.start())
+
+
+class FakeConnection:
+    """Stands in for an asyncpg connection. Like one, it can only run one query at a time."""
+
+    def __init__(self):
+        self.notified: list[str] = []
+        self.closed = False
+        self._busy = False
+        self._on_terminate = []
+
+    async def add_listener(self, channel, callback):
+        pass
+
+    def add_termination_listener(self, callback):
+        self._on_terminate.append(callback)
+
+    async def execute(self, query, *args, timeout=None):
+        assert not self._busy, "another operation is in progress"
+        self._busy = True
+        await asyncio.sleep(0.001)
+        self._busy = False
+        if self.closed:
+            raise ConnectionResetError("the connection was closed")
+        if args:
+            self.notified.append(args[1])
+
+    def is_closed(self):
+        return self.closed
+
+    def terminate(self):
+        self.closed = True
+
+    def drop(self):
+        self.closed = True
+        for callback in self._on_terminate:
+            callback(self)
+
+
+async def _postgres_bus(connections: list[FakeConnection]) -> Bus:
+    bot = types.SimpleNamespace(config=types.SimpleNamespace(database=object()))
+    bus = Bus(bot)
+    bus.transport = PostgresTransport(bus, "bot_bus")
+    connections_left = iter(connections)
+
+    async def connect():
+        return next(connections_left)
+
+    bus.transport._connect = connect
+    await bus.transport.start()
+    return bus
+
+
+def _sent_frames(connection: FakeConnection) -> list[Frame]:
+    return [Frame.decode(base64.b64decode(payload)[4:]) for payload in connection.notified]
+
+
+def test_postgres_sends_are_serialized_and_survive_a_lost_connection():
+    async def main():
+        first, second = FakeConnection(), FakeConnection()
+        bus = await _postgres_bus([first, second])
+        try:
+            for i in range(5):
+                await bus.publish("topic", i, local=False)
+            await asyncio.wait(bus.transport._sends)
+            assert [unpack(frame.payload) for frame in _sent_frames(first)] == [0, 1, 2, 3, 4]
+
+            first.drop()
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                if bus.transport.connected:
+                    break
+            assert bus.transport.connected and bus.transport._connection is second
+            await bus.publish("topic", "again", local=False)
+        finally:
+            await bus.close()
+        assert [unpack(frame.payload) for frame in _sent_frames(second)] == ["again"]
+
+    asyncio.run(main())
+
+
+def test_oversized_responses_become_error_replies():
+    async def main():
+        connection = FakeConnection()
+        bus = await _postgres_bus([connection])
+        bus.subscribe("big", lambda data, sender: "x" * 10_000)
+        try:
+            bus.dispatch(Frame(REQUEST, "other", "big", 7, payload=pack(None)))
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                if connection.notified:
+                    break
+        finally:
+            await bus.close()
+        (frame,) = _sent_frames(connection)
+        ((value, error),) = unpack(frame.payload)
+        assert frame.kind == RESPONSE and frame.topic == "other" and value is None
+        assert error.startswith("The response is too large to send")
+
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from src.core.database import CircuitBreaker, Database, DatabaseNode, DatabaseTimeout, DatabaseUnavailable
+
+
+class FakePool:
+    def __init__(self, delay: float = 0.0):
+        self.delay: float = delay
+
+    async def execute(self, query, *args, **kwargs):
+        await asyncio.sleep(self.delay)
+        return "OK"
+
+    async def fetchval(self, query, *args, **kwargs):
+        await asyncio.sleep(self.delay)
+        return 1
+
+
+def _database(replicas: int = 1) -> Database:
+    db = Database(None)
+    db._span = lambda *args: _NullSpan()
+    db.pool = FakePool()
+    db.primary = DatabaseNode("primary", db.pool)
+    db.replicas = [DatabaseNode(f"replica-{i}", FakePool()) for i in range(replicas)]
+    return db
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_a_write_pins_the_rest_of_its_command_only():
+    async def main():
+        db = _database()
+
+        async def command():
+            with Database.command_scope(None):
+                await db.fetchval("SELECT 1")
+                await db.execute("UPDATE t SET x = 1")
+                await db.fetchval("SELECT x FROM t")
+
+        await command()
+        # a long-lived task, like a loop, writing outside of a command isn't pinned for good
+        await db.execute("UPDATE t SET x = 2")
+        await db.fetchval("SELECT x FROM t")
+        await command()
+        return db.primary.served, db.replicas[0].served
+
+    # primary: 2 commands x (1 write + 1 read) + the loop's write, replica: 2 commands x 1 read + the loop's read
+    assert asyncio.run(main()) == (5, 3)
+
+
+def test_pin_primary_pins_background_reads():
+    async def main():
+        db = _database()
+        with Database.pin_primary():
+            await db.fetchval("SELECT 1")
+        await db.fetchval("SELECT 1")
+        return db.primary.served, db.replicas[0].served
+
+    assert asyncio.run(main()) == (1, 1)
+
+
+def test_timeouts_cut_short_by_a_deadline_dont_trip_the_breaker():
+    async def main():
+        db = _database(replicas=0)
+        db.pool.delay = db.primary.pool.delay = 0.05
+        db.call_timeout = 1.0
+        db.primary.breaker = CircuitBreaker(min_calls=2, failure_rate=0.5)
+        for _ in range(3):
+            with Database.deadline(0.01), pytest.raises(DatabaseTimeout):
+                await db.fetchval("SELECT 1")
+        assert db.primary.breaker.state == "closed"
+
+        db.call_timeout = 0.01  # the node's own timeout does count
+        for _ in range(2):
+            with pytest.raises(DatabaseTimeout):
+                await db.fetchval("SELECT 1")
+        assert db.primary.breaker.state == "open"
+
+    asyncio.run(main())
+
+
+def test_only_probes_free_a_half_open_slot():
+    breaker = CircuitBreaker(min_calls=1, failure_rate=0.5, open_for=0.0, probes=1)
+    slow = breaker.before_call("primary")  # started while closed
+    breaker.before_call("primary")
+    breaker.record(True)  # opens
+    probe = breaker.before_call("primary")
+    assert breaker.state == "half-open" and probe is not None and slow is None
+
+    breaker.record(False, slow)
+    with pytest.raises(DatabaseUnavailable):  # the probe is still in flight
+        breaker.before_call("primary")
+    breaker.record(False, probe)
+    assert breaker.state == "closed"
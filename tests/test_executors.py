@@ -0,0 +1,67 @@
+import asyncio
+import concurrent.futures
+import gzip
+import threading
+import types
+
+import pytest
+
+from src.core.executors import ExecutorBusy, Executors, NamedExecutor
+from src.core.recorder import GatewayRecorder
+
+
+def test_cancelled_calls_dont_count_as_completed():
+    async def main():
+        executor = NamedExecutor("io", "thread", max_workers=1, max_queue=0)
+        assert await executor.run(sum, [1, 2]) == 3
+
+        # a call the pool cancelled on shutdown before a worker picked it up
+        await executor._slots.acquire()
+        executor._running += 1
+        future = concurrent.futures.Future()
+        future.cancel()
+        executor._finished(future, 0.0)
+        return executor
+
+    executor = asyncio.run(main())
+    stats = executor.stats
+    assert (stats.completed, stats.cancelled, stats.failed) == (1, 1, 0)
+    assert stats.avg_run < 1  # the cancelled call's "run time" since 0.0 isn't included
+    assert executor.running == 0
+    executor.shutdown()
+
+
+def test_recorder_writes_on_the_io_executor_and_keeps_lines_when_it_is_busy(tmp_path):
+    path = tmp_path / "recording.jsonl.gz"
+    threads = []
+
+    async def main():
+        bot = types.SimpleNamespace(executors=Executors())
+        bot.executors.io = NamedExecutor("io", "thread", max_workers=1, max_queue=0)
+        recorder = GatewayRecorder(bot, path=str(path), anonymize=False)
+        write = recorder._write
+        recorder._write = lambda lines: threads.append(threading.current_thread().name) or write(lines)
+
+        release = threading.Event()
+        blocker = asyncio.create_task(bot.executors.io.run(release.wait))
+        await asyncio.sleep(0.05)
+        recorder._buffer = [b"{}", b"[1]"]
+        try:
+            with pytest.raises(ExecutorBusy):
+                await recorder.flush()
+            assert recorder._buffer == [b"{}", b"[1]"]
+            await recorder._scheduled_flush()  # a busy executor is retried on the next flush, not logged
+        finally:
+            release.set()
+            await blocker
+
+        recorder._buffer.append(b"[2]")
+        await recorder.flush()
+        bot.executors.shutdown()
+        return recorder
+
+    recorder = asyncio.run(main())
+    assert recorder._buffer == []
+    assert threads == ["executor-io_0"]
+    with gzip.open(path) as f:
+        assert f.read() == b"{}\n[1]\n[2]\n"
@@ -0,0 +1,81 @@
+import asyncio
+import datetime
+import time
+from typing import Optional
+
+import discord
+import pytest
+from discord import app_commands
+
+from benchmarks.harness import CHANNEL_ID, FIRST_USER_ID, GUILD_ID, BenchmarkClient, _member_payload
+
+
+def _interaction(client, name: str, created_at: float) -> discord.Interaction:
+    snowflake = discord.utils.time_snowflake(datetime.datetime.fromtimestamp(created_at, datetime.timezone.utc))
+    payload = {
+        "id": snowflake,
+        "application_id": 1,
+        "type": 2,
+        "data": {"id": 1, "name": name, "type": 1, "options": []},
+        "guild_id": GUILD_ID,
+        "channel_id": CHANNEL_ID,
+        "member": {**_member_payload(FIRST_USER_ID), "permissions": "0"},
+        "token": "token",
+        "version": 1,
+        "locale": "en-US",
+        "attachment_size_limit": 10 * 1024 * 1024,
+    }
+    # noinspection PyProtectedMember
+    return discord.Interaction(data=payload, state=client._connection)
+
+
+@pytest.fixture
+def sent(monkeypatch) -> list[tuple[str, bool, float]]:
+    """Records the defers and followups sent to Discord, with when they were sent, instead of sending them."""
+    sent = []
+
+    async def defer(self, *, ephemeral: bool = False, thinking: bool = False):
+        self._response_type = discord.InteractionResponseType.deferred_channel_message
+        sent.append(("defer", ephemeral, time.perf_counter()))
+
+    async def send(self, content=None, **kwargs):
+        sent.append(("followup", kwargs.get("ephemeral", False), time.perf_counter()))
+
+    monkeypatch.setattr(discord.InteractionResponse, "defer", defer)
+    monkeypatch.setattr(discord.Webhook, "send", send)
+    return sent
+
+
+def _call(extras: dict, *, ephemeral_reply: bool, age: float = 0.0):
+    """Runs a slow app command through the guarded tree, and returns its stats and when it started."""
+
+    async def main():
+        async with BenchmarkClient() as bench:
+            client = bench.client
+            client.interactions.defer_after = 0.1
+
+            @app_commands.command(name="slow", description="Slow.", extras=extras)
+            async def slow(interaction: discord.Interaction):
+                await asyncio.sleep(0.15)
+                await interaction.response.send_message("done", ephemeral=ephemeral_reply)
+
+            client.tree.add_command(slow)
+            started = time.perf_counter()
+            # noinspection PyProtectedMember
+            await client.tree._call(_interaction(client, "slow", time.time() - age))
+            return client.interactions.stats["/slow"], started
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("extras, defer_ephemeral, exposed", [({"defer_ephemeral": True}, True, 0), ({}, False, 1)])
+def test_defer_visibility_is_per_command(sent, extras: dict, defer_ephemeral: bool, exposed: int):
+    stats, _ = _call(extras, ephemeral_reply=True)
+    assert [(kind, ephemeral) for kind, ephemeral, _ in sent] == [("defer", defer_ephemeral), ("followup", True)]
+    assert (stats.deferred, stats.rerouted, stats.exposed) == (1, 1, exposed)
+
+
+def test_the_defer_deadline_runs_from_the_interactions_creation(sent):
+    _, started = _call({}, ephemeral_reply=False, age=0.08)
+    deferred_at = next(at for kind, _, at in sent if kind == "defer")
+    assert deferred_at - started < 0.06  # not the full defer_after of 0.1
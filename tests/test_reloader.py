@@ -0,0 +1,55 @@
+import os
+import sys
+import types
+
+import pytest
+
+import src.cogs.dev  # noqa: F401
+import src.core.client  # noqa: F401
+import src.core.database  # noqa: F401
+import src.handlers.error  # noqa: F401
+from src.utils.reloader import build_import_graph, plan_reload
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXTENSIONS = ["src.cogs.dev", "src.core.database", "src.handlers.error"]
+
+
+@pytest.mark.parametrize(
+    "path, module",
+    [
+        # MyClient keeps its ViewManager instance
+        ("src/core/view_manager.py", "src.core.view_manager"),
+        # the client's Executors would keep raising the old ExecutorBusy the error handler no longer catches
+        ("src/core/executors.py", "src.core.executors"),
+        # src.core.analytics imports it, and the client holds the analytics
+        ("src/core/database.py", "src.core.database"),
+    ],
+)
+def test_modules_the_client_imports_need_a_restart(path: str, module: str):
+    plan = plan_reload([path], EXTENSIONS, root=ROOT)
+    assert plan.restart_required == [module]
+    assert plan.is_empty
+    assert "src.core.analytics" not in plan.modules
+
+
+def test_modules_only_extensions_import_are_reloaded():
+    plan = plan_reload(["src/utils/logs.py"], EXTENSIONS, root=ROOT)
+    assert plan.restart_required == []
+    assert "src.utils.logs" in plan.modules
+    assert plan.extensions == ["src.cogs.dev", "src.handlers.error"]
+
+
+def test_installed_packages_inside_the_repository_are_skipped(monkeypatch):
+    site_packages = os.path.join(ROOT, "venv", "lib", "python3.11", "site-packages")
+    for name, filename in [
+        ("aiohttp_fake", os.path.join(site_packages, "aiohttp_fake.py")),
+        ("src.vendored", os.path.join(ROOT, "src", "venv", "lib", "site-packages", "vendored.py")),
+    ]:
+        module = types.ModuleType(name)
+        module.__file__ = filename
+        monkeypatch.setitem(sys.modules, name, module)
+
+    graph = build_import_graph(ROOT)
+    assert "src.core.client" in graph
+    assert not any(name.partition(".")[0] != "src" for name in graph)
+    assert "src.vendored" not in graph
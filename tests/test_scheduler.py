@@ -0,0 +1,107 @@
+import asyncio
+import datetime
+import time
+
+import pytest
+
+from src.core.scheduler import Cron, Every, JobScheduler, Once
+
+
+def _ts(*args: int) -> float:
+    return datetime.datetime(*args, tzinfo=datetime.timezone.utc).timestamp()
+
+
+def test_cron_next():
+    assert Cron("*/15 * * * *").next(_ts(2024, 1, 1, 10, 7)) == _ts(2024, 1, 1, 10, 15)
+    # the current minute never matches again
+    assert Cron("15 10 * * *").next(_ts(2024, 1, 1, 10, 15)) == _ts(2024, 1, 2, 10, 15)
+    assert Cron("@monthly").next(_ts(2024, 1, 31, 23, 59)) == _ts(2024, 2, 1)
+    assert Cron("0 0 29 2 *").next(_ts(2024, 3, 1)) == _ts(2028, 2, 29)
+    assert Cron("0 0 30 2 *").next(_ts(2024, 1, 1)) is None
+    # with both days restricted, either one matches: the 13th or a Friday (2024-01-05)
+    assert Cron("0 0 13 * 5").next(_ts(2024, 1, 1)) == _ts(2024, 1, 5)
+    # Sunday is 0 or 7
+    assert Cron("0 0 * * 7").next(_ts(2024, 1, 1)) == Cron("0 0 * * 0").next(_ts(2024, 1, 1)) == _ts(2024, 1, 7)
+
+
+def test_cron_time_zone():
+    tz = datetime.timezone(datetime.timedelta(hours=2))
+    assert Cron("0 9 * * *", tz).next(_ts(2024, 1, 1)) == _ts(2024, 1, 1, 7)
+
+
+@pytest.mark.parametrize("expression", ["* * * *", "60 * * * *", "* * 0 * *", "*/0 * * * *", "a * * * *"])
+def test_invalid_cron_expressions(expression: str):
+    with pytest.raises(ValueError):
+        Cron(expression)
+
+
+def test_every_advance():
+    assert Every(10).advance(100, 105) == (110, 0)
+    assert Every(10).advance(100, 135) == (140, 3)
+    assert Every(10).advance(100, 140) == (150, 4)
+
+
+def test_generic_advance():
+    assert Cron("0 * * * *").advance(_ts(2024, 1, 1, 0), _ts(2024, 1, 1, 3, 30)) == (_ts(2024, 1, 1, 4), 3)
+    assert Once(100).advance(100, 200) == (None, 0)
+
+
+async def _blocked_job(scheduler: JobScheduler, overlap: str):
+    release = asyncio.Event()
+    started = []
+
+    async def work():
+        started.append(time.time())
+        await release.wait()
+
+    job = scheduler.schedule("job", work, Once(time.time() + 3600), overlap=overlap)
+    return job, release, started
+
+
+@pytest.mark.parametrize(
+    "overlap, running, queued, skipped, cancelled, runs",
+    [("skip", 1, 0, 1, 0, 1), ("queue", 1, 1, 0, 0, 2), ("replace", 1, 0, 0, 1, 2)],
+)
+def test_overlap_policies(overlap: str, running: int, queued: int, skipped: int, cancelled: int, runs: int):
+    async def main():
+        scheduler = JobScheduler(None)
+        job, release, started = await _blocked_job(scheduler, overlap)
+        scheduler._start(job, time.time())
+        await asyncio.sleep(0)
+        scheduler._start(job, time.time())
+        await asyncio.sleep(0.01)
+        assert (job.running, job.queued, job.metrics.skipped) == (running, queued, skipped)
+
+        release.set()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        assert (job.running, job.metrics.cancelled, len(started)) == (0, cancelled, runs)
+
+    asyncio.run(main())
+
+
+def test_catch_up_all_runs_missed_occurrences_back_to_back():
+    async def main():
+        scheduler = JobScheduler(None)
+        concurrent = peak = 0
+
+        async def work():
+            nonlocal concurrent, peak
+            concurrent += 1
+            peak = max(peak, concurrent)
+            await asyncio.sleep(0.005)
+            concurrent -= 1
+
+        # the defaults: one run at a time, and overlapping runs are skipped
+        job = scheduler.every("job", work, 0.2, first_delay=0.05, catch_up="all", max_catch_up=3)
+        scheduler.start()
+        time.sleep(0.9)  # the loop stalls, missing the occurrences at 0.05, 0.25, 0.45, 0.65 and 0.85
+        await asyncio.sleep(0.1)
+        await scheduler.close()
+        return job.metrics, peak
+
+    metrics, peak = asyncio.run(main())
+    assert (metrics.runs, metrics.missed, metrics.skipped) == (4, 1, 0)
+    assert peak == 1
+    # each catch-up run is timed from its own occurrence
+    assert metrics.max_lag > metrics.last_lag